@@ -0,0 +1,24 @@
+"""Просмотр архивных объявлений и журнала модерации (для администраторов).
+
+Доступ - с тем же X-Bulk-Token, что и выгрузка таблиц.
+"""
+from flask import jsonify
+
+from app.api.bulk import bulk_token_required
+from app.api.routes import api_bp
+from app.archive import archive_store
+
+
+@api_bp.route('/archive/listings/<int:listing_id>')
+@bulk_token_required
+def archived_listing(listing_id):
+    """Объявление из рабочей таблицы или архива с полной историей модерации"""
+    row, archived = archive_store.find_listing(listing_id)
+    if row is None:
+        return jsonify({'success': False, 'error': 'Объявление не найдено'}), 404
+    return jsonify({
+        'success': True,
+        'archived': archived,
+        'listing': dict(row._mapping),
+        'moderation_logs': [dict(log._mapping) for log in archive_store.listing_logs(listing_id)],
+    })
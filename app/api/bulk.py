@@ -0,0 +1,73 @@
+"""Потоковый экспорт и пакетный импорт таблиц через API.
+
+Доступ только с заголовком X-Bulk-Token, равным BULK_API_TOKEN; если
+токен не задан, эндпоинты выключены.
+"""
+import hmac
+import io
+from functools import wraps
+
+from flask import Response, current_app, jsonify, request, stream_with_context
+
+from app.api.routes import api_bp
+from app.bulk import CONTENT_TYPES, BulkError, BulkImporter, export_rows, read_records
+
+
+def bulk_token_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config.get('BULK_API_TOKEN')
+        provided = request.headers.get('X-Bulk-Token', '')
+        # Байты: compare_digest на str с не-ASCII падает с TypeError
+        if not token or not hmac.compare_digest(provided.encode('utf-8'), token.encode('utf-8')):
+            return jsonify({'success': False, 'error': 'Доступ запрещен'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@api_bp.route('/export/<table>')
+@bulk_token_required
+def export_table(table):
+    """Выгрузка таблицы: ?format=ndjson|csv"""
+    fmt = request.args.get('format', 'ndjson')
+    try:
+        chunks = export_rows(table, fmt)
+        # Проверка таблицы и формата - до начала ответа
+        first = next(chunks, '')
+    except BulkError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    def generate():
+        yield first
+        yield from chunks
+
+    extension = 'csv' if fmt == 'csv' else 'ndjson'
+    return Response(
+        stream_with_context(generate()),
+        content_type=CONTENT_TYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename={table}.{extension}'}
+    )
+
+
+@api_bp.route('/import/<table>', methods=['POST'])
+@bulk_token_required
+def import_table(table):
+    """Загрузка строк из тела запроса: ?format=ndjson|csv&moderate=0&keep_ids=1"""
+    fmt = request.args.get('format', 'ndjson')
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    try:
+        importer = BulkImporter(
+            table,
+            keep_ids=request.args.get('keep_ids') == '1',
+            moderate=request.args.get('moderate', '1') != '0'
+        )
+    except BulkError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    try:
+        report = importer.run(read_records(stream, fmt))
+    except BulkError as e:
+        # Уже записанные порции остаются - сообщаем, сколько успели
+        return jsonify({'success': False, 'error': str(e), 'imported': importer.imported}), 400
+
+    return jsonify({'success': True, **report._asdict()})
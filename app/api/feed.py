@@ -0,0 +1,102 @@
+"""JSON-ленты объявлений с курсорной пагинацией для Telegram web app"""
+from flask import request, jsonify
+
+from app.api.routes import api_bp
+from app.counters import listing_counters
+from app.models.listing import Listing
+from app.pagination import (
+    feed_query, paginate_feed, parse_per_page, parse_price_filter, parse_sort,
+    InvalidCursor, Page
+)
+from app.ranking import ranking_index
+from app.search import search_engine
+
+LISTING_FIELDS = (
+    'id', 'listing_type', 'author', 'contact', 'item_type', 'genre',
+    'preview_url', 'description', 'price', 'price_usd', 'license',
+    'includes', 'delivery_time', 'tags', 'views', 'contacts_clicked',
+)
+
+
+def serialize_listing(listing):
+    """Объявление в виде словаря для JSON"""
+    data = {field: getattr(listing, field, None) for field in LISTING_FIELDS}
+    created_at = getattr(listing, 'created_at', None)
+    data['created_at'] = created_at.isoformat() if created_at else None
+    return data
+
+
+def _page_response(page):
+    listing_counters.apply_pending(page.items)
+    return jsonify({
+        'success': True,
+        'listings': [serialize_listing(listing) for listing in page.items],
+        'next_cursor': page.next_cursor
+    })
+
+
+@api_bp.route('/feed')
+def feed():
+    """Лента объявлений: ?type=&genre=&item_type=&min_price=&max_price=&sort=&cursor=&limit="""
+    query = feed_query(
+        listing_type=request.args.get('type'),
+        genre=request.args.get('genre'),
+        item_type=request.args.get('item_type'),
+        min_price=parse_price_filter(request.args.get('min_price')),
+        max_price=parse_price_filter(request.args.get('max_price'))
+    )
+    try:
+        page = paginate_feed(
+            query,
+            cursor=request.args.get('cursor'),
+            per_page=parse_per_page(request.args.get('limit')),
+            sort=parse_sort(request.args.get('sort'))
+        )
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    return _page_response(page)
+
+
+@api_bp.route('/feed/search')
+def feed_search():
+    """Полнотекстовый поиск: ?query=&listing_type=&genre=&item_type=&min_price=&max_price=&sort=&cursor=&limit="""
+    query_text = request.args.get('query', '').strip()
+    if not query_text:
+        return jsonify({'success': False, 'error': 'Пустой поисковый запрос'}), 400
+
+    try:
+        page = search_engine.search(
+            query_text,
+            listing_type=request.args.get('listing_type'),
+            genre=request.args.get('genre'),
+            item_type=request.args.get('item_type'),
+            limit=parse_per_page(request.args.get('limit')),
+            cursor=request.args.get('cursor'),
+            min_price=parse_price_filter(request.args.get('min_price')),
+            max_price=parse_price_filter(request.args.get('max_price')),
+            sort=request.args.get('sort', 'relevance')
+        )
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    return _page_response(page)
+
+
+@api_bp.route('/feed/trending')
+def feed_trending():
+    """Популярные сейчас объявления: ?type=&genre=&limit="""
+    listings = ranking_index.trending(
+        limit=parse_per_page(request.args.get('limit')),
+        listing_type=request.args.get('type'),
+        genre=request.args.get('genre')
+    )
+    return _page_response(Page(listings, None))
+
+
+@api_bp.route('/listings/<int:listing_id>/similar')
+def similar_listings(listing_id):
+    """Похожие объявления по жанру и тегам: ?limit="""
+    listing = Listing.query.filter_by(id=listing_id, is_active=True).first_or_404()
+    limit = min(parse_per_page(request.args.get('limit'), default=6), 20)
+    return _page_response(Page(ranking_index.similar(listing, limit=limit), None))
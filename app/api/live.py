@@ -0,0 +1,116 @@
+"""Живая лента для Telegram web app: SSE и long-poll вместо перезагрузки index()"""
+import json
+import time
+
+from flask import Response, jsonify, request
+
+from app.api.routes import api_bp
+from app.live_feed import live_feed
+
+# Клиент EventSource переподключается через 3 секунды с Last-Event-ID
+SSE_RETRY_MS = 3000
+BUSY_MESSAGE = 'Слишком много подключений, попробуйте позже'
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    # Прокси не должен буферизовать поток
+    'X-Accel-Buffering': 'no',
+}
+
+
+def parse_event_id(value):
+    """Номер события из Last-Event-ID / ?after= (None, если не число)"""
+    try:
+        return int(value) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+
+def sse_batch(subscriber, items):
+    """Текст SSE для пачки событий подписчика; пинг, если событий нет"""
+    chunks = []
+    if subscriber.lagged:
+        subscriber.lagged = False
+        chunks.append("event: reset\ndata: {}\n\n")
+    if not items:
+        chunks.append(": ping\n\n")
+    for item in items:
+        data = json.dumps(item['listing'], ensure_ascii=False)
+        chunks.append(f"id: {item['id']}\nevent: listing\ndata: {data}\n\n")
+    return ''.join(chunks)
+
+
+def _busy():
+    response = jsonify({'success': False, 'error': BUSY_MESSAGE})
+    return response, 503, {'Retry-After': '5'}
+
+
+@api_bp.route('/feed/live')
+def feed_live():
+    """SSE-поток новых объявлений: ?type=&genre=, продолжение по Last-Event-ID
+
+    Поток воркера занят, пока открыто соединение, поэтому здесь оно
+    закрывается после первой пачки событий или через
+    LIVE_FEED_POLL_SECONDS. Долгие потоки - в ASGI-режиме (app.asgi).
+    """
+    subscriber = live_feed.subscribe(
+        listing_type=request.args.get('type'),
+        genre=request.args.get('genre'),
+        last_id=parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    )
+    if subscriber is None:
+        return _busy()
+
+    heartbeat = live_feed.heartbeat
+    deadline = time.monotonic() + min(live_feed.poll_seconds, live_feed.max_stream_seconds)
+
+    def stream():
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            # Клиент переподключится и продолжит с Last-Event-ID
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                items = subscriber.wait(min(heartbeat, remaining))
+                yield sse_batch(subscriber, items)
+                if items:
+                    break
+        finally:
+            live_feed.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+
+@api_bp.route('/feed/updates')
+def feed_updates():
+    """Long-poll для клиентов без EventSource: ?after=&type=&genre=&timeout="""
+    after = parse_event_id(request.args.get('after'))
+    try:
+        timeout = min(max(float(request.args.get('timeout', live_feed.poll_seconds)), 0),
+                      live_feed.poll_seconds)
+    except ValueError:
+        timeout = live_feed.poll_seconds
+
+    # События после этого номера попадут в буфер подписчика
+    current = live_feed.last_id()
+    subscriber = live_feed.subscribe(
+        listing_type=request.args.get('type'),
+        genre=request.args.get('genre'),
+        last_id=after
+    )
+    if subscriber is None:
+        return _busy()
+    try:
+        items = subscriber.wait(timeout)
+        lagged = subscriber.lagged
+    finally:
+        live_feed.unsubscribe(subscriber)
+
+    last_id = max([item['id'] for item in items] + [current])
+    return jsonify({
+        'success': True,
+        'listings': [item['listing'] for item in items],
+        'last_id': last_id,
+        # Часть событий потеряна - клиенту стоит перечитать /api/feed
+        'reset': lagged
+    })
@@ -0,0 +1,25 @@
+"""JSON-снимок статистики платформы для фронтенда"""
+from flask import jsonify
+
+from app.api.routes import api_bp
+from app.metrics import instrumentation
+from app.stats import platform_stats
+
+
+@api_bp.route('/stats/snapshot')
+def stats_snapshot():
+    """Тот же снимок, что и на странице /stats"""
+    from app.moderation import content_moderator
+
+    snapshot = platform_stats.snapshot(
+        instrumentation.timed('moderation.stats')(content_moderator.get_moderation_stats)
+    )
+    return jsonify({
+        'success': True,
+        'listings': snapshot['listings'],
+        'genres': [
+            {'genre': genre, 'count': count}
+            for genre, count in snapshot['genres']
+        ],
+        'moderation': snapshot['moderation']
+    })
@@ -0,0 +1,12 @@
+"""Профиль текущего пользователя Telegram Web App"""
+from flask import g, jsonify
+
+from app.api.routes import api_bp
+from app.init_data import telegram_user_required
+
+
+@api_bp.route('/me')
+@telegram_user_required
+def me():
+    """Проверенный пользователь из initData"""
+    return jsonify({'success': True, 'user': g.telegram_user})
@@ -0,0 +1,373 @@
+"""Архив старых данных: неактивные объявления и moderation_logs.
+
+moderation_logs растет на каждое объявление, а выключенные объявления
+(is_active=False) остаются в рабочей таблице listings и попадают в
+агрегаты статистики. Архиватор переносит пачками, каждая пачка - своя
+транзакция:
+
+* объявления, неактивные дольше ARCHIVE_LISTINGS_AFTER_DAYS, вместе с их
+  записями модерации - в listings_archive / moderation_logs_archive;
+* записи модерации старше ARCHIVE_LOGS_AFTER_DAYS - в moderation_logs_archive.
+
+Архивные таблицы повторяют колонки рабочих, но первичный ключ у них
+свой (archive_id), а id исходной строки хранится в source_id: без
+AUTOINCREMENT SQLite может выдать id заархивированной строки новому
+объявлению, и архив должен принять обе. По умолчанию они лежат в той же базе; на SQLite ARCHIVE_DATABASE_PATH
+выносит их в отдельный файл, который подключается к каждому соединению
+через ATTACH, - горячая база и ее страничный кэш остаются маленькими.
+
+После переноса освобожденные страницы возвращаются файловой системе
+через PRAGMA incremental_vacuum (новые базы создаются с
+auto_vacuum=INCREMENTAL, старые переводятся командой
+`flask db-vacuum --enable-incremental`).
+
+Запуск - `flask archive-run` или фоновая задача archive_stale: она
+обрабатывает ограниченное число пачек и ставит себя снова - сразу, пока
+есть что переносить, затем через ARCHIVE_INTERVAL_HOURS. Первую задачу
+ставит `flask init-db` (ARCHIVE_INTERVAL_HOURS=0 - только вручную).
+"""
+import logging
+import sqlite3
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.jobs import job_queue, jobs_table, PENDING, RUNNING
+from app.models.listing import db
+from app.page_cache import page_cache
+from app.search import search_engine
+from app.similarity import similarity_index
+from app.stats import platform_stats
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SCHEMA = 'archive'
+ARCHIVED_TABLES = ('listings', 'moderation_logs')
+
+ArchiveReport = namedtuple('ArchiveReport', ['listings', 'logs', 'remaining', 'freed_pages'])
+
+
+class ArchiveError(RuntimeError):
+    """Перенос пачки не сошелся - транзакция откатывается"""
+
+
+class ArchiveStore:
+    """Перенос старых строк в архивные таблицы и чтение из них"""
+
+    def __init__(self):
+        self.listings_after = timedelta(days=30)
+        self.logs_after = timedelta(days=90)
+        self.batch_size = 500
+        self.batches_per_job = 20
+        self.vacuum_pages = 2000
+        self.interval = timedelta(hours=24)
+        self.database_path = None
+        self._tables = None
+        self._listener_registered = False
+
+    def init_app(self, app):
+        """Сроки хранения и подключение файла архива - до первого соединения"""
+        self.listings_after = timedelta(days=app.config.get('ARCHIVE_LISTINGS_AFTER_DAYS', 30))
+        self.logs_after = timedelta(days=app.config.get('ARCHIVE_LOGS_AFTER_DAYS', 90))
+        self.batch_size = app.config.get('ARCHIVE_BATCH_SIZE', self.batch_size)
+        self.batches_per_job = app.config.get('ARCHIVE_BATCHES_PER_JOB', self.batches_per_job)
+        self.vacuum_pages = app.config.get('ARCHIVE_VACUUM_PAGES', self.vacuum_pages)
+        self.interval = timedelta(hours=app.config.get('ARCHIVE_INTERVAL_HOURS', 24))
+
+        self.database_path = None
+        if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+            self.database_path = app.config.get('ARCHIVE_DATABASE_PATH')
+        self._tables = None
+
+        if self.database_path and not self._listener_registered:
+            event.listen(Engine, 'connect', self._attach)
+            self._listener_registered = True
+
+        app.extensions['archive_store'] = self
+
+    def _attach(self, dbapi_connection, connection_record):
+        if not self.database_path or not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (self.database_path,))
+        finally:
+            cursor.close()
+
+    # ------------------------------------------------------------------
+    # Схема
+    # ------------------------------------------------------------------
+
+    @property
+    def tables(self):
+        """Архивные таблицы по рабочим: {'listings': Table, 'moderation_logs': Table}"""
+        if self._tables is None:
+            schema = ARCHIVE_SCHEMA if self.database_path else None
+            metadata = sa.MetaData()
+            self._tables = {
+                name: self._archive_table(db.metadata.tables[name], metadata, schema)
+                for name in ARCHIVED_TABLES
+            }
+        return self._tables
+
+    @staticmethod
+    def _archive_table(source, metadata, schema):
+        # Только колонки: внешние ключи и значения по умолчанию в архиве не нужны
+        columns = [sa.Column('archive_id', sa.Integer, primary_key=True)]
+        columns += [
+            sa.Column(_archive_column(column), column.type, nullable=column.nullable)
+            for column in source.columns
+        ]
+        columns.append(sa.Column('archived_at', sa.DateTime, nullable=False))
+        name = f'{source.name}_archive'
+        extra = [sa.Index(f'ix_{name}_source_id', 'source_id')]
+        if 'listing_id' in source.columns:
+            extra.append(sa.Index(f'ix_{name}_listing_id', 'listing_id'))
+        return sa.Table(name, metadata, *columns, *extra, schema=schema)
+
+    def create_schema(self):
+        """Создает архивные таблицы, если их еще нет"""
+        with db.engine.begin() as conn:
+            for table in self.tables.values():
+                self._upgrade_table(conn, table)
+                table.create(conn, checkfirst=True)
+
+    @staticmethod
+    def _upgrade_table(conn, table):
+        """Архив прежнего формата (первичный ключ - id исходной строки) - в формат с archive_id"""
+        inspector = sa.inspect(conn)
+        if not inspector.has_table(table.name, schema=table.schema):
+            return
+        existing = [column['name'] for column in inspector.get_columns(table.name, schema=table.schema)]
+        if 'archive_id' in existing:
+            return
+
+        prefix = f'{table.schema}.' if table.schema else ''
+        legacy = f'{table.name}_legacy'
+        indexes = [index['name'] for index in inspector.get_indexes(table.name, schema=table.schema)]
+        conn.exec_driver_sql(f"ALTER TABLE {prefix}{table.name} RENAME TO {legacy}")
+        # Индексы переезжают вместе со старой таблицей и заняли бы имена новых
+        for name in indexes:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {prefix}{name}")
+        table.create(conn)
+
+        copied = [name for name in existing if name != 'id' and name in table.columns]
+        conn.exec_driver_sql(
+            f"INSERT INTO {prefix}{table.name} (source_id, {', '.join(copied)}) "
+            f"SELECT id, {', '.join(copied)} FROM {prefix}{legacy} ORDER BY archived_at, id"
+        )
+        conn.exec_driver_sql(f"DROP TABLE {prefix}{legacy}")
+
+    # ------------------------------------------------------------------
+    # Перенос
+    # ------------------------------------------------------------------
+
+    def _stale_listings(self, now):
+        listings = db.metadata.tables['listings']
+        return sa.and_(listings.c.is_active == False,  # noqa: E712
+                       listings.c.updated_at < now - self.listings_after)
+
+    def _old_logs(self, now):
+        logs = db.metadata.tables['moderation_logs']
+        return logs.c.created_at < now - self.logs_after
+
+    def pending(self, now=None):
+        """Кандидаты в архив: (объявлений, записей модерации старше срока)"""
+        now = now or datetime.utcnow()
+        listings = db.metadata.tables['listings']
+        logs = db.metadata.tables['moderation_logs']
+        with db.engine.connect() as conn:
+            stale = conn.execute(
+                sa.select(sa.func.count()).select_from(listings).where(self._stale_listings(now))
+            ).scalar()
+            old_logs = conn.execute(
+                sa.select(sa.func.count()).select_from(logs).where(self._old_logs(now))
+            ).scalar()
+        return stale, old_logs
+
+    def run(self, max_batches=None):
+        """Переносит устаревшие строки пачками; max_batches - ограничение на вызов"""
+        self.create_schema()
+        now = datetime.utcnow()
+        listings = db.metadata.tables['listings']
+        logs = db.metadata.tables['moderation_logs']
+        moved_listings = moved_logs = batches = 0
+        remaining = False
+
+        # Сначала объявления - их записи модерации уходят вместе с ними
+        while True:
+            if max_batches is not None and batches >= max_batches:
+                remaining = True
+                break
+            with db.engine.begin() as conn:
+                ids = conn.execute(
+                    sa.select(listings.c.id).where(self._stale_listings(now))
+                    .limit(self.batch_size)
+                ).scalars().all()
+                if not ids:
+                    break
+                moved_logs += self._move(conn, logs, logs.c.listing_id.in_(ids), now)
+                moved_listings += self._move(conn, listings, listings.c.id.in_(ids), now)
+                for listing_id in ids:
+                    search_engine.remove_listing(conn, listing_id)
+                    similarity_index.remove_listing(conn, listing_id)
+            batches += 1
+
+        while not remaining:
+            if max_batches is not None and batches >= max_batches:
+                remaining = True
+                break
+            with db.engine.begin() as conn:
+                ids = conn.execute(
+                    sa.select(logs.c.id).where(self._old_logs(now))
+                    .limit(self.batch_size)
+                ).scalars().all()
+                if not ids:
+                    break
+                moved_logs += self._move(conn, logs, logs.c.id.in_(ids), now)
+            batches += 1
+
+        if moved_listings:
+            page_cache.invalidate()
+        if moved_listings or moved_logs:
+            platform_stats.invalidate()
+        # Страницы освобождаем, когда перенос закончен, а не между пачками
+        freed = 0 if remaining else self.incremental_vacuum()
+        return ArchiveReport(moved_listings, moved_logs, remaining, freed)
+
+    def _move(self, conn, source, criterion, now):
+        """Копирует строки в архив и удаляет из рабочей таблицы; возвращает их число"""
+        archive = self.tables[source.name]
+        rows = sa.select(*source.columns, sa.literal(now, sa.DateTime).label('archived_at')).where(criterion)
+        copied = conn.execute(archive.insert().from_select(
+            [_archive_column(column) for column in source.columns] + ['archived_at'], rows
+        )).rowcount
+        deleted = conn.execute(source.delete().where(criterion)).rowcount
+        if deleted != copied:
+            # Между копированием и удалением появились строки (например, новая
+            # запись модерации) - они удалились бы без копии в архиве
+            raise ArchiveError(f'{source.name}: copied {copied} rows, deleted {deleted}')
+        return deleted
+
+    # ------------------------------------------------------------------
+    # Расписание
+    # ------------------------------------------------------------------
+
+    def schedule(self):
+        """Ставит archive_stale, если такой задачи еще нет в очереди; True если поставлена"""
+        if not self.interval or self._queued(PENDING, RUNNING):
+            return False
+        job_queue.enqueue('archive_stale', {})
+        db.session.commit()
+        return True
+
+    @staticmethod
+    def _queued(*statuses):
+        return db.session.execute(
+            sa.select(sa.func.count()).select_from(jobs_table)
+            .where(jobs_table.c.kind == 'archive_stale', jobs_table.c.status.in_(statuses))
+        ).scalar() > 0
+
+    # ------------------------------------------------------------------
+    # Освобождение места (SQLite)
+    # ------------------------------------------------------------------
+
+    def incremental_vacuum(self, pages=None):
+        """Возвращает свободные страницы файлу базы; число освобожденных страниц"""
+        if db.engine.dialect.name != 'sqlite':
+            return 0
+        with db.engine.connect() as conn:
+            # 2 - INCREMENTAL; при NONE освобождать нечего, нужен полный VACUUM
+            if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+                logger.info("auto_vacuum is not INCREMENTAL, run `flask db-vacuum --enable-incremental`")
+                return 0
+            before = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            # execute() делает один шаг PRAGMA - одну страницу; executescript доводит до конца
+            conn.connection.driver_connection.executescript(
+                f"PRAGMA incremental_vacuum({int(pages or self.vacuum_pages)})"
+            )
+            return before - conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+
+    def enable_incremental_vacuum(self):
+        """Переводит существующую базу в auto_vacuum=INCREMENTAL (полный VACUUM, блокирует запись)"""
+        if db.engine.dialect.name != 'sqlite':
+            return False
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+        return True
+
+    # ------------------------------------------------------------------
+    # Чтение для администратора
+    # ------------------------------------------------------------------
+
+    def find_listing(self, listing_id):
+        """(строка объявления, в архиве ли оно) или (None, False)
+
+        Если id успел смениться владельцем, из архива берется последнее
+        объявление с ним.
+        """
+        listings = db.metadata.tables['listings']
+        archive = self.tables['listings']
+        with db.engine.connect() as conn:
+            row = conn.execute(sa.select(listings).where(listings.c.id == listing_id)).first()
+            if row is not None:
+                return row, False
+            row = conn.execute(
+                sa.select(archive).where(archive.c.source_id == listing_id)
+                .order_by(archive.c.archive_id.desc()).limit(1)
+            ).first()
+            return row, row is not None
+
+    def listing_logs(self, listing_id):
+        """Записи модерации объявления из рабочей таблицы и архива по времени
+
+        Записи берутся только за время жизни объявления, найденного
+        find_listing(): журнал прежнего владельца того же id в него не попадает.
+        """
+        row, archived = self.find_listing(listing_id)
+        if row is None:
+            return []
+        logs = db.metadata.tables['moderation_logs']
+        archive = self.tables['moderation_logs']
+        rows = []
+        with db.engine.connect() as conn:
+            for table in (logs, archive):
+                criteria = [table.c.listing_id == listing_id]
+                if row.created_at is not None:
+                    criteria.append(table.c.created_at >= row.created_at)
+                if archived:
+                    criteria.append(table.c.created_at <= row.archived_at)
+                rows += conn.execute(sa.select(table).where(*criteria)).all()
+        return sorted(rows, key=lambda log: (log.created_at or datetime.min, _source_id(log)))
+
+
+def _archive_column(column):
+    """Имя колонки в архиве: первичный ключ рабочей таблицы становится source_id"""
+    return 'source_id' if column.primary_key else column.name
+
+
+def _source_id(row):
+    mapping = row._mapping
+    return mapping['source_id'] if 'source_id' in mapping else mapping['id']
+
+
+@job_queue.handler('archive_stale')
+def archive_stale_job(payload):
+    """Порция архивации; ставит себя снова - сразу или через ARCHIVE_INTERVAL_HOURS"""
+    report = archive_store.run(max_batches=archive_store.batches_per_job)
+    logger.info("Archived %s listings and %s moderation logs", report.listings, report.logs)
+    if report.remaining:
+        job_queue.enqueue('archive_stale', payload)
+        db.session.commit()
+    elif archive_store.interval and not archive_store._queued(PENDING):
+        # Эта задача сама в статусе running - проверяем только ожидающие
+        job_queue.enqueue('archive_stale', payload, delay=archive_store.interval.total_seconds())
+        db.session.commit()
+
+
+# Глобальный архиватор
+archive_store = ArchiveStore()
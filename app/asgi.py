@@ -0,0 +1,382 @@
+"""ASGI-режим: асинхронные вебхук, клик по контакту и JSON-лента.
+
+    uvicorn asgi:app --workers 2
+
+(asgi.py в корне проекта). Горячие маршруты обслуживают корутины:
+
+- POST /webhook/<token> - проверка токена и квоты, передача апдейта
+  диспетчеру бота;
+- GET /track-contact/<id> - клик по контакту;
+- GET /api/feed - JSON-лента с теми же параметрами и курсорами;
+- GET /api/feed/live - SSE живой ленты: открытое соединение ждет в
+  цикле событий и не держит поток, поэтому LIVE_FEED_MAX_SUBSCRIBERS
+  здесь можно поднять до тысяч.
+
+Запросы к базе в них идут через async-движок (aiosqlite или asyncpg, см.
+create_async_db_engine), счетчики пишутся в тот же буфер
+listing_counters, а очередь исходящих вызовов Bot API разбирают задачи
+цикла событий через AsyncTelegramClient. Ожидание базы и Telegram не
+занимает поток, поэтому число одновременных соединений не ограничено
+числом потоков воркера. Буфер счетчиков, квоты и дедупликация апдейтов
+синхронные: в памяти процесса они вызываются прямо в цикле, а с общим
+хранилищем (Redis) - через asyncio.to_thread, чтобы сеть не блокировала
+цикл.
+
+Остальные маршруты обслуживает то же Flask-приложение через
+asgiref.WsgiToAsgi (в пуле потоков) - их поведение не меняется, как и
+WSGI-режим (app.py, Vercel). Зависимости режима - requirements-asgi.txt.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import re
+import time
+from types import SimpleNamespace
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app.api.feed import serialize_listing
+from app.api.live import BUSY_MESSAGE, SSE_HEADERS, SSE_RETRY_MS, parse_event_id, sse_batch
+from app.counters import COUNTER_FIELDS, listing_counters
+from app.db_engine import create_async_db_engine
+from app.init_data import USER_HEADER
+from app.lazy import extension
+from app.live_feed import live_feed
+from app.metrics import instrumentation
+from app.models.listing import db, Listing
+from app.pagination import (
+    feed_query, make_page, page_statement, parse_per_page, parse_price_filter, parse_sort,
+    InvalidCursor
+)
+from app.rate_limit import TIER_QUERY, rate_limiter
+from app.read_models import to_cards
+from app.shared_store import is_local
+from app.telegram_client import AsyncTelegramClient
+from app.views.bot import update_sender_id
+
+logger = logging.getLogger(__name__)
+
+# Больше апдейт Telegram не бывает; длиннее тело - не от Telegram
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class AsyncRequest:
+    """Запрос ASGI: параметры строки запроса, заголовки и тело"""
+
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.method = scope['method']
+        self.args = {}
+        # Как request.args.get во Flask - первое значение параметра
+        for key, value in parse_qsl(scope.get('query_string', b'').decode('utf-8', 'replace'),
+                                    keep_blank_values=True):
+            self.args.setdefault(key, value)
+        self.headers = {
+            name.decode('latin-1').lower(): value.decode('latin-1')
+            for name, value in scope.get('headers', ())
+        }
+
+    async def body(self, limit=MAX_BODY_SIZE):
+        """Тело целиком; None, если оно длиннее limit"""
+        chunks = []
+        size = 0
+        while True:
+            message = await self.receive()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > limit:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    def client_ip(self, trust_proxy=False):
+        forwarded = self.headers.get('x-forwarded-for')
+        if trust_proxy and forwarded:
+            return forwarded.split(',')[0].strip()
+        client = self.scope.get('client')
+        return client[0] if client else 'unknown'
+
+
+def _in_process(store):
+    """True, если хранилище в памяти процесса: вызов не ждет сеть"""
+    return store is None or is_local(store)
+
+
+async def _offload(local, func, *args, **kwargs):
+    """Синхронный вызов: сразу, если он не ждет сеть, иначе в пуле потоков"""
+    if local:
+        return func(*args, **kwargs)
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+
+def _json(status, data, headers=None):
+    # Как jsonify: компактно и с сортировкой ключей
+    body = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return status, body.encode('utf-8'), 'application/json', headers or {}
+
+
+def _text(status, text):
+    return status, text.encode('utf-8'), 'text/html; charset=utf-8', {}
+
+
+class AsgiApp:
+    """ASGI-приложение: корутины горячих маршрутов, остальное - Flask через WsgiToAsgi"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.engine = None
+        self.telegram = None
+        # (метод, шаблон пути, обработчик, метка эндпоинта в метриках)
+        self.routes = (
+            ('POST', re.compile(r'^/webhook/([^/]+)$'), self.webhook, 'webhook'),
+            ('GET', re.compile(r'^/track-contact/(\d+)$'), self.track_contact, 'track_contact'),
+            ('GET', re.compile(r'^/api/feed$'), self.feed, 'api.feed'),
+            ('GET', re.compile(r'^/api/feed/live$'), self.feed_live, 'api.feed_live'),
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] == 'http':
+            for method, pattern, handler, endpoint in self.routes:
+                match = pattern.match(scope['path'])
+                if match and scope['method'] == method:
+                    await self._handle(handler, endpoint, match.groups(), scope, receive, send)
+                    return
+        await self.wsgi(scope, receive, send)
+
+    # ------------------------------------------------------------------
+    # Жизненный цикл
+    # ------------------------------------------------------------------
+
+    async def startup(self):
+        """Async-движок и отправка Bot API в цикле событий"""
+        if self.engine is not None:
+            return
+        self.engine = create_async_db_engine(self.flask_app)
+        self.telegram = AsyncTelegramClient(extension('telegram_client', self.flask_app))
+        extension('telegram_outbox', self.flask_app).run_in_loop(self.telegram)
+
+    async def shutdown(self):
+        if self.engine is None:
+            return
+        await extension('telegram_outbox', self.flask_app).stop_loop()
+        await self.telegram.aclose()
+        await self.engine.dispose()
+        self.engine = None
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    logger.exception("ASGI startup failed")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _handle(self, handler, endpoint, params, scope, receive, send):
+        # Сервер без lifespan (или тестовый клиент) - инициализация на первом запросе
+        await self.startup()
+        started = time.perf_counter()
+        request = AsyncRequest(scope, receive)
+        try:
+            status, body, content_type, headers = await handler(request, *params)
+        except Exception:
+            logger.exception(f"{request.method} {scope['path']} failed")
+            status, body, content_type, headers = _json(
+                500, {'success': False, 'error': 'Внутренняя ошибка сервера'})
+
+        # Тело - байты или асинхронный генератор кусков (SSE)
+        streaming = not isinstance(body, bytes)
+        raw_headers = [(b'content-type', content_type.encode('latin-1'))]
+        if not streaming:
+            raw_headers.append((b'content-length', str(len(body)).encode('latin-1')))
+        raw_headers += [(name.lower().encode('latin-1'), str(value).encode('latin-1'))
+                        for name, value in headers.items()]
+        await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+        if streaming:
+            await self._stream(body, receive, send)
+        else:
+            await send({'type': 'http.response.body', 'body': body})
+
+        instrumentation.requests.inc(endpoint=endpoint, method=request.method, status=status)
+        instrumentation.request_duration.observe(time.perf_counter() - started,
+                                                  endpoint=endpoint, method=request.method)
+
+    @staticmethod
+    async def _stream(chunks, receive, send):
+        """Отправляет куски, пока клиент не отключился"""
+        async def wait_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        disconnected = asyncio.ensure_future(wait_disconnect())
+        try:
+            async for chunk in chunks:
+                if disconnected.done():
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not disconnected.done():
+                await send({'type': 'http.response.body', 'body': b''})
+        except OSError:
+            # Клиент ушел посреди отправки
+            pass
+        finally:
+            disconnected.cancel()
+            await chunks.aclose()
+
+    # ------------------------------------------------------------------
+    # Квоты
+    # ------------------------------------------------------------------
+
+    async def _tier(self, telegram_id):
+        """Уровень пользователя для квоты: кеш ограничителя или запрос async-движком"""
+        tier = rate_limiter.cached_tier(telegram_id)
+        if tier is None:
+            async with self.engine.connect() as conn:
+                row = (await conn.execute(TIER_QUERY, {'id': telegram_id})).first()
+            tier = rate_limiter.remember_tier(telegram_id, row)
+        return tier
+
+    @staticmethod
+    def _limits_local():
+        return _in_process(getattr(rate_limiter.backend, 'store', None))
+
+    async def _check_user(self, scope, telegram_id):
+        tier = await self._tier(telegram_id) if rate_limiter.enabled else None
+        return await _offload(self._limits_local(), rate_limiter.check_user, scope, telegram_id, tier=tier)
+
+    async def _check_request(self, scope, request):
+        """Как rate_limiter.check_request: проверенный пользователь или IP"""
+        telegram_id = rate_limiter.user_id_from_header(request.headers.get(USER_HEADER.lower()))
+        if telegram_id is not None:
+            return await self._check_user(scope, telegram_id)
+        return await _offload(self._limits_local(), rate_limiter.check,
+                              scope, f'ip:{request.client_ip(rate_limiter.trust_proxy)}')
+
+    # ------------------------------------------------------------------
+    # Маршруты
+    # ------------------------------------------------------------------
+
+    async def webhook(self, request, token):
+        """Вебхук Telegram: как app.views.bot.webhook, но без потока на запрос"""
+        expected = extension('telegram_client', self.flask_app).token
+        if not hmac.compare_digest(token.encode('utf-8'), expected.encode('utf-8')):
+            return _text(403, 'Unauthorized')
+
+        try:
+            update = json.loads(await request.body() or b'null')
+        except ValueError:
+            update = None
+        if not isinstance(update, dict):
+            # На 4xx/5xx Telegram повторяет доставку - кривой апдейт просто пропускаем
+            logger.warning("Webhook: malformed update")
+            return _text(200, 'OK')
+
+        sender_id = update_sender_id(update)
+        if sender_id is not None and not (await self._check_user('webhook', sender_id)).allowed:
+            return _text(200, 'OK')
+
+        dispatcher = extension('bot_dispatcher', self.flask_app)
+        # Без пула (BOT_WORKERS=0) submit сам выполняет команду - не в цикле событий
+        local = bool(dispatcher.workers) and _in_process(dispatcher.deduplicator.store)
+        await _offload(local, dispatcher.submit, update)
+        return _text(200, 'OK')
+
+    async def track_contact(self, request, listing_id):
+        """Клик по контакту: как app.views.pages.track_contact"""
+        decision = await self._check_request('track_contact', request)
+        if not decision.allowed:
+            message, status, headers = rate_limiter.rejection(decision)
+            return _json(status, {'success': False, 'error': message}, headers)
+
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(
+                db.select(Listing.id, Listing.contact, *(getattr(Listing, field) for field in COUNTER_FIELDS))
+                .where(Listing.id == int(listing_id), Listing.is_active == True)  # noqa: E712
+            )).first()
+        if row is None:
+            return _json(404, {'success': False, 'error': 'Объявление не найдено'})
+
+        local = _in_process(listing_counters.store)
+        await _offload(local, listing_counters.incr, row.id, 'contacts_clicked')
+        listing = SimpleNamespace(**row._mapping)
+        await _offload(local, listing_counters.apply_pending, [listing])
+        return _json(200, {
+            'success': True,
+            'contact': listing.contact,
+            'clicks': listing.contacts_clicked
+        })
+
+    async def feed(self, request):
+        """Лента объявлений: как /api/feed, выборка - async-движком"""
+        args = request.args
+        per_page = parse_per_page(args.get('limit'))
+        sort = parse_sort(args.get('sort'))
+        # Listing.query строит запрос через сессию приложения - нужен его контекст
+        with self.flask_app.app_context():
+            query = feed_query(
+                listing_type=args.get('type'),
+                genre=args.get('genre'),
+                item_type=args.get('item_type'),
+                min_price=parse_price_filter(args.get('min_price')),
+                max_price=parse_price_filter(args.get('max_price'))
+            )
+            try:
+                statement = page_statement(query, args.get('cursor'), per_page, sort)
+            except InvalidCursor as e:
+                return _json(400, {'success': False, 'error': str(e)})
+
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(statement)).all()
+        page = make_page(to_cards(rows), per_page, sort)
+        await _offload(_in_process(listing_counters.store), listing_counters.apply_pending, page.items)
+        return _json(200, {
+            'success': True,
+            'listings': [serialize_listing(listing) for listing in page.items],
+            'next_cursor': page.next_cursor
+        })
+
+    async def feed_live(self, request):
+        """SSE живой ленты: как /api/feed/live, но поток держит цикл событий"""
+        subscriber = live_feed.subscribe(
+            listing_type=request.args.get('type') or None,
+            genre=request.args.get('genre') or None,
+            last_id=parse_event_id(request.headers.get('last-event-id') or request.args.get('last_event_id'))
+        )
+        if subscriber is None:
+            return _json(503, {'success': False, 'error': BUSY_MESSAGE}, {'Retry-After': '5'})
+        subscriber.bind_loop(asyncio.get_running_loop())
+
+        heartbeat = live_feed.heartbeat
+        deadline = time.monotonic() + live_feed.max_stream_seconds
+
+        async def stream():
+            try:
+                yield f"retry: {SSE_RETRY_MS}\n\n".encode('utf-8')
+                # Соединение ограничено по времени - клиент переподключится и продолжит
+                while time.monotonic() < deadline:
+                    items = await subscriber.wait_async(heartbeat)
+                    yield sse_batch(subscriber, items).encode('utf-8')
+            finally:
+                live_feed.unsubscribe(subscriber)
+
+        return 200, stream(), 'text/event-stream', dict(SSE_HEADERS)
+
+
+def create_asgi_app(flask_app):
+    """ASGI-обертка над приложением create_app()"""
+    return AsgiApp(flask_app)
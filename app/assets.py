@@ -0,0 +1,208 @@
+"""Статические файлы: отпечатки содержимого, сжатые копии и долгий кэш.
+
+Шаг деплоя `flask build-assets` копирует css/js из app/static в
+app/static/dist под именами с хешем содержимого (style.3f2a9c1b.css),
+кладет рядом .gz и .br (brotli - если установлен пакет brotli) и пишет
+dist/manifest.json: {"css/style.css": "dist/css/style.3f2a9c1b.css"}.
+
+url_for('static', filename='css/style.css') в шаблонах (подменяется
+через inject_globals) дает адрес с отпечатком, если он есть в
+манифесте, иначе - исходный файл, как без сборки. Файлы с отпечатком
+отдаются с Cache-Control: immutable на год и сжатой копией по
+Accept-Encoding: WebView Telegram больше не перекачивает их на каждом
+открытии, а новая версия получает новый адрес.
+
+Критический CSS - блок style.css между /* critical:start */ и
+/* critical:end */ - сборка сохраняет в dist/critical.css, а
+critical_css() вставляет его в <style> в base.html, чтобы первая
+отрисовка не ждала загрузки таблицы стилей.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import request, send_from_directory, url_for as flask_url_for
+from markupsafe import Markup
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+CRITICAL_NAME = 'critical.css'
+EXTENSIONS = ('.css', '.js', '.svg')
+# Год - ответ с отпечатком в адресе никогда не меняется
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Не сжимаем то, что меньше пакета: выигрыша нет
+MIN_COMPRESS_SIZE = 512
+
+_CRITICAL_RE = re.compile(r'/\*\s*critical:start\s*\*/(.*?)/\*\s*critical:end\s*\*/', re.S)
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+_CSS_SPACE_RE = re.compile(r'\s*([{};:,>])\s*')
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def minify_css(css):
+    """Убирает комментарии и лишние пробелы (для встраивания в страницу)"""
+    css = _CSS_COMMENT_RE.sub('', css)
+    css = _CSS_SPACE_RE.sub(r'\1', css)
+    return re.sub(r'\s+', ' ', css).replace(';}', '}').strip()
+
+
+def _write_compressed(path, data):
+    """Пишет .gz и .br рядом с файлом; возвращает записанные кодировки"""
+    encodings = []
+    if len(data) < MIN_COMPRESS_SIZE:
+        return encodings
+    # mtime=0 - одинаковый результат при повторной сборке
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) < len(data):
+        with open(path + '.gz', 'wb') as f:
+            f.write(compressed)
+        encodings.append('gzip')
+    brotli = _brotli()
+    if brotli is not None:
+        compressed = brotli.compress(data, quality=11)
+        if len(compressed) < len(data):
+            with open(path + '.br', 'wb') as f:
+                f.write(compressed)
+            encodings.append('br')
+    return encodings
+
+
+def build_assets(static_folder):
+    """Собирает dist/: файлы с отпечатками, сжатые копии, critical.css, манифест"""
+    dist = os.path.join(static_folder, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        if os.path.abspath(root) == os.path.abspath(static_folder):
+            dirs[:] = [d for d in dirs if d != DIST_DIR]
+        for name in sorted(files):
+            if not name.endswith(EXTENSIONS):
+                continue
+            source = os.path.join(root, name)
+            relative = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+
+            stem, ext = os.path.splitext(relative)
+            digest = hashlib.sha256(data).hexdigest()[:10]
+            target = f'{DIST_DIR}/{stem}.{digest}{ext}'
+            path = os.path.join(static_folder, target)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+            _write_compressed(path, data)
+            manifest[relative] = target
+
+    critical = ''
+    style = os.path.join(static_folder, 'css', 'style.css')
+    if os.path.exists(style):
+        with open(style, encoding='utf-8') as f:
+            critical = minify_css(''.join(_CRITICAL_RE.findall(f.read())))
+
+    os.makedirs(dist, exist_ok=True)
+    with open(os.path.join(dist, CRITICAL_NAME), 'w', encoding='utf-8') as f:
+        f.write(critical)
+    with open(os.path.join(dist, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class AssetPipeline:
+    """Адреса с отпечатками и раздача статики с кэшем и сжатием"""
+
+    def __init__(self):
+        self.static_folder = None
+        self.max_age = 300
+        self.manifest = {}
+        self._encodings = {}
+        self._critical = Markup('')
+
+    def init_app(self, app):
+        """Читает манифест сборки и подменяет обработчик /static"""
+        self.static_folder = app.static_folder
+        self.max_age = app.config.get('ASSETS_MAX_AGE', self.max_age)
+        self.load()
+
+        app.view_functions['static'] = self.serve
+        app.extensions['assets'] = self
+
+    def load(self):
+        """Манифест, доступные сжатые копии и критический CSS из dist/"""
+        dist = os.path.join(self.static_folder, DIST_DIR)
+        try:
+            with open(os.path.join(dist, MANIFEST_NAME), encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            # Сборки не было - отдаем исходные файлы
+            self.manifest = {}
+
+        self._encodings = {}
+        for target in self.manifest.values():
+            path = os.path.join(self.static_folder, target)
+            self._encodings[target] = tuple(
+                encoding for encoding, suffix in (('br', '.br'), ('gzip', '.gz'))
+                if os.path.exists(path + suffix)
+            )
+
+        try:
+            with open(os.path.join(dist, CRITICAL_NAME), encoding='utf-8') as f:
+                self._critical = Markup(f.read())
+        except OSError:
+            self._critical = Markup('')
+
+    # ------------------------------------------------------------------
+    # Шаблоны
+    # ------------------------------------------------------------------
+
+    def url_for(self, endpoint, **values):
+        """url_for с заменой статического файла на версию с отпечатком"""
+        if endpoint == 'static':
+            filename = values.get('filename')
+            if filename in self.manifest:
+                values['filename'] = self.manifest[filename]
+        return flask_url_for(endpoint, **values)
+
+    def critical_css(self):
+        """Критический CSS для <style> в base.html ('' без сборки)"""
+        return self._critical
+
+    # ------------------------------------------------------------------
+    # Раздача
+    # ------------------------------------------------------------------
+
+    def serve(self, filename):
+        """/static/<filename>: сжатая копия по Accept-Encoding и заголовки кэша"""
+        encodings = self._encodings.get(filename)
+        if encodings is None:
+            return send_from_directory(self.static_folder, filename, max_age=self.max_age)
+
+        encoding = next((e for e in encodings if request.accept_encodings[e]), None)
+        suffix = {'br': '.br', 'gzip': '.gz'}.get(encoding, '')
+        response = send_from_directory(
+            self.static_folder, filename + suffix,
+            mimetype=mimetypes.guess_type(filename)[0],
+            max_age=IMMUTABLE_MAX_AGE
+        )
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        if encodings:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+# Глобальный конвейер статики
+assets = AssetPipeline()
@@ -0,0 +1,170 @@
+"""Прием апдейтов Telegram-бота: дедупликация, реестр команд, пул воркеров.
+
+Вебхук только отмечает update_id и отдает задачу в пул потоков, поэтому
+Telegram получает ответ за миллисекунды. Повторная доставка того же
+update_id (после таймаута или ошибки) отбрасывается. Для локального
+запуска без вебхука есть режим long-poll через getUpdates.
+BOT_WORKERS=0 (serverless) выполняет команду прямо в запросе вебхука:
+после ответа фоновые потоки функции замораживаются.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from app.shared_store import get_shared_store, is_local
+from app.telegram_client import TelegramError
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDeduplicator:
+    """Скользящее окно последних update_id с ограничением по размеру и времени"""
+
+    KEY_PREFIX = 'bot:update'
+
+    def __init__(self, maxsize=10000, window=3600, store=None):
+        self.maxsize = maxsize
+        self.window = window
+        self.store = store
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_duplicate(self, update_id):
+        """Отмечает update_id; True если он уже встречался"""
+        now = time.monotonic()
+        with self._lock:
+            # Выкидываем устаревшие и лишние записи с головы окна
+            while self._seen:
+                oldest_id, seen_at = next(iter(self._seen.items()))
+                if len(self._seen) < self.maxsize and now - seen_at < self.window:
+                    break
+                self._seen.popitem(last=False)
+
+            if update_id in self._seen:
+                return True
+            self._seen[update_id] = now
+
+        # Между воркерами - через общее хранилище (SET NX)
+        if self.store is not None and not is_local(self.store):
+            key = f'{self.KEY_PREFIX}:{update_id}'
+            if not self.store.set(key, 1, ex=self.window, nx=True):
+                return True
+        return False
+
+
+class CommandRegistry:
+    """Реестр команд бота: '/start' -> обработчик(chat_id)"""
+
+    def __init__(self):
+        self.handlers = {}
+        self.descriptions = {}
+
+    def command(self, name, description=None):
+        """Декоратор регистрации обработчика команды"""
+        def decorator(func):
+            self.handlers[name] = func
+            self.descriptions[name] = description or (func.__doc__ or '').strip()
+            return func
+        return decorator
+
+    def dispatch(self, update):
+        """Вызывает обработчик команды из апдейта; False если команды нет"""
+        message = update.get('message') or update.get('edited_message')
+        if not message:
+            return False
+
+        text = (message.get('text') or '').strip()
+        if not text.startswith('/'):
+            return False
+
+        # "/start@BeatssudaBot payload" -> "/start"
+        name = text.split()[0].split('@')[0]
+        handler = self.handlers.get(name)
+        if handler is None:
+            return False
+
+        handler(message['chat']['id'])
+        return True
+
+
+class UpdateDispatcher:
+    """Пул потоков, выполняющий команды из принятых апдейтов"""
+
+    def __init__(self, registry, workers=4):
+        self.registry = registry
+        self.workers = workers
+        self.app = None
+        self.deduplicator = UpdateDeduplicator()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Настраивает пул (BOT_WORKERS) и окно дедупликации"""
+        self.app = app
+        self.workers = app.config.get('BOT_WORKERS', self.workers)
+        self.deduplicator = UpdateDeduplicator(
+            maxsize=app.config.get('BOT_DEDUP_SIZE', 10000),
+            window=app.config.get('BOT_DEDUP_WINDOW', 3600),
+            store=get_shared_store(app.config.get('BOT_REDIS_URL'))
+        )
+        app.extensions['bot_dispatcher'] = self
+
+    @property
+    def executor(self):
+        # Создаем лениво - уже в процессе-воркере после fork
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers,
+                        thread_name_prefix='bot-dispatch'
+                    )
+        return self._executor
+
+    def submit(self, update):
+        """Принимает апдейт; False если это повтор"""
+        update_id = update.get('update_id')
+        if update_id is not None and self.deduplicator.is_duplicate(update_id):
+            return False
+        if not self.workers:
+            self._run(update)
+            return True
+        self.executor.submit(self._run, update)
+        return True
+
+    def _run(self, update):
+        try:
+            # Обработчикам нужен контекст приложения (расширения, база)
+            with self.app.app_context():
+                self.registry.dispatch(update)
+        except Exception:
+            logger.exception(f"Bot update {update.get('update_id')} failed")
+
+    def poll(self, client, timeout=30, limit=100, stop_event=None):
+        """Long-poll getUpdates вместо вебхука (для локального запуска)"""
+        offset = None
+        while stop_event is None or not stop_event.is_set():
+            try:
+                updates = client.call(
+                    'getUpdates',
+                    request_timeout=timeout + 10,
+                    offset=offset,
+                    timeout=timeout,
+                    limit=limit,
+                    allowed_updates=['message']
+                ) or []
+            except TelegramError as e:
+                logger.error(f"getUpdates failed: {e}")
+                time.sleep(1)
+                continue
+
+            for update in updates:
+                self.submit(update)
+                offset = update['update_id'] + 1
+
+
+# Глобальный реестр команд и диспетчер апдейтов
+bot_commands = CommandRegistry()
+bot_dispatcher = UpdateDispatcher(bot_commands)
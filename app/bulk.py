@@ -0,0 +1,314 @@
+"""Пакетный импорт и экспорт listings, users и moderation_logs.
+
+Экспорт - генератор поверх серверного курсора (stream_results): строки
+читаются порциями и сразу отдаются как NDJSON или CSV, поэтому память не
+растет с размером таблицы. Импорт читает поток построчно и пишет
+порциями через executemany, каждая порция - отдельная транзакция.
+Объявления перед записью проходят фильтры контента и content_moderator,
+получают price_usd и попадают в поисковый индекс и индекс похожести
+в той же транзакции.
+"""
+import csv
+import io
+import json
+from collections import namedtuple
+from datetime import date, datetime
+from types import SimpleNamespace
+
+from app.metrics import instrumentation
+from app.models.listing import db
+from app.moderation_rules import filter_matcher
+from app.page_cache import page_cache
+from app.pricing import price_service
+from app.search import search_engine
+from app.similarity import PendingIndex, similarity_index
+from app.stats import platform_stats
+
+TABLES = ('listings', 'users', 'moderation_logs')
+FORMATS = ('ndjson', 'csv')
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+ImportReport = namedtuple('ImportReport', ['read', 'imported', 'rejected', 'errors'])
+
+# Сколько сообщений об отклоненных строках хранить в отчете
+MAX_REPORTED_ERRORS = 100
+
+
+class BulkError(ValueError):
+    """Неизвестная таблица, формат или битая строка входного файла"""
+
+
+def get_table(name):
+    """Таблица из метаданных моделей"""
+    if name not in TABLES:
+        raise BulkError(f'Неизвестная таблица: {name}')
+    return db.metadata.tables[name]
+
+
+def _check_format(fmt):
+    if fmt not in FORMATS:
+        raise BulkError(f'Неизвестный формат: {fmt}')
+
+
+def _to_text(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def export_rows(table_name, fmt='ndjson', batch_size=1000):
+    """Генератор кусков текста с содержимым таблицы в порядке id"""
+    _check_format(fmt)
+    table = get_table(table_name)
+    columns = [column.name for column in table.columns]
+
+    with db.engine.connect() as conn:
+        result = conn.execution_options(
+            stream_results=True,
+            max_row_buffer=batch_size
+        ).execute(db.select(table).order_by(table.c.id))
+
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for rows in result.partitions(batch_size):
+                for row in rows:
+                    writer.writerow(['' if value is None else _to_text(value) for value in row])
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+            return
+
+        for rows in result.partitions(batch_size):
+            yield ''.join(
+                json.dumps({key: _to_text(value) for key, value in row._mapping.items()},
+                           ensure_ascii=False) + '\n'
+                for row in rows
+            )
+
+
+def read_records(stream, fmt='ndjson'):
+    """Генератор словарей из текстового потока NDJSON или CSV"""
+    _check_format(fmt)
+    if fmt == 'csv':
+        for record in csv.DictReader(stream):
+            # Пустая ячейка CSV - это NULL
+            yield {key: (value if value != '' else None) for key, value in record.items()}
+        return
+
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise BulkError(f'Строка {line_no}: некорректный JSON')
+        if not isinstance(record, dict):
+            raise BulkError(f'Строка {line_no}: ожидается JSON-объект')
+        yield record
+
+
+def _coerce(column, value):
+    """Значение из файла в тип колонки (CSV приносит только строки)"""
+    if value is None or not isinstance(value, str):
+        return value
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        # Тип без python_type (например, NullType) - значение как есть
+        return value
+    if python_type is bool:
+        return value.strip().lower() in ('1', 'true', 't', 'yes', 'y')
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type in (int, float):
+        return python_type(value)
+    return value
+
+
+class BulkImporter:
+    """Импорт записей в таблицу порциями по chunk_size строк"""
+
+    def __init__(self, table_name, chunk_size=500, keep_ids=False, moderate=True, progress=None):
+        self.table = get_table(table_name)
+        if self.table.name == 'moderation_logs' and not keep_ids:
+            # Без id из файла объявления получают новые номера, и listing_id
+            # записей модерации указывал бы на чужие объявления
+            raise BulkError('moderation_logs импортируются только с сохранением id '
+                            '(--keep-ids / keep_ids=1), вместе с объявлениями')
+        self.chunk_size = chunk_size
+        self.keep_ids = keep_ids
+        self.moderate = moderate
+        self.progress = progress
+        self.read = 0
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+
+    def run(self, records):
+        """Импортирует все записи; возвращает ImportReport"""
+        chunk = []
+        for record in records:
+            self.read += 1
+            row = self._prepare(record)
+            if row is not None:
+                chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                self._write(chunk)
+                chunk = []
+        if chunk:
+            self._write(chunk)
+        if self.imported and self.table.name == 'listings':
+            # Запись шла мимо ORM - сбрасываем кэши явно
+            page_cache.invalidate()
+            platform_stats.invalidate()
+        return ImportReport(self.read, self.imported, self.rejected, self.errors)
+
+    def _reject(self, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f'Строка {self.read}: {message}')
+
+    def _prepare(self, record):
+        row = {}
+        try:
+            for column in self.table.columns:
+                if column.name == 'id' and not self.keep_ids:
+                    continue
+                # Пустое значение - как отсутствующее: возьмется умолчание модели
+                if record.get(column.name) is not None:
+                    row[column.name] = _coerce(column, record[column.name])
+        except (TypeError, ValueError) as e:
+            self._reject(f'некорректное значение ({e})')
+            return None
+
+        missing = [
+            column.name for column in self.table.columns
+            if not column.nullable and not column.primary_key
+            and column.default is None and row.get(column.name) is None
+        ]
+        if missing:
+            self._reject(f"нет обязательных полей: {', '.join(missing)}")
+            return None
+
+        # executemany требует одинаковый набор ключей - заполняем умолчания моделей
+        for column in self.table.columns:
+            if column.name in row or column.primary_key:
+                continue
+            default = column.default
+            if default is None:
+                row[column.name] = None
+            elif default.is_callable:
+                row[column.name] = default.arg(None)
+            else:
+                row[column.name] = default.arg
+        return row
+
+    def _write(self, chunk):
+        if self.table.name == 'listings':
+            chunk = self._moderate_listings(chunk)
+        if not chunk:
+            self._report()
+            return
+
+        with db.engine.begin() as conn:
+            if self.table.name == 'listings':
+                self._insert_listings(conn, chunk)
+                inserted = len(chunk)
+            else:
+                result = conn.execute(self._insert_statement(conn), chunk)
+                # Пропущенные по ON CONFLICT строки не считаем
+                inserted = result.rowcount if result.rowcount >= 0 else len(chunk)
+        self.imported += inserted
+        self._report()
+
+    def _report(self):
+        if self.progress is not None:
+            self.progress(ImportReport(self.read, self.imported, self.rejected, self.errors))
+
+    def _insert_statement(self, conn):
+        statement = db.insert(self.table)
+        if self.table.name == 'users' and conn.dialect.name in ('sqlite', 'postgresql'):
+            # Уже известные telegram_id пропускаем
+            if conn.dialect.name == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            statement = insert(self.table).on_conflict_do_nothing(index_elements=['telegram_id'])
+        return statement
+
+    def _moderate_listings(self, chunk):
+        """Фильтры и модерация порции; отклоненные строки выпадают"""
+        # Модератор нужен только импорту объявлений - не при старте приложения
+        from app.moderation import content_moderator
+
+        accepted = []
+        # Строки порции еще не в similarity_buckets - сверяем их между собой отдельно
+        pending = PendingIndex(similarity_index.threshold)
+        for row in chunk:
+            row['price_usd'] = price_service.to_usd(row.get('price'))
+            if not self.moderate:
+                row['_log'] = ('imported', 'Bulk import without moderation')
+                accepted.append(row)
+                continue
+
+            with instrumentation.span('moderation.filters'):
+                errors = filter_matcher.errors(row)
+            with instrumentation.span('moderation.moderate_listing'):
+                result = content_moderator.moderate_listing(row)
+            errors += result['errors'] if not result['approved'] else []
+            if errors:
+                self._reject('; '.join(errors))
+                continue
+
+            warnings = list(result['warnings'])
+            with instrumentation.span('moderation.near_duplicate'):
+                similar = similarity_index.find_similar(row)
+            if similar:
+                similar_id, score = similar[0]
+                warnings.append(f'Похоже на объявление #{similar_id} (совпадение {score:.0%})')
+            similar_in_chunk = pending.add(row)
+            if similar_in_chunk:
+                _, score = similar_in_chunk[0]
+                warnings.append(f'Похоже на другое объявление этого импорта (совпадение {score:.0%})')
+
+            row['is_moderated'] = not (result['needs_review'] or similar or similar_in_chunk)
+            row['_log'] = (
+                'auto_approved' if row['is_moderated'] else 'needs_review',
+                f"Bulk import. Warnings: {'; '.join(warnings)}" if warnings else 'Bulk import. Clean'
+            )
+            accepted.append(row)
+        return accepted
+
+    def _insert_listings(self, conn, chunk):
+        logs = [row.pop('_log') for row in chunk]
+        statement = db.insert(self.table)
+
+        if getattr(conn.dialect, 'insert_executemany_returning', False):
+            # Один executemany, id новых строк возвращаются в порядке вставки
+            result = conn.execute(
+                statement.returning(self.table.c.id, sort_by_parameter_order=True),
+                chunk
+            )
+            ids = [row.id for row in result]
+        else:
+            ids = [conn.execute(statement, row).inserted_primary_key[0] for row in chunk]
+
+        now = datetime.utcnow()
+        conn.execute(db.insert(db.metadata.tables['moderation_logs']), [
+            {'listing_id': listing_id, 'action': action, 'reason': reason,
+             'moderator': 'bulk_import', 'created_at': now}
+            for listing_id, (action, reason) in zip(ids, logs)
+        ])
+
+        for listing_id, row in zip(ids, chunk):
+            listing = SimpleNamespace(**dict(row, id=listing_id))
+            search_engine.index_listing(conn, listing)
+            similarity_index.index_listing(conn, listing)
@@ -0,0 +1,192 @@
+"""CLI-команды приложения (flask <команда>).
+
+Клиент Bot API и обработчики бота импортируются внутри bot-poll, чтобы
+регистрация CLI не замедляла старт веб-процесса.
+"""
+import click
+
+from app.archive import archive_store
+from app.assets import assets, build_assets
+from app.bulk import FORMATS, TABLES, BulkError, BulkImporter, export_rows, read_records
+from app.jobs import job_queue
+from app.models.listing import db
+from app.models.migrations import check_query_plans
+from app.page_cache import page_cache
+from app.pricing import price_service
+from app.search import search_engine
+from app.similarity import similarity_index
+
+
+def _bulk_format(path, fmt):
+    """Формат из опции или по расширению файла"""
+    if fmt:
+        return fmt
+    return 'csv' if path and path.endswith('.csv') else 'ndjson'
+
+
+def register_commands(app):
+    """Регистрирует команды в app.cli"""
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Создает таблицы, применяет миграции и строит поисковый индекс (шаг деплоя)"""
+        from app.factory import init_schema
+
+        applied = init_schema(app)
+        for migration in applied:
+            print(f"Применена миграция {migration.version}: {migration.name}")
+        print("✅ Схема базы данных актуальна")
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Собирает статику с отпечатками и сжатыми копиями (шаг деплоя)"""
+        manifest = build_assets(app.static_folder)
+        assets.load()
+        for source, target in sorted(manifest.items()):
+            print(f"{source} -> {target}")
+        print(f"✅ Собрано файлов: {len(manifest)}")
+
+    @app.cli.command('search-reindex')
+    def search_reindex_command():
+        """Перестраивает поисковый индекс объявлений"""
+        indexed = search_engine.reindex()
+        print(f"Проиндексировано объявлений: {indexed}")
+
+    @app.cli.command('dedupe-listings')
+    @click.option('--threshold', type=float, help='Порог похожести (по умолчанию SIMILARITY_THRESHOLD)')
+    @click.option('--action', type=click.Choice(['review', 'deactivate']), default='review',
+                  show_default=True, help='review - снять до проверки, deactivate - выключить')
+    @click.option('--dry-run', is_flag=True, help='Только показать найденные пары')
+    @click.option('--background', is_flag=True, help='Поставить задачу в очередь фоновых задач')
+    @click.option('--reindex', is_flag=True, help='Сначала перестроить индекс похожести')
+    def dedupe_listings_command(threshold, action, dry_run, background, reindex):
+        """Ищет почти-дубликаты в каталоге; оригиналом считается самое старое объявление"""
+        if background:
+            job_queue.enqueue('dedupe_listings', {'threshold': threshold, 'action': action})
+            db.session.commit()
+            print("Задача dedupe_listings поставлена в очередь")
+            return
+
+        if reindex:
+            print(f"Проиндексировано объявлений: {similarity_index.reindex()}")
+        report = similarity_index.dedupe(threshold=threshold, action=action, dry_run=dry_run)
+        for duplicate_id, original_id, score in report.pairs:
+            print(f"#{duplicate_id} ~ #{original_id} ({score:.0%})")
+        verb = 'найдено' if dry_run else 'обработано'
+        print(f"✅ Проверено: {report.checked}, {verb} почти-дубликатов: {report.duplicates}")
+
+    @app.cli.command('archive-run')
+    @click.option('--dry-run', is_flag=True, help='Только посчитать, что будет перенесено')
+    @click.option('--background', is_flag=True, help='Поставить задачу в очередь фоновых задач')
+    def archive_run_command(dry_run, background):
+        """Переносит старые неактивные объявления и журнал модерации в архив"""
+        if dry_run:
+            listings, logs = archive_store.pending()
+            print(f"К переносу: объявлений {listings} (с их журналом), старых записей модерации {logs}")
+            return
+        if background:
+            job_queue.enqueue('archive_stale', {})
+            db.session.commit()
+            print("Задача archive_stale поставлена в очередь")
+            return
+
+        report = archive_store.run()
+        print(f"✅ В архиве: объявлений {report.listings}, записей модерации {report.logs}, "
+              f"освобождено страниц: {report.freed_pages}")
+
+    @app.cli.command('db-vacuum')
+    @click.option('--enable-incremental', is_flag=True,
+                  help='Перевести базу в auto_vacuum=INCREMENTAL (полный VACUUM)')
+    def db_vacuum_command(enable_incremental):
+        """Возвращает файловой системе свободные страницы SQLite"""
+        if enable_incremental:
+            if not archive_store.enable_incremental_vacuum():
+                raise click.ClickException("Только для SQLite")
+            print("✅ auto_vacuum=INCREMENTAL")
+        print(f"Освобождено страниц: {archive_store.incremental_vacuum()}")
+
+    @app.cli.command('jobs-worker')
+    def jobs_worker_command():
+        """Запускает отдельный процесс-воркер фоновых задач"""
+        print("Воркер фоновых задач запущен")
+        job_queue.run_forever()
+
+    @app.cli.command('prices-backfill')
+    @click.option('--recompute', '--all', 'recompute', is_flag=True,
+                  help='Пересчитать все цены по текущим курсам')
+    @click.option('--batch-size', default=500, show_default=True)
+    def prices_backfill_command(recompute, batch_size):
+        """Заполняет price_usd для существующих объявлений"""
+        price_service.refresh()
+        updated = price_service.backfill(batch_size=batch_size, recompute=recompute)
+        page_cache.invalidate()
+        print(f"Обновлено цен: {updated}")
+
+    @app.cli.command('export-data')
+    @click.argument('table', type=click.Choice(TABLES))
+    @click.option('--output', '-o', type=click.Path(dir_okay=False), help='Файл (по умолчанию stdout)')
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS))
+    def export_data_command(table, output, fmt):
+        """Выгружает таблицу в NDJSON или CSV потоком"""
+        fmt = _bulk_format(output, fmt)
+        out = open(output, 'w', encoding='utf-8', newline='') if output else click.get_text_stream('stdout')
+        try:
+            for chunk in export_rows(table, fmt):
+                out.write(chunk)
+        finally:
+            if output:
+                out.close()
+
+    @app.cli.command('import-data')
+    @click.argument('table', type=click.Choice(TABLES))
+    @click.argument('source', type=click.Path(dir_okay=False, allow_dash=True))
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS))
+    @click.option('--chunk-size', default=500, show_default=True)
+    @click.option('--keep-ids', is_flag=True, help='Сохранить id из файла')
+    @click.option('--no-moderate', is_flag=True, help='Не прогонять объявления через модерацию')
+    def import_data_command(table, source, fmt, chunk_size, keep_ids, no_moderate):
+        """Загружает NDJSON или CSV порциями с отчетом о прогрессе"""
+        def progress(report):
+            click.echo(f"\rПрочитано: {report.read}, загружено: {report.imported}, "
+                       f"отклонено: {report.rejected}", nl=False, err=True)
+
+        try:
+            importer = BulkImporter(table, chunk_size=chunk_size, keep_ids=keep_ids,
+                                    moderate=not no_moderate, progress=progress)
+        except BulkError as e:
+            raise click.ClickException(str(e))
+        with click.open_file(source, 'r', encoding='utf-8') as stream:
+            try:
+                report = importer.run(read_records(stream, _bulk_format(source, fmt)))
+            except BulkError as e:
+                click.echo('', err=True)
+                raise click.ClickException(f"{e} (загружено до ошибки: {importer.imported})")
+        click.echo('', err=True)
+        for error in report.errors:
+            print(f"❌ {error}")
+        print(f"✅ Загружено: {report.imported} из {report.read}, отклонено: {report.rejected}")
+
+    @app.cli.command('check-query-plans')
+    def check_query_plans_command():
+        """Проверяет, что запросы лент идут по индексам без сортировки"""
+        problems = check_query_plans(app)
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            raise SystemExit(1)
+        print("✅ Все запросы лент используют индексы")
+
+    @app.cli.command('bot-poll')
+    def bot_poll_command():
+        """Получает апдейты бота через getUpdates (локально, без вебхука)"""
+        from app.lazy import extension
+        from app.views import bot  # noqa: F401 - регистрирует команды бота
+
+        client = extension('telegram_client', app)
+        # getUpdates не работает, пока у бота установлен вебхук
+        client.call('deleteWebhook')
+        print("Бот слушает getUpdates, Ctrl+C для остановки")
+        try:
+            extension('bot_dispatcher', app).poll(client)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,270 @@
+"""Отложенная запись счетчиков просмотров и кликов по контактам.
+
+view_listing() и track_contact() не пишут в базу сами: приращения
+копятся в буфере (в памяти процесса или в общем Redis) и сбрасываются
+пачкой UPDATE ... SET views = views + ? по таймеру или при достижении
+порога. При чтении несброшенные приращения добавляются к значениям из
+базы, поэтому на страницах счетчики остаются точными.
+"""
+import atexit
+import logging
+import threading
+import time
+import uuid
+
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.models.listing import db
+from app.shared_store import get_shared_store
+
+COUNTER_FIELDS = ('views', 'contacts_clicked')
+
+# Аренда порции в сбросе (секунды) и как часто искать порции упавших процессов
+LEASE_SECONDS = 60
+ORPHAN_CHECK_INTERVAL = 60
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicFlusher:
+    """Фоновый поток, вызывающий flush() по таймеру или по запросу"""
+
+    def __init__(self, flush, interval, name):
+        self._flush = flush
+        self._interval = interval
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        if not self._thread.is_alive():
+            self._thread.start()
+        return self
+
+    def wake(self):
+        """Просит поток сбросить буфер, не дожидаясь таймера"""
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=self._interval + 5)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self._interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                self._flush()
+            except Exception:
+                logger.exception(f"{self._thread.name}: flush failed")
+
+
+def schedule_flush(app, flush, interval, name, on_request=None):
+    """Поток сброса по таймеру; при BACKGROUND_FLUSH=False - сброс в конце запроса
+
+    Serverless-функция замораживается после ответа, и поток не успел бы
+    записать буфер до того, как инстанс выгрузят. on_request - более
+    дешевый вариант flush для вызова после каждого запроса. Возвращает
+    PeriodicFlusher или None, если сброс привязан к запросам.
+    """
+    if app.config.get('BACKGROUND_FLUSH', True):
+        return PeriodicFlusher(flush, interval, name).start()
+
+    def flush_after_request(exc=None):
+        try:
+            (on_request or flush)()
+        except Exception:
+            logger.exception(f"{name}: flush failed")
+
+    app.teardown_request(flush_after_request)
+    return None
+
+
+class CounterBuffer:
+    """Буфер приращений счетчиков объявлений с пакетным сбросом в базу"""
+
+    KEY_PREFIX = 'counters:listings'
+
+    def __init__(self):
+        self.app = None
+        self.store = None
+        self.threshold = 500
+        self._pending_ops = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self._scheduled = False
+        self._listeners = []
+        self._orphans_checked_at = 0.0
+        self._flushing_key = f'{self.KEY_PREFIX}:flushing:{uuid.uuid4().hex}'
+
+    def init_app(self, app):
+        """Настраивает хранилище, поток сброса и финальный сброс при выходе"""
+        self.app = app
+        self.store = get_shared_store(app.config.get('COUNTERS_REDIS_URL'))
+        self.threshold = app.config.get('COUNTER_FLUSH_THRESHOLD', 500)
+        interval = app.config.get('COUNTER_FLUSH_INTERVAL', 5.0)
+
+        # Порции, оставшиеся от упавших процессов, возвращаем в общий буфер
+        self._recover_orphans()
+
+        if not self._scheduled:
+            self._flusher = schedule_flush(app, self.flush, interval, 'counter-flusher',
+                                          on_request=self.flush_pending)
+            self._scheduled = True
+            atexit.register(self.shutdown)
+
+        app.extensions['listing_counters'] = self
+
+    def add_listener(self, callback):
+        """Подписка на приращения: callback(listing_id, field, amount)"""
+        self._listeners.append(callback)
+
+    def incr(self, listing_id, field, amount=1):
+        """Увеличивает счетчик объявления без записи в базу"""
+        if field not in COUNTER_FIELDS:
+            raise ValueError(f'Unknown counter: {field}')
+
+        self.store.hincrby(self._key(field), str(listing_id), amount)
+        for callback in self._listeners:
+            callback(listing_id, field, amount)
+
+        with self._lock:
+            self._pending_ops += 1
+            reached = self._pending_ops >= self.threshold
+        if reached and self._flusher is not None:
+            self._flusher.wake()
+
+    def pending(self, listing_id, field):
+        """Несброшенное приращение счетчика объявления"""
+        total = int(self.store.hget(self._key(field), str(listing_id)) or 0)
+        total += int(self.store.hget(self._flushing(field), str(listing_id)) or 0)
+        return total
+
+    def apply_pending(self, listings):
+        """Добавляет несброшенные приращения к загруженным объявлениям
+
+        Значения выставляются как уже сохраненные, поэтому объект не
+        становится "грязным" и сессия не запишет их повторно.
+        """
+        listings = [listing for listing in listings if listing is not None]
+        if not listings:
+            return
+        ids = [str(listing.id) for listing in listings]
+        for field in COUNTER_FIELDS:
+            queued = self.store.hmget(self._key(field), ids)
+            in_flight = self.store.hmget(self._flushing(field), ids)
+            for listing, a, b in zip(listings, queued, in_flight):
+                delta = int(a or 0) + int(b or 0)
+                if delta:
+                    value = (getattr(listing, field) or 0) + delta
+                    if hasattr(listing, '_sa_instance_state'):
+                        set_committed_value(listing, field, value)
+                    else:
+                        # Карточки ListingCard - простые объекты без ORM-состояния
+                        setattr(listing, field, value)
+
+    def flush_pending(self):
+        """flush(), если в этом процессе были приращения после прошлого сброса"""
+        if self._pending_ops:
+            return self.flush()
+        return 0
+
+    def flush(self):
+        """Сбрасывает накопленные приращения в базу одной транзакцией"""
+        with self._flush_lock:
+            with self._lock:
+                self._pending_ops = 0
+
+            # Порции упавших процессов подбираем не только при старте
+            if time.monotonic() - self._orphans_checked_at > ORPHAN_CHECK_INTERVAL:
+                self._recover_orphans()
+
+            batches = {}
+            for field in COUNTER_FIELDS:
+                deltas = self._claim(field)
+                for listing_id, delta in deltas.items():
+                    batches.setdefault(int(listing_id), dict.fromkeys(COUNTER_FIELDS, 0))[field] = int(delta)
+
+            if not batches:
+                return 0
+
+            params = [dict(values, id=listing_id) for listing_id, values in batches.items()]
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as conn:
+                        conn.execute(db.text(
+                            "UPDATE listings SET "
+                            "views = COALESCE(views, 0) + :views, "
+                            "contacts_clicked = COALESCE(contacts_clicked, 0) + :contacts_clicked "
+                            "WHERE id = :id"
+                        ), params)
+                        # Порцию убираем до коммита: после него apply_pending
+                        # прибавил бы ее к уже обновленной колонке второй раз
+                        for field in COUNTER_FIELDS:
+                            self.store.delete(self._flushing(field))
+            except Exception as e:
+                # База недоступна - возвращаем приращения в буфер до следующей попытки
+                self.app.logger.error(f"Counter flush failed: {e}")
+                self._restore(batches)
+                return 0
+
+            self.store.delete(self._lease_key())
+            return len(params)
+
+    def shutdown(self):
+        """Останавливает поток и сбрасывает остаток перед выходом процесса"""
+        if self._flusher is not None:
+            self._flusher.stop()
+        if self.app is not None:
+            self.flush()
+
+    def _key(self, field):
+        return f'{self.KEY_PREFIX}:{field}'
+
+    def _flushing(self, field):
+        return f'{self._flushing_key}:{field}'
+
+    def _lease_key(self):
+        return f'{self._flushing_key}:lease'
+
+    def _claim(self, field):
+        """Атомарно забирает накопленные приращения (RENAME во временный ключ)"""
+        # Пока жива аренда, другие воркеры не считают порцию брошенной
+        self.store.set(self._lease_key(), 1, ex=LEASE_SECONDS)
+        try:
+            self.store.rename(self._key(field), self._flushing(field))
+        except Exception:
+            # Ключа нет - нечего сбрасывать
+            return {}
+        return self.store.hgetall(self._flushing(field))
+
+    def _restore(self, batches):
+        for listing_id, values in batches.items():
+            for field, delta in values.items():
+                if delta:
+                    self.store.hincrby(self._key(field), str(listing_id), delta)
+        for field in COUNTER_FIELDS:
+            self.store.delete(self._flushing(field))
+        self.store.delete(self._lease_key())
+
+    def _recover_orphans(self):
+        self._orphans_checked_at = time.monotonic()
+        for key in self.store.keys(f'{self.KEY_PREFIX}:flushing:*'):
+            owner, field = key.rsplit(':', 1)
+            if field not in COUNTER_FIELDS or owner == self._flushing_key:
+                continue
+            if self.store.exists(f'{owner}:lease'):
+                # Владелец еще жив и прямо сейчас пишет эту порцию
+                continue
+            for listing_id, delta in self.store.hgetall(key).items():
+                self.store.hincrby(self._key(field), listing_id, int(delta))
+            self.store.delete(key)
+
+
+# Глобальный буфер счетчиков
+listing_counters = CounterBuffer()
@@ -0,0 +1,162 @@
+"""Настройка движка SQLAlchemy: pragmas SQLite, пул соединений и реплика.
+
+configure_engine() вызывается до init_db(): выставляет
+SQLALCHEMY_ENGINE_OPTIONS под бэкенд и подписывается на открытие
+соединений SQLite, чтобы каждое получало WAL, synchronous=NORMAL,
+busy_timeout, mmap и увеличенный кэш страниц.
+
+Если задан DATABASE_REPLICA_URL, маршруты с декоратором @read_replica
+читают с реплики: SELECT-запросы сессии уходят на движок реплики, а
+запись по-прежнему идет в основную базу.
+
+create_async_db_engine() дает ASGI-режиму (app.asgi) async-движок той же
+базы: aiosqlite с теми же pragmas или asyncpg.
+"""
+import math
+import sqlite3
+from functools import wraps
+
+from flask import current_app
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session
+
+from app.models.listing import db
+
+# Ключ session.info с движком реплики на время @read_replica
+REPLICA_KEY = 'replica_engine'
+
+# Значения по умолчанию; переопределяются SQLITE_* в конфигурации
+SQLITE_PRAGMAS = {
+    # Действует только на новую базу: страницы после архивации
+    # освобождаются через incremental_vacuum (см. app.archive)
+    'auto_vacuum': 'INCREMENTAL',
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение - размер в КиБ (64 МиБ на соединение)
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# Async-драйверы по бэкенду основной базы
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+_pragmas = dict(SQLITE_PRAGMAS)
+_listeners_registered = False
+
+
+def engine_options(url, config=None):
+    """Параметры create_engine для бэкенда по URL"""
+    config = config or {}
+    backend = make_url(url).get_backend_name()
+    if backend == 'sqlite':
+        return {
+            # Соединения делят фоновые потоки (счетчики, задачи, бот)
+            'connect_args': {'check_same_thread': False},
+        }
+    return {
+        'pool_size': config.get('DB_POOL_SIZE', 10),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 10),
+        # Соединения, оборванные сервером или балансировщиком, заменяются до запроса
+        'pool_pre_ping': True,
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+    }
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    _apply_pragmas(dbapi_connection)
+    # power() есть только в сборках с SQLITE_ENABLE_MATH_FUNCTIONS, а нужен
+    # для затухания в listing_scores (app.ranking)
+    dbapi_connection.create_function('power', 2, math.pow, deterministic=True)
+
+
+def _apply_pragmas(dbapi_connection):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in _pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def _route_reads(orm_execute_state):
+    replica = orm_execute_state.session.info.get(REPLICA_KEY)
+    if replica is None:
+        return
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        return
+    orm_execute_state.bind_arguments['bind'] = replica
+
+
+def configure_engine(app):
+    """Опции движка и pragmas - до init_db(); реплика - по DATABASE_REPLICA_URL"""
+    global _listeners_registered
+    url = app.config['SQLALCHEMY_DATABASE_URI']
+
+    options = engine_options(url, app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    for name in SQLITE_PRAGMAS:
+        value = app.config.get(f'SQLITE_{name.upper()}')
+        if value is not None:
+            _pragmas[name] = value
+
+    if not _listeners_registered:
+        event.listen(Engine, 'connect', _set_sqlite_pragmas)
+        event.listen(Session, 'do_orm_execute', _route_reads)
+        _listeners_registered = True
+
+    replica_url = app.config.get('DATABASE_REPLICA_URL')
+    replica = None
+    if replica_url:
+        replica = create_engine(replica_url, **engine_options(replica_url, app.config))
+    app.extensions['db_replica'] = replica
+
+
+def create_async_db_engine(app):
+    """Async-движок основной базы для ASGI-режима (нужен aiosqlite или asyncpg)"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver for database backend: {backend}')
+
+    # check_same_thread не нужен: aiosqlite держит соединение в своем потоке
+    options = engine_options(url, app.config) if backend != 'sqlite' else {}
+    engine = create_async_engine(url.set(drivername=ASYNC_DRIVERS[backend]), **options)
+    if backend == 'sqlite':
+        # Соединение aiosqlite - не sqlite3.Connection, общий слушатель его пропускает
+        event.listen(engine.sync_engine, 'connect',
+                     lambda dbapi_connection, connection_record: _apply_pragmas(dbapi_connection))
+    return engine
+
+
+def get_replica_engine(app):
+    return app.extensions.get('db_replica')
+
+
+def read_replica(view):
+    """Декоратор маршрута только для чтения: SELECT идут на реплику"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        replica = get_replica_engine(current_app)
+        if replica is None:
+            return view(*args, **kwargs)
+
+        session = db.session()
+        session.info[REPLICA_KEY] = replica
+        try:
+            return view(*args, **kwargs)
+        finally:
+            session.info.pop(REPLICA_KEY, None)
+    return wrapper
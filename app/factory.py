@@ -0,0 +1,283 @@
+"""Фабрика Flask-приложения.
+
+create_app() используется и обычным процессом (app.py), и
+serverless-функцией Vercel (api/index.py). На старте импортируются
+только модели и легкие подсистемы ленты; страницы регистрируются через
+LazyView, а клиент Bot API, модерация и формы загружаются при первом
+обращении (см. app.lazy).
+
+Схема базы (таблицы, миграции, поисковый индекс) создается шагом деплоя
+`flask init-db`. Для локального запуска AUTO_MIGRATE=1 (по умолчанию)
+выполняет тот же шаг при старте; serverless-функция его отключает, чтобы
+холодный старт не делал DDL.
+"""
+import os
+
+from flask import Flask
+
+from app.archive import archive_store
+from app.assets import assets
+from app.commands import register_commands
+from app.counters import listing_counters
+from app.db_engine import configure_engine
+from app.init_data import init_data_validator
+from app.jobs import job_queue
+from app.lazy import LazyView
+from app.live_feed import live_feed
+from app.metrics import instrumentation
+from app.models.listing import db
+from app.models.migrations import run_migrations
+from app.page_cache import page_cache
+from app.pricing import price_service
+from app.ranking import ranking_index
+from app.rate_limit import rate_limiter
+from app.search import search_engine
+from app.similarity import similarity_index
+from app.stats import platform_stats
+from app.users import user_activity
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Маршруты страниц: (правило, 'модуль.функция', методы)
+VIEWS = (
+    ('/', 'app.views.pages.index', None),
+    ('/listings/<listing_type>', 'app.views.pages.listings', None),
+    ('/create', 'app.views.create.create_listing', ['GET', 'POST']),
+    ('/listing/<int:listing_id>', 'app.views.pages.view_listing', None),
+    ('/trending', 'app.views.pages.trending', None),
+    ('/search', 'app.views.pages.search', None),
+    ('/stats', 'app.views.pages.stats', None),
+    ('/track-contact/<int:listing_id>', 'app.views.pages.track_contact', None),
+    ('/health', 'app.views.pages.health', None),
+    # Вебхук для Telegram бота
+    ('/webhook/<token>', 'app.views.bot.webhook', ['POST']),
+)
+
+# Конфигурация serverless-функции: без DDL и без фоновых потоков,
+# которые замораживаются после ответа - задачи выполняются в запросе,
+# поставившем их, а буферы счетчиков и активности сбрасываются в его конце
+SERVERLESS_CONFIG = {
+    'AUTO_MIGRATE': False,
+    'JOB_WORKERS': 0,
+    'JOB_INLINE': True,
+    'BACKGROUND_FLUSH': False,
+    # Ожидание живой ленты укладывается в лимит длительности вызова функции
+    'LIVE_FEED_POLL_SECONDS': 8,
+    'BOT_WORKERS': 0,
+    'TELEGRAM_OUTBOX_WORKERS': 0,
+    # Архивация пачками не должна выполняться в пользовательском запросе -
+    # здесь только `flask archive-run` из планировщика
+    'ARCHIVE_INTERVAL_HOURS': 0,
+}
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).lower() in ('1', 'true', 'yes')
+
+
+def load_config(app):
+    """Конфигурация из переменных окружения"""
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'beatssuda-secret-key-change-in-production')
+
+    # Путь к базе данных (папка data - только для локальной SQLite)
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        data_dir = os.path.join(BASE_DIR, 'data')
+        os.makedirs(data_dir, exist_ok=True)
+        database_url = f"sqlite:///{os.path.join(data_dir, 'beatssuda.db')}"
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Таблицы, миграции и поисковый индекс при старте (иначе - flask init-db)
+    app.config['AUTO_MIGRATE'] = _env_flag('AUTO_MIGRATE', '1')
+    # Реплика только для чтения (index, listings, search, stats)
+    app.config['DATABASE_REPLICA_URL'] = os.environ.get('DATABASE_REPLICA_URL')
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 10))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+
+    # Отложенная запись счетчиков просмотров/кликов (BACKGROUND_FLUSH=0 - сброс
+    # в конце каждого запроса вместо потока, для serverless)
+    app.config['BACKGROUND_FLUSH'] = _env_flag('BACKGROUND_FLUSH', '1')
+    app.config['COUNTER_FLUSH_INTERVAL'] = float(os.environ.get('COUNTER_FLUSH_INTERVAL', 5))
+    app.config['COUNTER_FLUSH_THRESHOLD'] = int(os.environ.get('COUNTER_FLUSH_THRESHOLD', 500))
+
+    # Тренды: полураспад популярности (секунды), вес клика по контакту и снимок в listing_scores
+    app.config['TRENDING_HALF_LIFE'] = float(os.environ.get('TRENDING_HALF_LIFE', 6 * 3600))
+    app.config['TRENDING_WEIGHTS'] = {
+        'views': 1.0,
+        'contacts_clicked': float(os.environ.get('TRENDING_CONTACT_WEIGHT', 5)),
+    }
+    app.config['TRENDING_SNAPSHOT_INTERVAL'] = float(os.environ.get('TRENDING_SNAPSHOT_INTERVAL', 60))
+
+    # Фоновые задачи: потоки в веб-процессе (0 - только отдельный `flask jobs-worker`
+    # или JOB_INLINE - выполнение в запросе, поставившем задачу)
+    app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+    app.config['JOB_INLINE'] = _env_flag('JOB_INLINE', '0')
+    # Выполненные задачи старше N часов удаляются из background_jobs
+    app.config['JOB_RETENTION_HOURS'] = float(os.environ.get('JOB_RETENTION_HOURS', 24))
+    app.config['JOB_HANDLER_MODULES'] = ['app.moderation_pipeline', 'app.archive']
+
+    # Telegram Bot API (TELEGRAM_API_URL можно направить на локальный фейковый сервер)
+    app.config['TELEGRAM_BOT_TOKEN'] = os.environ.get('TELEGRAM_BOT_TOKEN')
+    app.config['TELEGRAM_API_URL'] = os.environ.get('TELEGRAM_API_URL')
+
+    # Обработка апдейтов бота: потоки и окно дедупликации update_id
+    app.config['BOT_WORKERS'] = int(os.environ.get('BOT_WORKERS', 4))
+    app.config['BOT_DEDUP_WINDOW'] = int(os.environ.get('BOT_DEDUP_WINDOW', 3600))
+    app.config['BOT_REDIS_URL'] = os.environ.get('REDIS_URL')
+
+    # Кеш проверенных initData и отложенная запись активности в users
+    app.config['INIT_DATA_MAX_AGE'] = int(os.environ.get('INIT_DATA_MAX_AGE', 86400))
+    app.config['INIT_DATA_CACHE_TTL'] = int(os.environ.get('INIT_DATA_CACHE_TTL', 300))
+    app.config['USER_ACTIVITY_FLUSH_INTERVAL'] = float(os.environ.get('USER_ACTIVITY_FLUSH_INTERVAL', 10))
+
+    # Token bucket по пользователю Telegram или IP; квоты - '<N>/<период>'
+    app.config['RATE_LIMIT_ENABLED'] = _env_flag('RATE_LIMIT_ENABLED', '1')
+    app.config['RATE_LIMIT_BACKEND'] = os.environ.get('RATE_LIMIT_BACKEND', 'local')
+    app.config['RATE_LIMITS'] = {
+        'create_listing': os.environ.get('RATE_LIMIT_CREATE', '5/minute'),
+        'track_contact': os.environ.get('RATE_LIMIT_CONTACT', '30/minute'),
+        'webhook': os.environ.get('RATE_LIMIT_WEBHOOK', '20/minute'),
+    }
+    app.config['RATE_LIMIT_PREMIUM_FACTOR'] = float(os.environ.get('RATE_LIMIT_PREMIUM_FACTOR', 3))
+    # За прокси (Vercel) IP клиента - первый адрес X-Forwarded-For
+    app.config['RATE_LIMIT_TRUST_PROXY'] = _env_flag('RATE_LIMIT_TRUST_PROXY', '0')
+
+    # Живая лента: local - в пределах процесса, shared - между воркерами через REDIS_URL
+    app.config['LIVE_FEED_BACKEND'] = os.environ.get('LIVE_FEED_BACKEND', 'local')
+    app.config['LIVE_FEED_BUFFER'] = int(os.environ.get('LIVE_FEED_BUFFER', 100))
+    app.config['LIVE_FEED_MAX_SUBSCRIBERS'] = int(os.environ.get('LIVE_FEED_MAX_SUBSCRIBERS', 1000))
+    app.config['LIVE_FEED_MAX_STREAM_SECONDS'] = int(os.environ.get('LIVE_FEED_MAX_STREAM_SECONDS', 300))
+    # Ожидание long-poll и SSE вне ASGI-режима: все это время занят поток воркера
+    app.config['LIVE_FEED_POLL_SECONDS'] = int(os.environ.get('LIVE_FEED_POLL_SECONDS', 25))
+
+    # Кэш страниц: local - LRU в процессе, shared - общий для воркеров (REDIS_URL)
+    app.config['PAGE_CACHE_BACKEND'] = os.environ.get('PAGE_CACHE_BACKEND', 'local')
+    app.config['PAGE_CACHE_TTL'] = int(os.environ.get('PAGE_CACHE_TTL', 30))
+
+    # Кэш статики без отпечатка в адресе (секунды); с отпечатком - год, см. app.assets
+    app.config['ASSETS_MAX_AGE'] = int(os.environ.get('ASSETS_MAX_AGE', 300))
+
+    # Курсы валют для price_usd: JSON {"rates": {...}} с базой USD
+    app.config['FX_RATES_URL'] = os.environ.get('FX_RATES_URL')
+    app.config['FX_REFRESH_INTERVAL'] = int(os.environ.get('FX_REFRESH_INTERVAL', 3600))
+
+    # Токен для /api/export и /api/import (не задан - эндпоинты выключены)
+    app.config['BULK_API_TOKEN'] = os.environ.get('BULK_API_TOKEN')
+
+    # Порог похожести (оценка Жаккара), с которого объявление считается почти-дубликатом
+    app.config['SIMILARITY_THRESHOLD'] = float(os.environ.get('SIMILARITY_THRESHOLD', 0.7))
+
+    # Архив: неактивные объявления и журнал модерации старше N дней уходят
+    # в *_archive (ARCHIVE_DATABASE_PATH - отдельный файл SQLite)
+    app.config['ARCHIVE_LISTINGS_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_LISTINGS_AFTER_DAYS', 30))
+    app.config['ARCHIVE_LOGS_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_LOGS_AFTER_DAYS', 90))
+    app.config['ARCHIVE_DATABASE_PATH'] = os.environ.get('ARCHIVE_DATABASE_PATH')
+    app.config['ARCHIVE_BATCH_SIZE'] = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+    app.config['ARCHIVE_VACUUM_PAGES'] = int(os.environ.get('ARCHIVE_VACUUM_PAGES', 2000))
+    # Период задачи archive_stale (0 - только `flask archive-run`)
+    app.config['ARCHIVE_INTERVAL_HOURS'] = float(os.environ.get('ARCHIVE_INTERVAL_HOURS', 24))
+
+    # Время жизни снимка статистики (секунды)
+    app.config['STATS_CACHE_TTL'] = int(os.environ.get('STATS_CACHE_TTL', 60))
+
+    # Метрики на /metrics (METRICS_TOKEN - Bearer-токен для сборщика);
+    # профилировщик по заголовку X-Profile - только локально
+    app.config['METRICS_ENABLED'] = _env_flag('METRICS_ENABLED', '0')
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    app.config['METRICS_QUERY_WARN'] = int(os.environ.get('METRICS_QUERY_WARN', 30))
+    app.config['METRICS_PROFILING'] = _env_flag('METRICS_PROFILING', '0')
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(BASE_DIR, 'data', 'profiles'))
+
+
+def init_schema(app):
+    """Таблицы, миграции, поисковый индекс, индекс похожести и архив; возвращает примененные миграции"""
+    with app.app_context():
+        db.create_all()
+    applied = run_migrations(app)
+    with app.app_context():
+        search_engine.create_schema()
+        similarity_index.create_schema()
+        archive_store.create_schema()
+        archive_store.schedule()
+    return applied
+
+
+def register_views(app):
+    """Маршруты страниц; модули представлений импортируются при первом запросе"""
+    for rule, import_name, methods in VIEWS:
+        app.add_url_rule(rule, view_func=LazyView(import_name), methods=methods)
+
+    app.register_error_handler(404, LazyView('app.views.pages.not_found'))
+    app.register_error_handler(500, LazyView('app.views.pages.server_error'))
+    app.context_processor(LazyView('app.views.pages.inject_globals'))
+
+    # API blueprint: модули маршрутов импортируют тяжелые зависимости лениво
+    from app.api.routes import api_bp
+    from app.api import feed, live, stats, users, bulk, archive  # noqa: F401 - регистрируют маршруты в api_bp
+    app.register_blueprint(api_bp)
+
+
+def create_app(config=None):
+    """Создание и настройка Flask приложения"""
+    app = Flask(__name__,
+                template_folder='templates',
+                static_folder='static')
+
+    # Конфигурация
+    load_config(app)
+    if config:
+        app.config.update(config)
+
+    # Замеры запросов и SQL - до первого соединения и первого маршрута
+    instrumentation.init_app(app)
+
+    # Инициализация базы данных (pragmas SQLite и пул - до первого соединения)
+    configure_engine(app)
+    # Файл архива подключается (ATTACH) к каждому новому соединению
+    archive_store.init_app(app)
+    db.init_app(app)
+    if app.config['AUTO_MIGRATE']:
+        init_schema(app)
+
+    # Нормализация цен
+    price_service.init_app(app)
+
+    # Поисковый индекс (только подписка на изменения, таблицы - init_schema)
+    search_engine.init_app(app)
+
+    # Индекс почти-дубликатов для модерации
+    similarity_index.init_app(app)
+
+    # Буфер счетчиков
+    listing_counters.init_app(app)
+
+    # Популярность (из приращений счетчиков) и похожие объявления
+    ranking_index.init_app(app)
+
+    # Снимок статистики
+    platform_stats.init_app(app)
+
+    # Кэш отрендеренных страниц лент
+    page_cache.init_app(app)
+
+    # Очередь фоновых задач
+    job_queue.init_app(app)
+
+    # Авторизация Telegram Web App и активность пользователей
+    # (клиент Bot API и диспетчер бота - при первом апдейте, см. app.lazy)
+    init_data_validator.init_app(app)
+    user_activity.init_app(app)
+
+    # Живая лента (SSE) опубликованных объявлений
+    live_feed.init_app(app)
+
+    # Квоты создания объявлений, кликов по контактам и апдейтов бота
+    rate_limiter.init_app(app)
+
+    register_views(app)
+    register_commands(app)
+
+    # Статика с отпечатками из `flask build-assets` (подменяет обработчик /static)
+    assets.init_app(app)
+
+    return app
@@ -0,0 +1,141 @@
+"""Проверка initData Telegram Web App с кешем результатов.
+
+Секретный ключ HMAC-SHA256("WebAppData", bot_token) вычисляется один раз
+при инициализации, а уже проверенные подписи хранятся в ограниченном
+кеше (не дольше INIT_DATA_CACHE_TTL и не позже auth_date +
+INIT_DATA_MAX_AGE). Повторный запрос с тем же заголовком не разбирает
+его и не пересчитывает подпись.
+
+Заголовки не в формате initData (без поля hash) проверяются прежним
+validate_telegram_user_header(), результат кешируется по TTL.
+"""
+import hashlib
+import hmac
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import parse_qsl
+
+from flask import g, jsonify, request
+
+from app.telegram_auth import validate_telegram_user_header
+from app.users import user_activity
+
+USER_HEADER = 'X-Telegram-User'
+
+
+def derive_secret_key(bot_token):
+    """Ключ подписи initData для токена бота"""
+    return hmac.new(b'WebAppData', bot_token.encode('utf-8'), hashlib.sha256).digest()
+
+
+class InitDataValidator:
+    """Проверка initData с предвычисленным ключом и кешем подписей"""
+
+    def __init__(self, maxsize=10000, max_age=86400, cache_ttl=300):
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self.cache_ttl = cache_ttl
+        self._secret_key = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Вычисляет ключ из TELEGRAM_BOT_TOKEN и читает лимиты кеша"""
+        self.max_age = app.config.get('INIT_DATA_MAX_AGE', self.max_age)
+        self.cache_ttl = app.config.get('INIT_DATA_CACHE_TTL', self.cache_ttl)
+        # Без TELEGRAM_BOT_TOKEN ключ берется из клиента Bot API при первой проверке
+        token = app.config.get('TELEGRAM_BOT_TOKEN')
+        if token:
+            self.set_token(token)
+        app.extensions['init_data_validator'] = self
+
+    def set_token(self, bot_token):
+        self._secret_key = derive_secret_key(bot_token)
+        with self._lock:
+            self._cache.clear()
+
+    def validate(self, header):
+        """(is_valid, user_data | сообщение об ошибке) - как validate_telegram_user_header"""
+        # Заголовок целиком содержит hash, поэтому сам служит ключом кеша
+        cached = self._cache_get(header)
+        if cached is not None:
+            return True, cached
+
+        fields = dict(parse_qsl(header, keep_blank_values=True))
+        received_hash = fields.pop('hash', None)
+        if received_hash is None:
+            is_valid, user_data = validate_telegram_user_header(header)
+            if is_valid:
+                self._cache_put(header, user_data, time.time() + self.cache_ttl)
+            return is_valid, user_data
+
+        try:
+            auth_date = int(fields.get('auth_date', 0))
+        except ValueError:
+            return False, 'Некорректный auth_date'
+        expires_at = auth_date + self.max_age
+        if expires_at <= time.time():
+            return False, 'Данные авторизации устарели'
+
+        data_check_string = '\n'.join(f'{key}={fields[key]}' for key in sorted(fields))
+        if self._secret_key is None:
+            from app.telegram_client import telegram_client
+            self._secret_key = derive_secret_key(telegram_client.require_token())
+        expected = hmac.new(self._secret_key, data_check_string.encode('utf-8'), hashlib.sha256).hexdigest()
+        # compare_digest на str падает с TypeError на не-ASCII - сравниваем байты
+        if not hmac.compare_digest(expected.encode('ascii'), received_hash.encode('utf-8')):
+            return False, 'Неверная подпись данных'
+
+        try:
+            user_data = json.loads(fields.get('user') or '{}')
+        except ValueError:
+            return False, 'Некорректные данные пользователя'
+
+        self._cache_put(header, user_data, expires_at)
+        return True, user_data
+
+    def _cache_get(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            user_data, expires_at = entry
+            if expires_at <= time.time():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return user_data
+
+    def _cache_put(self, key, user_data, expires_at):
+        expires_at = min(expires_at, time.time() + self.cache_ttl)
+        with self._lock:
+            self._cache[key] = (user_data, expires_at)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+
+def telegram_user_required(view):
+    """Декоратор API-маршрута: проверенный пользователь в g.telegram_user"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        header = request.headers.get(USER_HEADER)
+        if not header:
+            return jsonify({'success': False, 'error': 'Требуется авторизация Telegram'}), 401
+
+        is_valid, user_data = init_data_validator.validate(header)
+        if not is_valid:
+            return jsonify({'success': False, 'error': user_data}), 401
+
+        g.telegram_user = user_data
+        if isinstance(user_data, dict):
+            user_activity.touch(user_data)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# Глобальный валидатор initData
+init_data_validator = InitDataValidator()
@@ -0,0 +1,295 @@
+"""Фоновая очередь задач с хранением в таблице background_jobs.
+
+Задачи ставятся в той же транзакции, что и основные данные (например,
+вместе с новым объявлением), поэтому после рестарта ничего не теряется:
+воркеры при старте и затем раз в минуту возвращают в очередь задачи с
+истекшей арендой и удаляют выполненные задачи старше JOB_RETENTION_HOURS
+(упавшие остаются для разбора).
+Воркеры - потоки внутри веб-процесса (JOB_WORKERS) или отдельный
+процесс `flask jobs-worker`. Serverless-функции негде держать воркер,
+поэтому там JOB_INLINE=1: готовые задачи выполняются в том же запросе
+сразу после коммита (notify), а отложенные повторы - при следующем.
+
+Модули с обработчиками (JOB_HANDLER_MODULES) импортируются при старте
+воркеров или при первой постановке задачи, а не вместе с приложением.
+"""
+import atexit
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from importlib import import_module
+
+import sqlalchemy as sa
+
+from app.models.listing import db
+
+logger = logging.getLogger(__name__)
+
+jobs_metadata = sa.MetaData()
+
+jobs_table = sa.Table(
+    'background_jobs', jobs_metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('kind', sa.String(50), nullable=False),
+    sa.Column('payload', sa.Text, nullable=False, default='{}'),
+    sa.Column('status', sa.String(20), nullable=False, default='pending'),
+    sa.Column('attempts', sa.Integer, nullable=False, default=0),
+    sa.Column('run_after', sa.DateTime, nullable=False),
+    sa.Column('locked_until', sa.DateTime),
+    sa.Column('last_error', sa.Text),
+    sa.Column('created_at', sa.DateTime, nullable=False),
+    sa.Column('updated_at', sa.DateTime, nullable=False),
+    sa.Index('ix_background_jobs_claim', 'status', 'run_after'),
+)
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Как часто воркеры ищут задачи с истекшей арендой и чистят выполненные (секунды)
+RELEASE_INTERVAL = 60
+# Сколько выполненных задач удалять за один раз
+PURGE_BATCH = 1000
+
+
+class JobQueue:
+    """Очередь задач поверх таблицы с пулом потоков-воркеров"""
+
+    def __init__(self):
+        self.app = None
+        self.handlers = {}
+        self.handler_modules = ()
+        self.max_attempts = 5
+        self.lease_seconds = 300
+        self.poll_interval = 2.0
+        self.retention = timedelta(hours=24)
+        self.inline = False
+        self.inline_limit = 10
+        self._released_at = 0.0
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+    def init_app(self, app):
+        """Запускает JOB_WORKERS потоков-воркеров (0 - только постановка задач)"""
+        self.app = app
+        self.max_attempts = app.config.get('JOB_MAX_ATTEMPTS', 5)
+        self.lease_seconds = app.config.get('JOB_LEASE_SECONDS', 300)
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', 2.0)
+        self.handler_modules = tuple(app.config.get('JOB_HANDLER_MODULES', ()))
+        self.retention = timedelta(hours=app.config.get('JOB_RETENTION_HOURS', 24))
+        self.inline = app.config.get('JOB_INLINE', False)
+        self.inline_limit = app.config.get('JOB_INLINE_LIMIT', self.inline_limit)
+        app.extensions['job_queue'] = self
+
+        workers = app.config.get('JOB_WORKERS', 2)
+        if workers and not self._threads:
+            self.start(workers)
+
+    def handler(self, kind):
+        """Декоратор: регистрирует обработчик задач вида kind"""
+        def decorator(func):
+            self.handlers[kind] = func
+            return func
+        return decorator
+
+    def enqueue(self, kind, payload=None, delay=0, session=None):
+        """Ставит задачу в текущей транзакции сессии (commit - за вызывающим)"""
+        if kind not in self.handlers:
+            self.load_handlers()
+        if kind not in self.handlers:
+            raise ValueError(f'No handler registered for job kind: {kind}')
+        now = datetime.utcnow()
+        session = session or db.session
+        session.execute(jobs_table.insert().values(
+            kind=kind,
+            payload=json.dumps(payload or {}, ensure_ascii=False),
+            status=PENDING,
+            attempts=0,
+            run_after=now + timedelta(seconds=delay),
+            created_at=now,
+            updated_at=now
+        ))
+
+    def load_handlers(self):
+        """Импортирует модули, регистрирующие обработчики (JOB_HANDLER_MODULES)"""
+        for module_name in self.handler_modules:
+            import_module(module_name)
+
+    def notify(self):
+        """Будит воркеры сразу после коммита новой задачи (JOB_INLINE - выполняет ее сам)"""
+        if self.inline:
+            self.run_pending(self.inline_limit)
+            return
+        self._wakeup.set()
+
+    def run_pending(self, limit=None):
+        """Выполняет готовые задачи в текущем потоке; возвращает их число"""
+        self.load_handlers()
+        done = 0
+        while limit is None or done < limit:
+            try:
+                if not self.run_once():
+                    break
+            except Exception:
+                # Ошибка самой очереди не должна ронять запрос, поставивший задачу
+                logger.exception("Inline job run failed")
+                break
+            done += 1
+        return done
+
+    # ------------------------------------------------------------------
+    # Воркеры
+    # ------------------------------------------------------------------
+
+    def start(self, workers):
+        self.load_handlers()
+        self._release_expired()
+        self._stopped.clear()
+        for number in range(workers):
+            thread = threading.Thread(
+                target=self._worker_loop,
+                name=f'job-worker-{number}',
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=self.poll_interval + 5)
+        self._threads = []
+
+    def run_forever(self):
+        """Цикл отдельного процесса-воркера (flask jobs-worker)"""
+        self.load_handlers()
+        self._release_expired()
+        while not self._stopped.is_set():
+            if not self.run_once():
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def run_once(self):
+        """Выполняет одну задачу; False если очередь пуста"""
+        with self.app.app_context():
+            # Задачи упавшего воркера возвращаются в очередь без рестарта живых
+            if time.monotonic() - self._released_at > min(self.lease_seconds, RELEASE_INTERVAL):
+                self._release_expired()
+                self.purge_done()
+            job = self._claim()
+            if job is None:
+                return False
+            self._execute(job)
+            return True
+
+    def _worker_loop(self):
+        while not self._stopped.is_set():
+            try:
+                worked = self.run_once()
+            except Exception:
+                logger.exception("Job worker crashed while polling")
+                worked = False
+            if not worked:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _claim(self):
+        """Захватывает одну готовую задачу условным UPDATE (безопасно для нескольких процессов)"""
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            candidate = conn.execute(
+                sa.select(jobs_table.c.id)
+                .where(jobs_table.c.status == PENDING, jobs_table.c.run_after <= now)
+                .order_by(jobs_table.c.run_after, jobs_table.c.id)
+                .limit(1)
+            ).scalar()
+            if candidate is None:
+                return None
+
+            claimed = conn.execute(
+                jobs_table.update()
+                .where(jobs_table.c.id == candidate, jobs_table.c.status == PENDING)
+                .values(
+                    status=RUNNING,
+                    attempts=jobs_table.c.attempts + 1,
+                    locked_until=now + timedelta(seconds=self.lease_seconds),
+                    updated_at=now
+                )
+            ).rowcount
+            if claimed != 1:
+                # Задачу перехватил другой воркер
+                return None
+
+            return conn.execute(
+                sa.select(jobs_table).where(jobs_table.c.id == candidate)
+            ).first()
+
+    def _execute(self, job):
+        handler = self.handlers.get(job.kind)
+        try:
+            if handler is None:
+                raise LookupError(f'No handler for job kind: {job.kind}')
+            handler(json.loads(job.payload or '{}'))
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Job {job.id} ({job.kind}) failed")
+            self._finish(job, error=e)
+        else:
+            self._finish(job)
+        finally:
+            db.session.remove()
+
+    def _finish(self, job, error=None):
+        now = datetime.utcnow()
+        values = {'locked_until': None, 'updated_at': now}
+        if error is None:
+            values.update(status=DONE, last_error=None)
+        elif job.attempts >= self.max_attempts:
+            values.update(status=FAILED, last_error=str(error))
+        else:
+            # Экспоненциальная задержка перед повтором: 2, 4, 8... секунд
+            values.update(
+                status=PENDING,
+                last_error=str(error),
+                run_after=now + timedelta(seconds=2 ** job.attempts)
+            )
+        with db.engine.begin() as conn:
+            conn.execute(jobs_table.update().where(jobs_table.c.id == job.id).values(**values))
+
+    def purge_done(self, limit=PURGE_BATCH):
+        """Удаляет выполненные задачи старше срока хранения; возвращает их число"""
+        cutoff = datetime.utcnow() - self.retention
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                # Пачкой по id, чтобы не держать блокировку на всю таблицу
+                ids = sa.select(jobs_table.c.id).where(
+                    jobs_table.c.status == DONE,
+                    jobs_table.c.updated_at < cutoff
+                ).limit(limit).scalar_subquery()
+                return conn.execute(jobs_table.delete().where(jobs_table.c.id.in_(ids))).rowcount
+
+    def _release_expired(self):
+        """Возвращает в очередь задачи, чьи воркеры умерли, не закончив"""
+        self._released_at = time.monotonic()
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                released = conn.execute(
+                    jobs_table.update()
+                    .where(
+                        jobs_table.c.status == RUNNING,
+                        jobs_table.c.locked_until < datetime.utcnow()
+                    )
+                    .values(status=PENDING, locked_until=None)
+                ).rowcount
+        if released:
+            logger.info(f"Released {released} expired background jobs")
+
+
+# Глобальная очередь задач
+job_queue = JobQueue()
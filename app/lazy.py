@@ -0,0 +1,57 @@
+"""Ленивая загрузка представлений и расширений.
+
+Холодный старт serverless-функции платит за каждый импорт, поэтому
+фабрика регистрирует маршруты страниц через LazyView: модуль с
+представлением (и его зависимости - формы, модерация) импортируется при
+первом запросе к маршруту. Расширения, которым нужны тяжелые клиенты
+(Telegram Bot API поверх requests), получаются через extension(name) -
+модуль импортируется и init_app() вызывается при первом обращении.
+"""
+import threading
+from importlib import import_module
+
+from flask import current_app
+from werkzeug.utils import import_string
+
+# Расширения, инициализируемые при первом обращении: имя -> 'модуль:объект'
+LAZY_EXTENSIONS = {
+    'telegram_client': 'app.telegram_client:telegram_client',
+    'telegram_outbox': 'app.telegram_client:telegram_outbox',
+    'bot_dispatcher': 'app.bot:bot_dispatcher',
+}
+
+_lock = threading.Lock()
+
+
+class LazyView:
+    """Представление, импортируемое при первом вызове ('app.views.pages.index')"""
+
+    def __init__(self, import_name):
+        self.__module__, self.__name__ = import_name.rsplit('.', 1)
+        self.import_name = import_name
+        self._view = None
+
+    @property
+    def view(self):
+        if self._view is None:
+            self._view = import_string(self.import_name)
+        return self._view
+
+    def __call__(self, *args, **kwargs):
+        return self.view(*args, **kwargs)
+
+
+def extension(name, app=None):
+    """Расширение приложения; при первом обращении - импорт и init_app()"""
+    app = app or current_app._get_current_object()
+    instance = app.extensions.get(name)
+    if instance is not None:
+        return instance
+
+    with _lock:
+        instance = app.extensions.get(name)
+        if instance is None:
+            module_name, attr = LAZY_EXTENSIONS[name].split(':')
+            instance = getattr(import_module(module_name), attr)
+            instance.init_app(app)
+    return instance
@@ -0,0 +1,290 @@
+"""Живая лента: публикация объявлений, ставших видимыми, подписчикам SSE.
+
+Когда объявление становится активным и промодерированным (фоновая
+модерация, создание сразу опубликованного объявления), ORM-слушатель
+запоминает его карточку в сессии, а после коммита она публикуется в
+шину. Откат транзакции публикацию отменяет.
+
+Шина - подписчики в памяти процесса с фильтрами по listing_type/genre и
+ограниченным буфером: медленный клиент теряет старые события и получает
+пометку lagged, а не копит память. Простаивающий подписчик - это только
+буфер и Event, без запросов к базе.
+
+LIVE_FEED_BACKEND=local раздает события только внутри процесса. В режиме
+shared события пишутся в общее хранилище (Redis по REDIS_URL или
+LocalStore) под возрастающими номерами, а поток-опросчик каждого
+воркера, пока у него есть подписчики, забирает новые номера и раздает их
+своим подписчикам.
+
+Соединение SSE в WSGI-режиме занимает поток воркера, поэтому там поток
+закрывается после первой пачки событий или через LIVE_FEED_POLL_SECONDS
+(EventSource переподключается с Last-Event-ID) - по сути long-poll. Для
+тысяч открытых соединений нужен ASGI-режим (app.asgi): там подписчик
+ждет в цикле событий и держит поток до LIVE_FEED_MAX_STREAM_SECONDS.
+"""
+import asyncio
+import atexit
+import json
+import threading
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.api.feed import serialize_listing
+from app.counters import PeriodicFlusher
+from app.metrics import instrumentation
+from app.models.listing import db, Listing
+from app.shared_store import get_shared_store
+
+subscribers_gauge = instrumentation.registry.gauge(
+    'live_feed_subscribers', 'Подписчики живой ленты в процессе')
+
+
+class Subscriber:
+    """Подписка с фильтрами и ограниченным буфером событий"""
+
+    __slots__ = ('listing_type', 'genre', 'events', 'lagged', '_wakeup', '_loop', '_async_wakeup')
+
+    def __init__(self, listing_type=None, genre=None, maxsize=100):
+        self.listing_type = listing_type or None
+        self.genre = genre or None
+        self.events = deque(maxlen=maxsize)
+        self.lagged = False
+        self._wakeup = threading.Event()
+        self._loop = None
+        self._async_wakeup = None
+
+    def bind_loop(self, loop):
+        """Будить корутину в цикле loop (wait_async), а не поток"""
+        self._async_wakeup = asyncio.Event()
+        self._loop = loop
+
+    def matches(self, item):
+        listing = item['listing']
+        return ((self.listing_type is None or listing.get('listing_type') == self.listing_type)
+                and (self.genre is None or listing.get('genre') == self.genre))
+
+    def push(self, item):
+        if len(self.events) == self.events.maxlen:
+            # Старое событие вытесняется - клиенту стоит перечитать ленту
+            self.lagged = True
+        self.events.append(item)
+        self._wakeup.set()
+        if self._loop is not None:
+            # Публикация приходит из потока, закоммитившего объявление
+            try:
+                self._loop.call_soon_threadsafe(self._async_wakeup.set)
+            except RuntimeError:
+                # Цикл уже остановлен
+                pass
+
+    def wait(self, timeout):
+        """Накопленные события; ждет не дольше timeout, если их нет"""
+        if not self.events:
+            self._wakeup.wait(timeout)
+        self._wakeup.clear()
+        return self._drain()
+
+    async def wait_async(self, timeout):
+        """Как wait, но в цикле событий (после bind_loop)"""
+        if not self.events:
+            try:
+                await asyncio.wait_for(self._async_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._async_wakeup.clear()
+        return self._drain()
+
+    def _drain(self):
+        items = []
+        while self.events:
+            items.append(self.events.popleft())
+        return items
+
+
+class LiveFeed:
+    """Шина публикаций с раздачей между воркерами через общее хранилище"""
+
+    PENDING_KEY = 'live_feed_pending'
+    SEQ_KEY = 'livefeed:seq'
+    EVENT_KEY = 'livefeed:event:{}'
+
+    def __init__(self):
+        self.shared = False
+        self.store = None
+        self.buffer_size = 100
+        self.max_subscribers = 1000
+        self.retention = 300
+        self.poll_interval = 1.0
+        self.heartbeat = 15
+        self.max_stream_seconds = 300
+        self.poll_seconds = 25
+        self._subscribers = set()
+        self._recent = deque(maxlen=500)
+        self._seq = 0
+        self._last_seen = 0
+        self._lock = threading.Lock()
+        self._poller = None
+        self._listeners_registered = False
+
+    def init_app(self, app):
+        """Бэкенд (LIVE_FEED_BACKEND), размеры буферов и подписка на изменения"""
+        self.shared = app.config.get('LIVE_FEED_BACKEND', 'local') == 'shared'
+        self.store = get_shared_store(app.config.get('LIVE_FEED_REDIS_URL'))
+        self.buffer_size = app.config.get('LIVE_FEED_BUFFER', self.buffer_size)
+        self.max_subscribers = app.config.get('LIVE_FEED_MAX_SUBSCRIBERS', self.max_subscribers)
+        self.retention = app.config.get('LIVE_FEED_RETENTION', self.retention)
+        self.poll_interval = app.config.get('LIVE_FEED_POLL_INTERVAL', self.poll_interval)
+        self.heartbeat = app.config.get('LIVE_FEED_HEARTBEAT', self.heartbeat)
+        self.max_stream_seconds = app.config.get('LIVE_FEED_MAX_STREAM_SECONDS', self.max_stream_seconds)
+        self.poll_seconds = app.config.get('LIVE_FEED_POLL_SECONDS', self.poll_seconds)
+
+        if not self._listeners_registered:
+            event.listen(Listing, 'after_insert', self._on_insert)
+            event.listen(Listing, 'after_update', self._on_update)
+            event.listen(Session, 'after_commit', self._on_commit)
+            event.listen(Session, 'after_rollback', self._on_rollback)
+            self._listeners_registered = True
+
+        app.extensions['live_feed'] = self
+
+    # ------------------------------------------------------------------
+    # Публикация
+    # ------------------------------------------------------------------
+
+    def publish(self, listing):
+        """Публикует карточку объявления (dict из serialize_listing)"""
+        if self.shared:
+            seq = self.store.incr(self.SEQ_KEY)
+            self.store.set(self.EVENT_KEY.format(seq),
+                           json.dumps({'id': seq, 'listing': listing}, ensure_ascii=False),
+                           ex=self.retention)
+            if self._poller is not None:
+                self._poller.wake()
+            return seq
+
+        with self._lock:
+            self._seq += 1
+            item = {'id': self._seq, 'listing': listing}
+        self._dispatch(item)
+        return item['id']
+
+    def last_id(self):
+        """Номер последнего опубликованного события"""
+        if self.shared:
+            return int(self.store.get(self.SEQ_KEY) or 0)
+        return self._seq
+
+    def _dispatch(self, item):
+        with self._lock:
+            self._recent.append(item)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if subscriber.matches(item):
+                subscriber.push(item)
+
+    def _poll(self):
+        """Забирает из общего хранилища события, опубликованные любым воркером"""
+        current = self.last_id()
+        if not self._subscribers:
+            self._last_seen = current
+            return
+        start = max(self._last_seen + 1, current - self._recent.maxlen + 1)
+        for item in self._load(start, current):
+            self._dispatch(item)
+        self._last_seen = current
+
+    def _load(self, start, end):
+        items = []
+        for seq in range(start, end + 1):
+            value = self.store.get(self.EVENT_KEY.format(seq))
+            if value is not None:
+                items.append(json.loads(value))
+        return items
+
+    def _on_insert(self, mapper, connection, target):
+        if target.is_active and target.is_moderated:
+            self._remember(target)
+
+    def _on_update(self, mapper, connection, target):
+        state = db.inspect(target)
+        became_visible = any(
+            state.attrs[field].history.has_changes() for field in ('is_moderated', 'is_active')
+        )
+        if became_visible and target.is_active and target.is_moderated:
+            self._remember(target)
+
+    def _remember(self, target):
+        # Карточку снимаем до коммита: после него атрибуты истекают
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault(self.PENDING_KEY, []).append(serialize_listing(target))
+
+    def _on_commit(self, session):
+        for listing in session.info.pop(self.PENDING_KEY, ()):
+            self.publish(listing)
+
+    def _on_rollback(self, session):
+        session.info.pop(self.PENDING_KEY, None)
+
+    # ------------------------------------------------------------------
+    # Подписка
+    # ------------------------------------------------------------------
+
+    def subscribe(self, listing_type=None, genre=None, last_id=None):
+        """Новый подписчик или None, если процесс уже обслуживает максимум
+
+        last_id - номер последнего полученного события (Last-Event-ID):
+        пропущенные с тех пор события, если они еще хранятся, попадают
+        в буфер сразу.
+        """
+        subscriber = Subscriber(listing_type, genre, self.buffer_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            if self.shared and not self._subscribers:
+                # Опросчик не должен отдавать новым подписчикам старые события
+                self._last_seen = self.last_id()
+            self._subscribers.add(subscriber)
+            subscribers_gauge.set(len(self._subscribers))
+
+        if self.shared:
+            self._start_poller()
+
+        if last_id is not None:
+            if last_id > self.last_id():
+                # Нумерация началась заново (рестарт процесса) - отдаем все, что хранится
+                last_id = 0
+            for item in self._missed(last_id):
+                if subscriber.matches(item):
+                    subscriber.push(item)
+            subscriber.lagged = False
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            subscribers_gauge.set(len(self._subscribers))
+
+    def _missed(self, last_id):
+        if self.shared:
+            current = self.last_id()
+            start = max(last_id + 1, current - self.buffer_size + 1)
+            return self._load(start, min(current, self._last_seen))
+        with self._lock:
+            return [item for item in self._recent if item['id'] > last_id]
+
+    def _start_poller(self):
+        with self._lock:
+            if self._poller is None:
+                self._poller = PeriodicFlusher(self._poll, self.poll_interval, 'live-feed-poller').start()
+                atexit.register(self.shutdown)
+
+    def shutdown(self):
+        if self._poller is not None:
+            self._poller.stop()
+
+
+# Глобальная шина живой ленты
+live_feed = LiveFeed()
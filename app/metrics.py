@@ -0,0 +1,395 @@
+"""Метрики запросов, SQL и горячих участков в формате Prometheus.
+
+Instrumentation замеряет каждый запрос (время, статус, маршрут), считает
+SQL-запросы и их суммарное время на запрос - шаблон, который в цикле
+лениво догружает связи (N+1), виден как всплеск db_queries_per_request
+у своего эндпоинта и предупреждение в логе. span() замеряет отдельные
+участки: модерацию, вызовы Bot API, проверку превью.
+
+Метрики хранятся в памяти процесса и отдаются на /metrics в текстовом
+формате Prometheus; при нескольких воркерах каждый отдает свои значения.
+Эндпоинт выключен по умолчанию (METRICS_ENABLED=1 включает); с
+METRICS_TOKEN он требует заголовок Authorization: Bearer <токен>.
+
+Выборочный профилировщик (METRICS_PROFILING=1) включается на один запрос
+заголовком X-Profile: поток снимает стек обработчика раз в
+PROFILE_INTERVAL секунд и сохраняет свернутые стеки (формат flamegraph /
+speedscope) в PROFILE_DIR.
+"""
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import Response, abort, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм по умолчанию (секунды) - как в клиентах Prometheus
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+PROFILE_HEADER = 'X-Profile'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Метрика с набором меток; значения - по кортежу значений меток"""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self):
+        """[(суффикс, значения меток, доп. метка, значение)]"""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.type}',
+        ]
+        for suffix, values, extra, value in self.samples():
+            labels = _format_labels(self.labelnames, values, extra)
+            lines.append(f'{self.name}{suffix}{labels} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [('_total', key, None, value) for key, value in items]
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [('', key, None, value) for key, value in items]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Счетчики по корзинам (не накопительные), сумма, количество
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total, count))
+                           for key, (counts, total, count) in self._values.items())
+        samples = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', key, ('le', _format_value(float(bound))), cumulative))
+            samples.append(('_bucket', key, ('le', '+Inf'), count))
+            samples.append(('_sum', key, None, total))
+            samples.append(('_count', key, None, count))
+        return samples
+
+
+class MetricsRegistry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+class SamplingProfiler:
+    """Снимает стек одного потока по таймеру и считает свернутые стеки"""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = StackCounter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        return self
+
+    @property
+    def samples(self):
+        return sum(self.stacks.values())
+
+    def folded(self):
+        """Стеки в свернутом формате: 'корень;...;лист количество'"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+
+
+class Instrumentation:
+    """Таймеры запросов, счетчики SQL, спаны и эндпоинт /metrics"""
+
+    def __init__(self):
+        self.registry = MetricsRegistry()
+        self.query_warn_threshold = 30
+        self.profiling = False
+        self.profile_dir = None
+        self.profile_interval = 0.005
+        self.token = None
+        self._listeners_registered = False
+
+        self.requests = self.registry.counter(
+            'http_requests', 'HTTP-запросы по эндпоинту, методу и статусу',
+            ('endpoint', 'method', 'status'))
+        self.request_duration = self.registry.histogram(
+            'http_request_duration_seconds', 'Время обработки запроса',
+            ('endpoint', 'method'))
+        self.request_queries = self.registry.histogram(
+            'db_queries_per_request', 'SQL-запросов за один HTTP-запрос',
+            ('endpoint',), buckets=QUERY_COUNT_BUCKETS)
+        self.request_db_time = self.registry.histogram(
+            'db_time_per_request_seconds', 'Суммарное время SQL за один HTTP-запрос',
+            ('endpoint',))
+        self.query_duration = self.registry.histogram(
+            'db_query_duration_seconds', 'Время одного SQL-запроса')
+        self.span_duration = self.registry.histogram(
+            'span_duration_seconds', 'Время участков кода (модерация, Bot API)',
+            ('span',))
+        self.span_errors = self.registry.counter(
+            'span_errors', 'Участки кода, завершившиеся исключением',
+            ('span',))
+
+    def init_app(self, app):
+        """Подключает замеры запросов и SQL; /metrics - при METRICS_ENABLED"""
+        self.query_warn_threshold = app.config.get('METRICS_QUERY_WARN', self.query_warn_threshold)
+        self.profiling = app.config.get('METRICS_PROFILING', False)
+        self.profile_dir = app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+        self.profile_interval = app.config.get('PROFILE_INTERVAL', self.profile_interval)
+        self.token = app.config.get('METRICS_TOKEN')
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+        if not self._listeners_registered:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(Engine, 'handle_error', self._handle_error)
+            self._listeners_registered = True
+
+        if app.config.get('METRICS_ENABLED', False):
+            app.add_url_rule('/metrics', 'metrics', self._metrics_view)
+
+        app.extensions['instrumentation'] = self
+
+    # ------------------------------------------------------------------
+    # Спаны
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def span(self, name):
+        """Замеряет участок кода: with instrumentation.span('moderation'): ..."""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.span_errors.inc(span=name)
+            raise
+        finally:
+            self.span_duration.observe(time.perf_counter() - started, span=name)
+
+    def timed(self, name):
+        """Декоратор-вариант span()"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # ------------------------------------------------------------------
+    # Запросы
+    # ------------------------------------------------------------------
+
+    def _before_request(self):
+        g._metrics_started = time.perf_counter()
+        g._metrics_queries = 0
+        g._metrics_db_time = 0.0
+        if self.profiling and request.headers.get(PROFILE_HEADER):
+            g._metrics_profiler = SamplingProfiler(
+                threading.get_ident(), self.profile_interval
+            ).start()
+
+    def _after_request(self, response):
+        started = g.pop('_metrics_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        # Несуществующие URL - одной меткой, иначе сканеры раздувают метрики
+        endpoint = request.endpoint or 'unmatched'
+        if endpoint == 'metrics':
+            return response
+
+        self.requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        self.request_duration.observe(elapsed, endpoint=endpoint, method=request.method)
+
+        queries = g.pop('_metrics_queries', 0)
+        db_time = g.pop('_metrics_db_time', 0.0)
+        self.request_queries.observe(queries, endpoint=endpoint)
+        self.request_db_time.observe(db_time, endpoint=endpoint)
+        if queries > self.query_warn_threshold:
+            logger.warning(f"{request.method} {request.path}: {queries} SQL queries "
+                           f"({db_time * 1000:.1f} ms) - possible N+1")
+
+        profiler = g.pop('_metrics_profiler', None)
+        if profiler is not None:
+            response.headers.update(self._save_profile(profiler.stop(), endpoint))
+
+        response.headers['Server-Timing'] = (
+            f'app;dur={elapsed * 1000:.1f}, db;dur={db_time * 1000:.1f};desc="{queries} queries"'
+        )
+        return response
+
+    def _save_profile(self, profiler, endpoint):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{endpoint}.folded')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(profiler.folded())
+        # Путь на сервере клиенту не нужен - только имя файла в PROFILE_DIR
+        return {'X-Profile-Samples': str(profiler.samples), 'X-Profile-File': os.path.basename(path)}
+
+    def _metrics_view(self):
+        if self.token:
+            provided = request.headers.get('Authorization', '')
+            if not hmac.compare_digest(provided.encode('utf-8'), f'Bearer {self.token}'.encode('utf-8')):
+                abort(403)
+        return Response(self.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    # ------------------------------------------------------------------
+    # SQL
+    # ------------------------------------------------------------------
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrics_query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('_metrics_query_started')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        self.query_duration.observe(elapsed)
+        if has_request_context() and '_metrics_queries' in g:
+            g._metrics_queries += 1
+            g._metrics_db_time += elapsed
+
+    def _handle_error(self, exception_context):
+        # after_cursor_execute не вызывается для упавшего запроса - иначе
+        # следующие замеры соединения сложились бы с чужим началом
+        conn = exception_context.connection
+        if conn is None or exception_context.execution_context is None:
+            return
+        started = conn.info.get('_metrics_query_started')
+        if started:
+            started.pop()
+
+
+# Глобальные метрики процесса
+instrumentation = Instrumentation()
@@ -0,0 +1,205 @@
+"""Версионированные миграции схемы поверх init_db.
+
+init_db создает таблицы по моделям, но не трогает уже существующую
+базу. Здесь хранится упорядоченный список миграций; примененные версии
+записываются в таблицу schema_migrations, поэтому старые базы (в том
+числе data/beatssuda.db) обновляются на месте при старте приложения.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from app.models.listing import db, Listing
+
+# Шаг миграции - SQL-строка или функция, получающая соединение
+Migration = namedtuple('Migration', ['version', 'name', 'statements'])
+
+MIGRATIONS = [
+    Migration(1, 'listing_feed_indexes', [
+        # Лента index(): все активные и промодерированные, новые первыми.
+        # id DESC в конце дает стабильный порядок без сортировки во временном B-дереве
+        "CREATE INDEX IF NOT EXISTS ix_listings_feed "
+        "ON listings (is_active, is_moderated, created_at DESC, id DESC)",
+        # listings(<type>) и фильтр ?type=
+        "CREATE INDEX IF NOT EXISTS ix_listings_feed_type "
+        "ON listings (is_active, is_moderated, listing_type, created_at DESC, id DESC)",
+        # Фильтр ?genre= и GROUP BY genre в stats()
+        "CREATE INDEX IF NOT EXISTS ix_listings_feed_genre "
+        "ON listings (is_active, is_moderated, genre, created_at DESC, id DESC)",
+        # Фильтр ?item_type=
+        "CREATE INDEX IF NOT EXISTS ix_listings_feed_item_type "
+        "ON listings (is_active, is_moderated, item_type, created_at DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_moderation_logs_listing_id "
+        "ON moderation_logs (listing_id)",
+    ]),
+    Migration(2, 'background_jobs', [
+        lambda conn: _create_table(conn, 'app.jobs', 'jobs_table'),
+        # Поиск дубликатов по ссылке на превью в фоновой модерации
+        "CREATE INDEX IF NOT EXISTS ix_listings_preview_url "
+        "ON listings (preview_url)",
+    ]),
+    Migration(3, 'listing_price_index', [
+        # Фильтр min_price/max_price и сортировка по цене; id - стабильный порядок
+        "CREATE INDEX IF NOT EXISTS ix_listings_price "
+        "ON listings (is_active, is_moderated, price_usd, id)",
+    ]),
+    Migration(4, 'similarity_index', [
+        # MinHash-подписи и LSH-полосы для поиска почти-дубликатов
+        lambda conn: _create_table(conn, 'app.similarity', 'signatures_table'),
+        lambda conn: _create_table(conn, 'app.similarity', 'buckets_table'),
+    ]),
+    Migration(5, 'listing_scores', [
+        # Снимок популярности для трендов (app.ranking)
+        lambda conn: _create_table(conn, 'app.ranking', 'scores_table'),
+    ]),
+    Migration(6, 'archive_indexes', [
+        # Отбор кандидатов в архив (app.archive) без полного скана
+        "CREATE INDEX IF NOT EXISTS ix_listings_inactive "
+        "ON listings (is_active, updated_at)",
+        "CREATE INDEX IF NOT EXISTS ix_moderation_logs_created_at "
+        "ON moderation_logs (created_at)",
+    ]),
+    Migration(7, 'content_filters_version', [
+        # Любая правка content_filters сбрасывает кэш матчера (app.moderation_rules)
+        lambda conn: _call(conn, 'app.moderation_rules', 'install_version_triggers'),
+    ]),
+]
+
+
+def _create_table(conn, module, name):
+    """Создает таблицу, описанную в модуле подсистемы (портируемо между бэкендами)"""
+    import importlib
+    table = getattr(importlib.import_module(module), name)
+    table.create(conn, checkfirst=True)
+
+
+def _call(conn, module, name):
+    """Вызывает шаг миграции, описанный в модуле подсистемы"""
+    import importlib
+    getattr(importlib.import_module(module), name)(conn)
+
+
+def _ensure_migrations_table(conn):
+    conn.execute(db.text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER NOT NULL PRIMARY KEY, "
+        "name VARCHAR(100) NOT NULL, "
+        "applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def get_schema_version(conn):
+    """Возвращает номер последней примененной миграции"""
+    _ensure_migrations_table(conn)
+    version = conn.execute(db.text(
+        "SELECT MAX(version) FROM schema_migrations"
+    )).scalar()
+    return version or 0
+
+
+def run_migrations(app):
+    """Применяет все непримененные миграции; возвращает их список"""
+    applied = []
+    with app.app_context():
+        with db.engine.begin() as conn:
+            current = get_schema_version(conn)
+
+        for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+            if migration.version <= current:
+                continue
+
+            # Каждая миграция - отдельная транзакция вместе с записью о ней
+            with db.engine.begin() as conn:
+                for statement in migration.statements:
+                    if callable(statement):
+                        statement(conn)
+                    else:
+                        conn.execute(db.text(statement))
+                conn.execute(db.text(
+                    "INSERT INTO schema_migrations (version, name, applied_at) "
+                    "VALUES (:version, :name, :applied_at)"
+                ), {
+                    'version': migration.version,
+                    'name': migration.name,
+                    'applied_at': datetime.utcnow()
+                })
+            applied.append(migration)
+            app.logger.info(f"Applied migration {migration.version}: {migration.name}")
+
+    return applied
+
+
+def feed_queries():
+    """Запросы лент, планы которых должны использовать индексы
+
+    Те же SELECT, что выполняют ленты: page_statement() поверх
+    feed_query(), первая страница и продолжение по курсору.
+    """
+    # Импорт здесь: pagination тянет read_models, которым нужны модели
+    from app.pagination import encode_cursor, feed_query, page_statement
+
+    after_newest = encode_cursor('feed', datetime(2024, 1, 1), 1000)
+    feeds = {
+        'index': feed_query(),
+        'index?type': feed_query(listing_type='sell'),
+        'index?genre': feed_query(genre='trap'),
+        'index?item_type': feed_query(item_type='beat'),
+        'index?genre&item_type': feed_query(genre='trap', item_type='beat'),
+        'index?type&genre&item_type': feed_query(listing_type='sell', genre='trap',
+                                                 item_type='beat'),
+        'listings': feed_query(listing_type='service'),
+    }
+
+    statements = {}
+    for name, query in feeds.items():
+        statements[name] = page_statement(query)
+        statements[f'{name}&cursor'] = page_statement(query, cursor=after_newest)
+
+    price_filter = feed_query(min_price=10, max_price=100)
+    for sort in ('price_asc', 'price_desc'):
+        statements[f'feed?sort={sort}'] = page_statement(feed_query(), sort=sort)
+        statements[f'feed?price&sort={sort}'] = page_statement(price_filter, sort=sort)
+        statements[f'feed?sort={sort}&cursor'] = page_statement(
+            feed_query(), cursor=encode_cursor(sort, 50.0, 1000), sort=sort
+        )
+    return statements
+
+
+def stats_queries():
+    """Агрегаты stats(): допускается сортировка результата, но не полный скан"""
+    from app.stats import counts_statement, genres_statement
+
+    return {
+        'stats.counts': counts_statement(),
+        'stats.genres': genres_statement(),
+    }
+
+
+def explain(conn, statement):
+    """Возвращает строки EXPLAIN QUERY PLAN для запроса (только SQLite)"""
+    sql = str(statement.compile(
+        dialect=conn.dialect,
+        compile_kwargs={'literal_binds': True}
+    ))
+    return [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def check_query_plans(app):
+    """Проверяет планы запросов лент; возвращает список проблем"""
+    problems = []
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            return problems
+
+        with db.engine.connect() as conn:
+            checks = [(name, stmt, True) for name, stmt in feed_queries().items()]
+            checks += [(name, stmt, False) for name, stmt in stats_queries().items()]
+
+            for name, statement, forbid_sort in checks:
+                plan = explain(conn, statement)
+                for detail in plan:
+                    if detail.startswith('SCAN '):
+                        problems.append(f"{name}: full scan ({detail})")
+                    elif forbid_sort and 'TEMP B-TREE' in detail:
+                        problems.append(f"{name}: temp B-tree sort ({detail})")
+
+    return problems
@@ -0,0 +1,198 @@
+"""Фоновая модерация объявлений.
+
+create_listing() сохраняет объявление сразу (is_moderated=False) и ставит
+задачу moderate_listing. Воркер выполняет тяжелые проверки - доступность
+ссылки на превью, поиск дубликатов и почти-дубликатов (app.similarity), -
+пишет moderation_logs и публикует объявление, если проверки пройдены.
+
+Задача dedupe_listings прогоняет ту же проверку по всему каталогу.
+"""
+import ipaddress
+import logging
+import socket
+import time
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.jobs import job_queue
+from app.metrics import instrumentation
+from app.models.listing import db, Listing
+from app.moderation import content_moderator
+from app.similarity import similarity_index
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_CHECK_TIMEOUT = 5
+PREVIEW_MAX_REDIRECTS = 5
+# Общий бюджет проверки со всеми переходами; в запросе (JOB_INLINE) - меньше
+PREVIEW_TOTAL_TIMEOUT = 15
+PREVIEW_INLINE_TIMEOUT = 3
+
+
+def _is_allowed(address):
+    return ipaddress.ip_address(address.split('%')[0]).is_global
+
+
+def public_address(url):
+    """Адрес, с которым можно соединиться по http(s)-ссылке, или None
+
+    Ссылку присылает пользователь - воркер не должен ходить по ней во
+    внутреннюю сеть (localhost, 10.0.0.0/8, метаданные облака). Все
+    адреса хоста должны быть публичными.
+    """
+    try:
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+    except ValueError:
+        return None
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        return None
+    try:
+        addresses = [info[4][0] for info in
+                     socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)]
+    except (socket.gaierror, UnicodeError):
+        return None
+    if not addresses or not all(_is_allowed(address) for address in addresses):
+        return None
+    return addresses[0]
+
+
+class PinnedAdapter(HTTPAdapter):
+    """Соединение с уже проверенным адресом; SNI и сертификат - по имени хоста"""
+
+    def __init__(self, hostname, **kwargs):
+        self.hostname = hostname
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['server_hostname'] = self.hostname
+        super().init_poolmanager(*args, **kwargs)
+
+
+def _pinned_request(method, url, address, timeout, **kwargs):
+    """Запрос по url к адресу address, без повторного разрешения имени
+
+    Иначе между проверкой и соединением DNS может вернуть другой,
+    внутренний адрес (DNS rebinding).
+    """
+    parts = urlsplit(url)
+    host = f'[{address}]' if ':' in address else address
+    netloc = f'{host}:{parts.port}' if parts.port else host
+    with requests.Session() as session:
+        # Прокси из окружения разрешал бы имя сам
+        session.trust_env = False
+        session.mount(f'{parts.scheme}://', PinnedAdapter(parts.hostname))
+        return session.request(
+            method, urlunsplit(parts._replace(netloc=netloc)),
+            headers={'Host': parts.netloc.rpartition('@')[2]},
+            timeout=timeout, allow_redirects=False, **kwargs
+        )
+
+
+def check_preview_url(url, budget=PREVIEW_TOTAL_TIMEOUT):
+    """True, если публичная ссылка на превью отвечает без ошибки
+
+    Редиректы проходим сами, проверяя адрес каждого перехода; вся
+    проверка укладывается в budget секунд.
+    """
+    deadline = time.monotonic() + budget
+
+    def remaining():
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise requests.Timeout('Preview check budget exceeded')
+        return min(PREVIEW_CHECK_TIMEOUT, left)
+
+    try:
+        for _ in range(PREVIEW_MAX_REDIRECTS + 1):
+            address = public_address(url)
+            if address is None:
+                return False
+            response = _pinned_request('HEAD', url, address, remaining())
+            if response.status_code in (403, 405):
+                # Часть хостингов не поддерживает HEAD - пробуем GET без тела
+                response = _pinned_request('GET', url, address, remaining(), stream=True)
+                response.close()
+            if not response.is_redirect:
+                return response.status_code < 400
+            url = urljoin(url, response.headers['Location'])
+        return False
+    except requests.RequestException:
+        return False
+
+
+def find_duplicate(listing):
+    """Активное объявление с той же ссылкой на превью или тем же описанием"""
+    conditions = []
+    # Пустое превью совпало бы со всеми объявлениями без превью
+    if listing.preview_url:
+        conditions.append(Listing.preview_url == listing.preview_url)
+    if listing.description:
+        conditions.append(db.and_(
+            Listing.author == listing.author,
+            Listing.description == listing.description
+        ))
+    if not conditions:
+        return None
+    return Listing.query.filter(
+        Listing.id != listing.id,
+        Listing.is_active == True,
+        db.or_(*conditions)
+    ).order_by(Listing.id).first()
+
+
+@job_queue.handler('moderate_listing')
+def moderate_listing_job(payload):
+    """Тяжелые проверки объявления вне запроса"""
+    listing = db.session.get(Listing, payload['listing_id'])
+    if listing is None or not listing.is_active:
+        return
+
+    warnings = list(payload.get('warnings') or [])
+    needs_review = bool(payload.get('needs_review'))
+
+    with instrumentation.span('moderation.find_duplicate'):
+        duplicate = find_duplicate(listing)
+    if duplicate is not None:
+        warnings.append(f'Похоже на объявление #{duplicate.id}')
+        needs_review = True
+    else:
+        # Перезалив с мелкими правками: сравнение через LSH-индекс
+        with instrumentation.span('moderation.near_duplicate'):
+            similar = similarity_index.find_similar(listing, exclude_id=listing.id)
+        if similar:
+            similar_id, score = similar[0]
+            warnings.append(f'Похоже на объявление #{similar_id} (совпадение {score:.0%})')
+            needs_review = True
+
+    if listing.preview_url:
+        with instrumentation.span('moderation.preview_check'):
+            # В serverless-режиме проверка идет внутри запроса создания
+            budget = PREVIEW_INLINE_TIMEOUT if job_queue.inline else PREVIEW_TOTAL_TIMEOUT
+            preview_ok = check_preview_url(listing.preview_url, budget)
+        if not preview_ok:
+            warnings.append('Ссылка на превью недоступна')
+            needs_review = True
+
+    listing.is_moderated = not needs_review
+    db.session.commit()
+
+    with instrumentation.span('moderation.log'):
+        content_moderator.log_moderation(
+            listing.id,
+            'auto_approved' if listing.is_moderated else 'needs_review',
+            f"Warnings: {'; '.join(warnings)}" if warnings else 'Clean'
+        )
+
+
+@job_queue.handler('dedupe_listings')
+def dedupe_listings_job(payload):
+    """Поиск почти-дубликатов по всему каталогу (flask dedupe-listings --background)"""
+    report = similarity_index.dedupe(
+        threshold=payload.get('threshold'),
+        action=payload.get('action', 'review')
+    )
+    logger.info("Dedupe: checked %s listings, found %s near-duplicates",
+                report.checked, report.duplicates)
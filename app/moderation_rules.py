@@ -0,0 +1,352 @@
+"""Скомпилированный матчер фильтров контента (таблица content_filters).
+
+Все активные фильтры собираются в один матчер: литеральные шаблоны и
+обязательные подстроки регулярных выражений - в автомат Ахо-Корасик,
+регулярки без таких подстрок - в одну регулярку-альтернацию.
+Проверка объявления стоит O(длина текста) и почти не зависит от числа
+шаблонов. Матчер кэшируется в процессе и пересобирается только когда
+меняется водяной знак таблицы: номер версии из content_filters_version,
+который триггеры увеличивают на каждый INSERT/UPDATE/DELETE (в том числе
+правку шаблона на месте), плюс количество и MAX(id).
+"""
+import logging
+import re
+import threading
+import time
+from collections import deque, namedtuple
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+from app.models.listing import db
+
+logger = logging.getLogger(__name__)
+
+FilterRule = namedtuple('FilterRule', ['id', 'filter_type', 'pattern', 'is_regex'])
+FilterHit = namedtuple('FilterHit', ['rule', 'field', 'text'])
+
+# Поля объявления, которые проверяются фильтрами
+CHECKED_FIELDS = ('author', 'contact', 'preview_url', 'description', 'tags',
+                  'includes', 'price')
+
+HIT_MESSAGES = {
+    'banned_domain': 'Запрещенная ссылка или домен: {text}',
+    'banned_word': 'Запрещенное слово: {text}',
+}
+
+# Обратные ссылки и именованные группы ломаются при склейке в альтернацию
+_UNSAFE_REGEX_RE = re.compile(r'\\[1-9]|\(\?P[<=]')
+
+VERSION_TABLE = 'content_filters_version'
+
+
+def install_version_triggers(conn):
+    """Таблица версии фильтров и триггеры, увеличивающие ее на каждую запись (миграция)"""
+    conn.exec_driver_sql(
+        f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ("
+        "id INTEGER NOT NULL PRIMARY KEY, version INTEGER NOT NULL)"
+    )
+    conn.exec_driver_sql(
+        f"INSERT INTO {VERSION_TABLE} (id, version) SELECT 1, 0 "
+        f"WHERE NOT EXISTS (SELECT 1 FROM {VERSION_TABLE} WHERE id = 1)"
+    )
+    bump = f"UPDATE {VERSION_TABLE} SET version = version + 1 WHERE id = 1"
+
+    if conn.dialect.name == 'sqlite':
+        for operation in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.exec_driver_sql(
+                f"CREATE TRIGGER IF NOT EXISTS {VERSION_TABLE}_{operation.lower()} "
+                f"AFTER {operation} ON content_filters BEGIN {bump}; END"
+            )
+    elif conn.dialect.name == 'postgresql':
+        conn.exec_driver_sql(
+            "CREATE OR REPLACE FUNCTION content_filters_bump_version() RETURNS trigger AS $$ "
+            f"BEGIN {bump}; RETURN NULL; END $$ LANGUAGE plpgsql"
+        )
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {VERSION_TABLE} ON content_filters")
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER {VERSION_TABLE} AFTER INSERT OR UPDATE OR DELETE ON content_filters "
+            "FOR EACH STATEMENT EXECUTE PROCEDURE content_filters_bump_version()"
+        )
+
+
+class AhoCorasick:
+    """Автомат Ахо-Корасик для поиска множества подстрок за один проход"""
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for index, pattern in enumerate(patterns):
+            self._add(pattern, index)
+        self._build_links()
+
+    def _add(self, pattern, index):
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append(index)
+
+    def _build_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                if self._fail[child] == child:
+                    self._fail[child] = 0
+                # Наследуем совпадения суффиксной ссылки
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def search(self, text):
+        """Возвращает множество индексов найденных шаблонов"""
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found.update(output[node])
+        return found
+
+
+def _literal_run(items):
+    """Строка, если последовательность состоит только из литералов"""
+    chars = []
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            chars.append(chr(av))
+        elif op is not sre_parse.AT:
+            return None
+    return ''.join(chars)
+
+
+def required_literals(pattern, min_length=3):
+    """Набор подстрок, хотя бы одна из которых обязана быть в совпадении
+
+    Нужен для предфильтра: регулярка запускается только если автомат
+    нашел в тексте одну из ее обязательных подстрок. None - если такой
+    набор не выделить и регулярку придется проверять всегда.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return None
+
+    factors = []
+    run = []
+
+    def close_run():
+        if run:
+            factors.append([''.join(run)])
+            del run[:]
+
+    items = list(parsed)
+    if len(items) == 1 and items[0][0] is sre_parse.BRANCH:
+        items = [(sre_parse.SUBPATTERN, (None, 0, 0, items))]
+
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+        elif op is sre_parse.AT:
+            # \b, ^, $ не занимают символов и не разрывают подстроку
+            continue
+        elif op is sre_parse.SUBPATTERN:
+            body = list(av[-1])
+            literal = _literal_run(body)
+            if literal is not None:
+                run.append(literal)
+                continue
+            close_run()
+            if len(body) == 1 and body[0][0] is sre_parse.BRANCH:
+                branches = [_literal_run(branch) for branch in body[0][1][1]]
+                if all(branches):
+                    factors.append(branches)
+        else:
+            close_run()
+    close_run()
+
+    best = None
+    for alternatives in factors:
+        shortest = min(len(alternative) for alternative in alternatives)
+        if shortest >= min_length and (best is None or shortest > best[0]):
+            best = (shortest, alternatives)
+    return [alternative.lower() for alternative in best[1]] if best else None
+
+
+class CompiledMatcher:
+    """Один проход по тексту для всех фильтров сразу
+
+    Литеральные фильтры и обязательные подстроки регулярок лежат в одном
+    автомате Ахо-Корасик. Регулярка проверяется, только если автомат нашел
+    ее подстроку; регулярки без выделяемой подстроки склеены в одну
+    альтернацию и проверяются всегда.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+
+        keys = []
+        self._targets = []
+        self._group_rules = {}
+        self._separate = []
+        alternatives = []
+        for rule in self.rules:
+            if not rule.pattern:
+                continue
+            if not rule.is_regex:
+                keys.append(rule.pattern.lower())
+                self._targets.append((rule, None))
+                continue
+
+            try:
+                compiled = re.compile(rule.pattern, re.IGNORECASE)
+            except re.error as e:
+                logger.warning(f"Skipping invalid content filter {rule.id}: {e}")
+                continue
+
+            literals = required_literals(rule.pattern)
+            if literals:
+                for literal in literals:
+                    keys.append(literal)
+                    self._targets.append((rule, compiled))
+            elif _UNSAFE_REGEX_RE.search(rule.pattern):
+                self._separate.append((rule, compiled))
+            else:
+                group = f'f{rule.id}'
+                self._group_rules[group] = rule
+                alternatives.append(f'(?P<{group}>{rule.pattern})')
+
+        self._automaton = AhoCorasick(keys)
+        self._combined = (
+            re.compile('|'.join(alternatives), re.IGNORECASE) if alternatives else None
+        )
+
+    def match_text(self, text):
+        """Список (правило, совпавший фрагмент) для одного текста"""
+        if not text:
+            return []
+
+        hits = []
+        checked = set()
+        for index in sorted(self._automaton.search(text.lower())):
+            rule, compiled = self._targets[index]
+            if rule.id in checked:
+                continue
+            checked.add(rule.id)
+            if compiled is None:
+                hits.append((rule, rule.pattern))
+            else:
+                match = compiled.search(text)
+                if match:
+                    hits.append((rule, match.group(0)))
+
+        if self._combined is not None:
+            seen = set()
+            for match in self._combined.finditer(text):
+                group = match.lastgroup
+                if group not in seen:
+                    seen.add(group)
+                    hits.append((self._group_rules[group], match.group(group)))
+
+        for rule, compiled in self._separate:
+            match = compiled.search(text)
+            if match:
+                hits.append((rule, match.group(0)))
+        return hits
+
+    def scan(self, listing_data):
+        """Проверяет все текстовые поля объявления"""
+        hits = []
+        for field in CHECKED_FIELDS:
+            for rule, text in self.match_text(listing_data.get(field) or ''):
+                hits.append(FilterHit(rule, field, text))
+        return hits
+
+
+class FilterMatcherCache:
+    """Кэш скомпилированного матчера с проверкой водяного знака таблицы"""
+
+    def __init__(self, check_interval=30.0):
+        self.check_interval = check_interval
+        self._matcher = None
+        self._watermark = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Принудительная пересборка при следующем обращении"""
+        self._checked_at = 0.0
+        self._watermark = None
+
+    def get(self):
+        """Актуальный матчер; в базу ходит не чаще раза в check_interval"""
+        now = time.monotonic()
+        if self._matcher is not None and now - self._checked_at < self.check_interval:
+            return self._matcher
+
+        with self._lock:
+            if self._matcher is not None and now - self._checked_at < self.check_interval:
+                return self._matcher
+
+            watermark = self._read_watermark()
+            if self._matcher is None or watermark != self._watermark:
+                self._matcher = CompiledMatcher(self._load_rules())
+                self._watermark = watermark
+            self._checked_at = time.monotonic()
+            return self._matcher
+
+    def scan(self, listing_data):
+        """Ищет срабатывания фильтров в данных объявления"""
+        return self.get().scan(listing_data)
+
+    def errors(self, listing_data):
+        """Сообщения об ошибках для пользователя (по одному на фильтр)"""
+        messages = []
+        seen = set()
+        for hit in self.scan(listing_data):
+            if hit.rule.id in seen:
+                continue
+            seen.add(hit.rule.id)
+            template = HIT_MESSAGES.get(hit.rule.filter_type, 'Запрещенный контент: {text}')
+            messages.append(template.format(text=hit.text))
+        return messages
+
+    def _read_watermark(self):
+        # Без триггеров (другие СУБД) версия не растет - остаются количество и MAX(id)
+        row = db.session.execute(db.text(
+            f"SELECT (SELECT version FROM {VERSION_TABLE} WHERE id = 1), "
+            "COUNT(*), MAX(id), MAX(created_at), "
+            "SUM(CASE WHEN is_active THEN 1 ELSE 0 END) FROM content_filters"
+        )).first()
+        return tuple(row)
+
+    def _load_rules(self):
+        rows = db.session.execute(db.text(
+            "SELECT id, filter_type, pattern, is_regex FROM content_filters "
+            "WHERE is_active = :active ORDER BY id"
+        ), {'active': True})
+        return [
+            FilterRule(row.id, row.filter_type, row.pattern, bool(row.is_regex))
+            for row in rows
+        ]
+
+
+# Глобальный кэш матчера фильтров
+filter_matcher = FilterMatcherCache()
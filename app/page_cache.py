@@ -0,0 +1,189 @@
+"""Кэш отрендеренных страниц с ETag/Last-Modified.
+
+Страницы лент хранятся целиком, ключ - путь и параметры запроса плюс
+номер поколения. Любая запись объявления через ORM после коммита
+увеличивает поколение в общем хранилище, и все воркеры перестают видеть
+старые страницы. Страница объявления не кэшируется: на ней счетчик
+просмотров с несброшенными приращениями, который меняется каждым
+запросом.
+
+Бэкенд - LRU в памяти процесса (PAGE_CACHE_BACKEND=local) или общее
+хранилище (PAGE_CACHE_BACKEND=shared: Redis по REDIS_URL или LocalStore).
+Ответы отдаются с ETag и Last-Modified, условный GET получает 304.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import Response, request, session
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.models.listing import Listing
+from app.shared_store import get_shared_store
+
+
+class LRUBackend:
+    """Ограниченный LRU-кэш с TTL в памяти процесса"""
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SharedBackend:
+    """Кэш в общем хранилище - попадания видны всем воркерам"""
+
+    KEY_PREFIX = 'pagecache'
+
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, key):
+        value = self.store.get(f'{self.KEY_PREFIX}:{key}')
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.store.set(f'{self.KEY_PREFIX}:{key}', json.dumps(value), ex=int(ttl) or 1)
+
+    def clear(self):
+        keys = self.store.keys(f'{self.KEY_PREFIX}:*')
+        if keys:
+            self.store.delete(*keys)
+
+
+class PageCache:
+    """Кэш страниц со сбросом по поколению"""
+
+    GENERATION_KEY = 'pagecache:generation'
+    DIRTY_FLAG = 'page_cache_dirty'
+
+    def __init__(self):
+        self.ttl = 30
+        self.store = None
+        self.backend = LRUBackend()
+        self._listeners_registered = False
+
+    def init_app(self, app):
+        """Выбирает бэкенд (PAGE_CACHE_BACKEND) и подписывается на изменения"""
+        self.ttl = app.config.get('PAGE_CACHE_TTL', self.ttl)
+        self.store = get_shared_store(app.config.get('PAGE_CACHE_REDIS_URL'))
+
+        if app.config.get('PAGE_CACHE_BACKEND', 'local') == 'shared':
+            self.backend = SharedBackend(self.store)
+        else:
+            self.backend = LRUBackend(app.config.get('PAGE_CACHE_SIZE', 1000))
+
+        if not self._listeners_registered:
+            for name in ('after_insert', 'after_update', 'after_delete'):
+                event.listen(Listing, name, self._on_change)
+            event.listen(Session, 'do_orm_execute', self._on_bulk_write)
+            event.listen(Session, 'after_commit', self._on_commit)
+            event.listen(Session, 'after_rollback', self._on_rollback)
+            self._listeners_registered = True
+
+        app.extensions['page_cache'] = self
+
+    def invalidate(self):
+        """Сбрасывает страницы во всех воркерах"""
+        self.store.incr(self.GENERATION_KEY)
+
+    def cached(self):
+        """Декоратор GET-маршрута: отдает страницу из кэша с ETag/304"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self._cacheable():
+                    return view(*args, **kwargs)
+
+                key = self._page_key()
+                entry = self.backend.get(key)
+                if entry is not None:
+                    return self._respond(entry)
+
+                result = view(*args, **kwargs)
+                if not isinstance(result, str) or '_flashes' in session:
+                    # Редиректы, ошибки и страницы с flash-сообщениями не кэшируем
+                    return result
+
+                entry = {
+                    'body': result,
+                    'etag': hashlib.sha1(result.encode('utf-8')).hexdigest(),
+                    'last_modified': int(time.time()),
+                }
+                self.backend.set(key, entry, self.ttl)
+                return self._respond(entry)
+            return wrapper
+        return decorator
+
+    def _cacheable(self):
+        return request.method in ('GET', 'HEAD') and '_flashes' not in session
+
+    def _page_key(self):
+        generation = self.store.get(self.GENERATION_KEY) or 0
+        # Экранируем значения: иначе ?genre=a%26type%3Dsell и ?genre=a&type=sell - один ключ
+        args = urlencode(sorted(request.args.items(multi=True)))
+        return f'page:{generation}:{request.path}?{args}'
+
+    @staticmethod
+    def _respond(entry):
+        response = Response(entry['body'], mimetype='text/html')
+        response.set_etag(entry['etag'])
+        response.last_modified = entry['last_modified']
+        # Браузер хранит копию, но перепроверяет ее условным запросом
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    def _on_change(self, mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            session.info[self.DIRTY_FLAG] = True
+        else:
+            self.invalidate()
+
+    def _on_bulk_write(self, orm_execute_state):
+        # Query.update()/delete() не вызывают after_update/after_delete
+        if orm_execute_state.is_update or orm_execute_state.is_delete:
+            mapper = orm_execute_state.bind_mapper
+            if mapper is not None and mapper.class_ is Listing:
+                orm_execute_state.session.info[self.DIRTY_FLAG] = True
+
+    def _on_commit(self, session):
+        # Сбрасываем после коммита, иначе параллельный запрос закэширует старые данные
+        if session.info.pop(self.DIRTY_FLAG, False):
+            self.invalidate()
+
+    def _on_rollback(self, session):
+        session.info.pop(self.DIRTY_FLAG, None)
+
+
+# Глобальный кэш страниц
+page_cache = PageCache()
@@ -0,0 +1,155 @@
+"""Курсорная (keyset) пагинация лент объявлений.
+
+Вместо OFFSET следующая страница выбирается условием
+(created_at, id) < (последний created_at, последний id), поэтому цена
+страницы не зависит от глубины, а новые объявления, добавленные между
+запросами, не сдвигают уже показанные. При сортировке по цене ключом
+служит (price_usd, id).
+"""
+import base64
+import binascii
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from app.models.listing import db, Listing
+from app.read_models import card_columns, to_cards
+
+PER_PAGE = 50
+MAX_PER_PAGE = 100
+SORTS = ('newest', 'price_asc', 'price_desc')
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+class InvalidCursor(ValueError):
+    """Курсор поврежден или выдан для другой ленты"""
+
+
+def encode_cursor(kind, *values):
+    """Упаковывает ключ последней строки в непрозрачный токен"""
+    payload = [kind] + [
+        value.isoformat() if isinstance(value, datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(token, kind):
+    """Распаковывает токен; возвращает список значений ключа"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, binascii.Error, UnicodeError):
+        raise InvalidCursor('Некорректный курсор')
+
+    if not isinstance(payload, list) or not payload or payload[0] != kind:
+        raise InvalidCursor('Курсор не подходит для этой ленты')
+    return payload[1:]
+
+
+def parse_per_page(value, default=PER_PAGE):
+    """Размер страницы из параметра запроса, ограниченный MAX_PER_PAGE"""
+    try:
+        per_page = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(per_page, MAX_PER_PAGE))
+
+
+def parse_price_filter(value):
+    """Граница цены в USD из параметра запроса; None если не задана"""
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        return None
+    return price if price >= 0 else None
+
+
+def parse_sort(value):
+    """Порядок ленты из параметра запроса (по умолчанию - новые первыми)"""
+    return value if value in SORTS else 'newest'
+
+
+def feed_query(listing_type=None, genre=None, item_type=None,
+               min_price=None, max_price=None):
+    """Базовый запрос ленты: активные промодерированные объявления с фильтрами"""
+    query = Listing.query.filter_by(is_active=True, is_moderated=True)
+    if listing_type:
+        query = query.filter(Listing.listing_type == listing_type)
+    if genre:
+        query = query.filter(Listing.genre == genre)
+    if item_type:
+        query = query.filter(Listing.item_type == item_type)
+    if min_price is not None:
+        query = query.filter(Listing.price_usd >= min_price)
+    if max_price is not None:
+        query = query.filter(Listing.price_usd <= max_price)
+    return query
+
+
+def paginate_feed(query, cursor=None, per_page=PER_PAGE, sort='newest'):
+    """Страница ленты из карточек ListingCard: новые первыми или по цене (sort из SORTS)"""
+    rows = to_cards(db.session.execute(page_statement(query, cursor, per_page, sort)).all())
+    return make_page(rows, per_page, sort)
+
+
+def page_statement(query, cursor=None, per_page=PER_PAGE, sort='newest'):
+    """SELECT колонок карточки для страницы ленты (на строку больше per_page)
+
+    Отдельно от выполнения - ASGI-режим выполняет его async-движком.
+    """
+    if sort != 'newest':
+        return _price_statement(query, cursor, per_page, descending=(sort == 'price_desc'))
+
+    if cursor:
+        values = decode_cursor(cursor, 'feed')
+        try:
+            created_at = datetime.fromisoformat(values[0])
+            listing_id = int(values[1])
+        except (IndexError, TypeError, ValueError):
+            raise InvalidCursor('Некорректный курсор')
+        query = query.filter(
+            db.tuple_(Listing.created_at, Listing.id) < (created_at, listing_id)
+        )
+
+    # Берем на одну строку больше, чтобы знать, есть ли следующая страница
+    return query.with_entities(*card_columns()).order_by(
+        Listing.created_at.desc(),
+        Listing.id.desc()
+    ).limit(per_page + 1).statement
+
+
+def make_page(rows, per_page=PER_PAGE, sort='newest'):
+    """Page из карточек, выбранных page_statement()"""
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        if sort == 'newest':
+            next_cursor = encode_cursor('feed', last.created_at, last.id)
+        else:
+            next_cursor = encode_cursor(sort, last.price_usd, last.id)
+    return Page(rows, next_cursor)
+
+
+def _price_statement(query, cursor, per_page, descending):
+    kind = 'price_desc' if descending else 'price_asc'
+    # Объявления без распознанной цены в сортировку по цене не попадают
+    query = query.filter(Listing.price_usd.isnot(None))
+    key = db.tuple_(Listing.price_usd, Listing.id)
+
+    if cursor:
+        values = decode_cursor(cursor, kind)
+        try:
+            after = (float(values[0]), int(values[1]))
+        except (IndexError, TypeError, ValueError):
+            raise InvalidCursor('Некорректный курсор')
+        query = query.filter(key < after if descending else key > after)
+
+    if descending:
+        order = (Listing.price_usd.desc(), Listing.id.desc())
+    else:
+        order = (Listing.price_usd, Listing.id)
+    return query.with_entities(*card_columns()).order_by(*order).limit(per_page + 1).statement
@@ -0,0 +1,260 @@
+"""Нормализация цен объявлений в USD.
+
+Поле price - свободный текст ("1 500 руб", "$30", "от 20€", "2к грн").
+Скомпилированный разборщик находит сумму и валюту, а курсы берутся из
+локальной таблицы, которую фоновый поток обновляет из подключаемого
+источника (FX_RATES_URL). Результат хранится в listings.price_usd и
+проиндексирован вместе с (is_active, is_moderated), поэтому фильтры и
+сортировка по цене не сканируют таблицу.
+
+Разборщик (parse_price) не зависит от моделей: они и фоновый поток
+импортируются только при подключении сервиса к приложению.
+"""
+import json
+import logging
+import re
+import threading
+
+from sqlalchemy import event, inspect
+
+from app.shared_store import get_shared_store
+
+logger = logging.getLogger(__name__)
+
+# Единиц валюты за 1 USD - запасная таблица, пока источник недоступен
+DEFAULT_RATES = {
+    'USD': 1.0,
+    'EUR': 0.92,
+    'GBP': 0.79,
+    'RUB': 90.0,
+    'UAH': 41.0,
+    'KZT': 480.0,
+    'BYN': 3.3,
+}
+
+# Обозначения валют; слова сравниваются по началу (руб, рублей, рубля...)
+CURRENCY_ALIASES = {
+    'USD': (r'\$', r'us\$', r'usd', r'dollar\w*', r'долл\w*', r'бакс\w*'),
+    'EUR': (r'€', r'eur', r'euro\w*', r'евро'),
+    'GBP': (r'£', r'gbp'),
+    'RUB': (r'₽', r'rub', r'rur', r'руб\w*', r'р\.?'),
+    'UAH': (r'₴', r'uah', r'грн', r'грив\w*'),
+    'KZT': (r'₸', r'kzt', r'тенге', r'тг'),
+    'BYN': (r'byn', r'бел\.?\s*руб\w*'),
+}
+
+
+def _alias_pattern(alias):
+    # Буквенные обозначения - не внутри слова ("р" не должна ловиться в "рэп"),
+    # но сразу после цифры можно: "1500руб", "20eur"
+    if alias[0].isalpha():
+        return rf'(?<![^\W\d]){alias}(?!\w)'
+    return alias
+
+
+_CURRENCY_PATTERNS = {
+    code: re.compile('|'.join(_alias_pattern(alias) for alias in aliases), re.IGNORECASE)
+    for code, aliases in CURRENCY_ALIASES.items()
+}
+# BYN раньше RUB, иначе "бел. руб" распознается как рубли
+_CURRENCY_ORDER = ('BYN',) + tuple(code for code in CURRENCY_ALIASES if code != 'BYN')
+_CURRENCY = '|'.join(
+    f'(?:{_CURRENCY_PATTERNS[code].pattern})' for code in _CURRENCY_ORDER
+)
+# 1 500 / 1,500 / 1.500 - разряды; 12.5 / 12,5 - дробь
+_NUMBER = r'\d{1,3}(?:[ \u00a0,.]\d{3})+(?![\d.,])|\d+(?:[.,]\d+)?'
+_MULTIPLIER = r'k|к|тыс\w*\.?'
+
+PRICE_RE = re.compile(
+    rf'(?:(?P<pre>{_CURRENCY})\s*)?'
+    rf'(?P<number>{_NUMBER})\s*'
+    rf'(?P<mult>(?:{_MULTIPLIER})(?!\w))?\s*'
+    rf'(?P<post>{_CURRENCY})?',
+    re.IGNORECASE
+)
+CURRENCY_RE = re.compile(_CURRENCY, re.IGNORECASE)
+FREE_RE = re.compile(r'бесплатн|даром|free\b', re.IGNORECASE)
+
+
+def currency_of(token):
+    """Код валюты по обозначению ('руб.' -> 'RUB')"""
+    for code in _CURRENCY_ORDER:
+        if _CURRENCY_PATTERNS[code].fullmatch(token.strip()):
+            return code
+    return None
+
+
+def parse_number(text):
+    """'1 500' -> 1500.0, '1,5' -> 1.5, '1.500' -> 1500.0"""
+    text = text.replace('\u00a0', ' ')
+    if re.fullmatch(r'\d{1,3}(?:[ ,.]\d{3})+', text):
+        return float(re.sub(r'[ ,.]', '', text))
+    return float(text.replace(',', '.'))
+
+
+def parse_price(text, default_currency='USD'):
+    """Сумма и валюта из строки цены; (amount, currency) или None
+
+    Для диапазона ("50-100$") берется нижняя граница.
+    """
+    if not text:
+        return None
+
+    match = PRICE_RE.search(text)
+    if match is None:
+        return (0.0, default_currency) if FREE_RE.search(text) else None
+
+    amount = parse_number(match.group('number'))
+    if match.group('mult'):
+        amount *= 1000
+
+    token = match.group('pre') or match.group('post')
+    if token is None:
+        # Валюта может стоять дальше: "50-100 $", "от 500 до 700 руб"
+        found = CURRENCY_RE.search(text, match.end())
+        token = found.group(0) if found else None
+    currency = currency_of(token) if token else default_currency
+    return amount, currency or default_currency
+
+
+def http_rates_source(url, timeout=5):
+    """Источник курсов: JSON вида {"rates": {"EUR": 0.92, ...}} с базой USD"""
+    import requests
+
+    def fetch():
+        response = requests.get(url, timeout=timeout)
+        response.raise_for_status()
+        data = response.json()
+        return data.get('rates', data)
+    return fetch
+
+
+class PriceService:
+    """Разбор цен, курсы валют и заполнение listings.price_usd"""
+
+    RATES_KEY = 'fx:rates'
+
+    def __init__(self):
+        self.app = None
+        self.store = None
+        self.source = None
+        self.default_currency = 'USD'
+        self._rates = dict(DEFAULT_RATES)
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._listeners_registered = False
+
+    def init_app(self, app):
+        """Настраивает источник курсов (FX_RATES_URL) и пересчет price_usd при записи"""
+        from app.counters import PeriodicFlusher
+        from app.models.listing import Listing
+
+        self.app = app
+        self.store = get_shared_store(app.config.get('FX_REDIS_URL'))
+        self.default_currency = app.config.get('PRICE_DEFAULT_CURRENCY', 'USD')
+
+        # Курсы, полученные другим воркером, - без похода к источнику
+        cached = self.store.get(self.RATES_KEY)
+        if cached:
+            self._set_rates(json.loads(cached))
+
+        url = app.config.get('FX_RATES_URL')
+        if url and self.source is None:
+            self.source = http_rates_source(url)
+        if self.source is not None and self._refresher is None:
+            interval = app.config.get('FX_REFRESH_INTERVAL', 3600)
+            self._refresher = PeriodicFlusher(self.refresh, interval, 'fx-refresh').start()
+            self._refresher.wake()
+
+        if not self._listeners_registered:
+            event.listen(Listing, 'before_insert', self._on_insert)
+            event.listen(Listing, 'before_update', self._on_update)
+            self._listeners_registered = True
+
+        app.extensions['price_service'] = self
+
+    @property
+    def rates(self):
+        return self._rates
+
+    def refresh(self):
+        """Загружает свежие курсы из источника; False если не удалось"""
+        if self.source is None:
+            return False
+        # requests нужен только при настроенном источнике курсов
+        import requests
+        try:
+            rates = self.source()
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"FX rates refresh failed: {e}")
+            return False
+
+        if not self._set_rates(rates):
+            return False
+        self.store.set(self.RATES_KEY, json.dumps(self._rates))
+        return True
+
+    def to_usd(self, price_text):
+        """Цена в USD из строки цены; None если не распознана"""
+        parsed = parse_price(price_text, self.default_currency)
+        if parsed is None:
+            return None
+        amount, currency = parsed
+        rate = self._rates.get(currency)
+        if not rate:
+            return None
+        return round(amount / rate, 2)
+
+    def backfill(self, batch_size=500, recompute=False):
+        """Заполняет price_usd пачками по id; recompute - пересчитать все строки"""
+        from app.models.listing import db
+
+        only_missing = '' if recompute else 'AND price_usd IS NULL '
+        updated = 0
+        last_id = 0
+        with self.app.app_context():
+            while True:
+                # Каждая пачка - короткая отдельная транзакция
+                with db.engine.begin() as conn:
+                    rows = conn.execute(db.text(
+                        "SELECT id, price, price_usd FROM listings "
+                        f"WHERE id > :last_id {only_missing}"
+                        "ORDER BY id LIMIT :limit"
+                    ), {'last_id': last_id, 'limit': batch_size}).all()
+                    if not rows:
+                        break
+
+                    params = []
+                    for row in rows:
+                        price_usd = self.to_usd(row.price)
+                        if price_usd != row.price_usd:
+                            params.append({'id': row.id, 'price_usd': price_usd})
+                    if params:
+                        conn.execute(db.text(
+                            "UPDATE listings SET price_usd = :price_usd WHERE id = :id"
+                        ), params)
+                updated += len(params)
+                last_id = rows[-1].id
+        return updated
+
+    def _set_rates(self, rates):
+        try:
+            rates = {code.upper(): float(rate) for code, rate in rates.items() if rate}
+        except (AttributeError, TypeError, ValueError):
+            logger.warning("FX rates source returned malformed data")
+            return False
+        rates['USD'] = 1.0
+        with self._lock:
+            self._rates = dict(self._rates, **rates)
+        return True
+
+    def _on_insert(self, mapper, connection, target):
+        target.price_usd = self.to_usd(target.price)
+
+    def _on_update(self, mapper, connection, target):
+        if inspect(target).attrs.price.history.has_changes():
+            target.price_usd = self.to_usd(target.price)
+
+
+# Глобальный сервис цен
+price_service = PriceService()
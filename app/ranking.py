@@ -0,0 +1,433 @@
+"""Ранжирование: популярность с затуханием и похожие объявления.
+
+Популярность - сумма просмотров и кликов по контакту (с весами
+TRENDING_WEIGHTS), каждый из которых затухает вдвое за
+TRENDING_HALF_LIFE секунд. Приращения приходят из буфера счетчиков
+(listing_counters.add_listener) и складываются в массивы id/score в
+памяти: чтобы не пересчитывать затухание всех записей, score хранится в
+растущей шкале 2^((t - epoch) / half_life) - порядок от этого не
+меняется. Топ кешируется на TRENDING_REFRESH секунд.
+
+Раз в TRENDING_SNAPSHOT_INTERVAL секунд накопленные приросты сливаются с
+таблицей listing_scores (туда пишут все воркеры), после чего массивы
+перечитываются из нее - так каждый воркер видит общую популярность.
+Давно не обновлявшиеся записи удаляются, таблица остается маленькой.
+
+Похожие объявления - совпадение жанра и тегов: у каждого терма есть
+список последних id объявлений с ним, кандидаты набирают вес редкости
+(idf) общих термов. Индекс заполняется в фоне последними
+RELATED_WARMUP_LISTINGS объявлениями и пополняется при публикации; при
+смене жанра, тегов или снятии с публикации старые термы убираются.
+"""
+import atexit
+import heapq
+import logging
+import math
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy import event
+
+from app.counters import listing_counters, schedule_flush
+from app.models.listing import db, Listing
+from app.read_models import load_cards
+from app.search import analyze
+
+logger = logging.getLogger(__name__)
+
+# Размер кешированного топа и ограничения индекса похожих
+TOP_SIZE = 500
+MAX_POSTINGS = 1000
+CANDIDATES_PER_TERM = 200
+# Записи без обновлений дольше стольких периодов полураспада удаляются
+STALE_HALF_LIVES = 10
+
+scores_metadata = sa.MetaData()
+
+scores_table = sa.Table(
+    'listing_scores', scores_metadata,
+    sa.Column('listing_id', sa.Integer, primary_key=True, autoincrement=False),
+    # Популярность, затухшая до момента updated_at
+    sa.Column('score', sa.Float, nullable=False),
+    sa.Column('updated_at', sa.DateTime, nullable=False),
+)
+
+# Возраст сохраненной записи на момент нового снимка, секунды
+_SCORE_AGE_SQL = {
+    'sqlite': "(julianday(excluded.updated_at) - julianday(listing_scores.updated_at)) * 86400.0",
+    'postgresql': "EXTRACT(EPOCH FROM (excluded.updated_at - listing_scores.updated_at))",
+}
+
+# Затухание и сложение - внутри upsert: параллельные снимки воркеров не
+# затирают приросты друг друга
+UPSERT_SCORES_SQL = (
+    "INSERT INTO listing_scores (listing_id, score, updated_at) "
+    "VALUES (:listing_id, :score, :updated_at) "
+    "ON CONFLICT (listing_id) DO UPDATE SET "
+    "score = excluded.score + listing_scores.score * power(2.0, -({age}) / :half_life), "
+    "updated_at = excluded.updated_at"
+)
+
+
+def _published():
+    return (Listing.is_active == True, Listing.is_moderated == True)  # noqa: E712
+
+
+class RankingIndex:
+    """Популярность с затуханием и индекс похожих объявлений в памяти"""
+
+    def __init__(self):
+        self.app = None
+        self.half_life = 6 * 3600
+        self.weights = {'views': 1.0, 'contacts_clicked': 5.0}
+        self.refresh_interval = 5.0
+        self.warmup_listings = 50000
+        self.snapshot_interval = 60.0
+        self.background = True
+        self._lock = threading.RLock()
+        self._snapshot_lock = threading.Lock()
+        # Популярность: id и score в одинаковых позициях, _slots - позиция по id
+        self._slots = {}
+        self._ids = array('q')
+        self._scores = array('d')
+        self._epoch = time.time()
+        self._pending = {}
+        self._loaded = False
+        self._loading = False
+        self._snapshot_at = 0.0
+        self._top = []
+        self._top_at = 0.0
+        # Похожие: терм -> последние id объявлений и общее число объявлений с ним,
+        # id -> термы, под которыми объявление сейчас в индексе (от старых к новым)
+        self._postings = {}
+        self._term_counts = {}
+        self._listing_terms = {}
+        self._related_state = None
+        self._flusher = None
+        self._scheduled = False
+        self._listeners_registered = False
+
+    def init_app(self, app):
+        """Веса, период полураспада, подписка на счетчики и поток снимков"""
+        self.app = app
+        self.half_life = app.config.get('TRENDING_HALF_LIFE', self.half_life)
+        self.weights = dict(self.weights, **app.config.get('TRENDING_WEIGHTS', {}))
+        self.refresh_interval = app.config.get('TRENDING_REFRESH', self.refresh_interval)
+        self.warmup_listings = app.config.get('RELATED_WARMUP_LISTINGS', self.warmup_listings)
+        self.snapshot_interval = app.config.get('TRENDING_SNAPSHOT_INTERVAL', self.snapshot_interval)
+        self.background = app.config.get('BACKGROUND_FLUSH', True)
+
+        if not self._listeners_registered:
+            listing_counters.add_listener(self.record)
+            event.listen(Listing, 'after_insert', self._on_insert)
+            event.listen(Listing, 'after_update', self._on_update)
+            self._listeners_registered = True
+
+        if not self._scheduled:
+            self._flusher = schedule_flush(app, self.snapshot, self.snapshot_interval, 'ranking-snapshot',
+                                          on_request=self.snapshot_pending)
+            self._scheduled = True
+            atexit.register(self.shutdown)
+
+        app.extensions['ranking_index'] = self
+
+    # ------------------------------------------------------------------
+    # Популярность
+    # ------------------------------------------------------------------
+
+    def _growth(self, now, epoch=None):
+        return 2.0 ** ((now - (self._epoch if epoch is None else epoch)) / self.half_life)
+
+    def record(self, listing_id, field, amount=1):
+        """Приращение счетчика объявления (слушатель listing_counters)"""
+        weight = self.weights.get(field, 0.0) * amount
+        if not weight:
+            return
+        listing_id = int(listing_id)
+        now = time.time()
+        with self._lock:
+            if now - self._epoch > 50 * self.half_life:
+                self._rebase(now)
+            value = weight * self._growth(now)
+            self._add(listing_id, value)
+            self._pending[listing_id] = self._pending.get(listing_id, 0.0) + value
+
+    def _add(self, listing_id, value):
+        slot = self._slots.get(listing_id)
+        if slot is None:
+            slot = self._slots[listing_id] = len(self._ids)
+            self._ids.append(listing_id)
+            self._scores.append(0.0)
+        self._scores[slot] += value
+
+    def _rebase(self, now):
+        # Растущая шкала не должна переполниться, если снимки не проходят
+        factor = 1.0 / self._growth(now)
+        for slot in range(len(self._scores)):
+            self._scores[slot] *= factor
+        self._pending = {key: value * factor for key, value in self._pending.items()}
+        self._epoch = now
+
+    def score(self, listing_id):
+        """Текущая популярность объявления"""
+        with self._lock:
+            slot = self._slots.get(listing_id)
+            if slot is None:
+                return 0.0
+            return self._scores[slot] / self._growth(time.time())
+
+    def snapshot_pending(self):
+        """snapshot(), если есть несохраненные приросты или прошлый снимок устарел"""
+        if self._pending or time.monotonic() - self._snapshot_at > self.snapshot_interval:
+            return self.snapshot()
+        return 0
+
+    def snapshot(self):
+        """Сливает приросты с listing_scores и перечитывает ее; возвращает число записей"""
+        if self.app is None:
+            return 0
+        with self._snapshot_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                epoch = self._epoch
+            now = time.time()
+            stamp = datetime.utcnow()
+            try:
+                with self.app.app_context():
+                    rows = self._merge(pending, epoch, now, stamp)
+            except Exception:
+                with self._lock:
+                    factor = self._growth(epoch)
+                    for listing_id, value in pending.items():
+                        self._pending[listing_id] = self._pending.get(listing_id, 0.0) + value * factor
+                raise
+
+            self._rebuild(rows, now, stamp)
+            return len(rows)
+
+    def _merge(self, pending, epoch, now, stamp):
+        decay = 1.0 / self._growth(now, epoch)
+        with db.engine.begin() as conn:
+            if pending:
+                age = _SCORE_AGE_SQL.get(conn.dialect.name, _SCORE_AGE_SQL['postgresql'])
+                conn.execute(db.text(UPSERT_SCORES_SQL.format(age=age)), [
+                    {'listing_id': listing_id, 'score': value * decay,
+                     'updated_at': stamp, 'half_life': float(self.half_life)}
+                    for listing_id, value in pending.items()
+                ])
+
+            cutoff = stamp - timedelta(seconds=STALE_HALF_LIVES * self.half_life)
+            conn.execute(scores_table.delete().where(scores_table.c.updated_at < cutoff))
+            return conn.execute(sa.select(scores_table)).all()
+
+    def _rebuild(self, rows, now, stamp):
+        slots, ids, scores = {}, array('q'), array('d')
+        for row in rows:
+            age = (stamp - row.updated_at).total_seconds()
+            slots[row.listing_id] = len(ids)
+            ids.append(row.listing_id)
+            scores.append(row.score * 2.0 ** (-age / self.half_life))
+
+        with self._lock:
+            # Приросты, пришедшие во время слияния, переносим в новую шкалу
+            factor = 1.0 / self._growth(now)
+            pending = {key: value * factor for key, value in self._pending.items()}
+            self._slots, self._ids, self._scores = slots, ids, scores
+            self._epoch = now
+            self._pending = pending
+            for listing_id, value in pending.items():
+                self._add(listing_id, value)
+            self._loaded = True
+            self._snapshot_at = time.monotonic()
+            self._top_at = 0.0
+
+    def top_ids(self):
+        """id самых популярных объявлений (кеш на TRENDING_REFRESH секунд)"""
+        if not self._loaded:
+            self._load()
+        now = time.monotonic()
+        if now - self._top_at > self.refresh_interval:
+            with self._lock:
+                scores, ids = self._scores, self._ids
+                best = heapq.nlargest(TOP_SIZE, range(len(scores)), key=scores.__getitem__)
+                self._top = [ids[slot] for slot in best if scores[slot] > 0]
+            self._top_at = now
+        return self._top
+
+    def _load(self):
+        """Первый снимок для холодного индекса
+
+        С фоновыми потоками - в фоне, а пока топ строится по приростам
+        этого процесса; в serverless-режиме - сразу. Ошибка базы не
+        роняет /trending.
+        """
+        if not self.background:
+            try:
+                self.snapshot()
+            except Exception:
+                logger.exception("Ranking snapshot failed")
+            return
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+        threading.Thread(target=self._load_in_background, name='ranking-load', daemon=True).start()
+
+    def _load_in_background(self):
+        try:
+            self.snapshot()
+        except Exception:
+            logger.exception("Ranking snapshot failed")
+        finally:
+            self._loading = False
+
+    def trending(self, limit=20, listing_type=None, genre=None):
+        """Карточки опубликованных объявлений по убыванию популярности"""
+        criteria = list(_published())
+        if listing_type:
+            criteria.append(Listing.listing_type == listing_type)
+        if genre:
+            criteria.append(Listing.genre == genre)
+        return load_cards(self.top_ids(), *criteria)[:limit]
+
+    # ------------------------------------------------------------------
+    # Похожие объявления
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _terms(genre, tags):
+        terms = {f'#{tag}' for tag in analyze(tags)}
+        if genre:
+            terms.add(f'genre:{genre}')
+        return terms
+
+    def _index_terms(self, listing_id, terms):
+        """Ставит объявление в индекс под термами terms (пусто - убирает из индекса)
+
+        Термы, которых у объявления больше нет, удаляются из списков, новые
+        добавляются один раз. Сверх RELATED_WARMUP_LISTINGS из индекса
+        выходят давно не менявшиеся объявления.
+        """
+        old = self._listing_terms.pop(listing_id, frozenset())
+        terms = frozenset(terms)
+        for term in old - terms:
+            postings = self._postings.get(term)
+            if postings is not None and listing_id in postings:
+                postings.remove(listing_id)
+            count = self._term_counts.get(term, 0) - 1
+            if count > 0:
+                self._term_counts[term] = count
+            else:
+                self._term_counts.pop(term, None)
+        for term in terms - old:
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = array('q')
+            postings.append(listing_id)
+            # Старые id обрезаются пачкой, чтобы не сдвигать массив на каждой вставке
+            if len(postings) > 2 * MAX_POSTINGS:
+                del postings[:-MAX_POSTINGS]
+            self._term_counts[term] = self._term_counts.get(term, 0) + 1
+        if terms:
+            self._listing_terms[listing_id] = terms
+        while len(self._listing_terms) > self.warmup_listings:
+            self._index_terms(next(iter(self._listing_terms)), ())
+
+    def _published_terms(self, target):
+        if target.is_active and target.is_moderated:
+            return self._terms(target.genre, target.tags)
+        return ()
+
+    def _on_insert(self, mapper, connection, target):
+        if self._related_state is not None and target.is_active and target.is_moderated:
+            with self._lock:
+                self._index_terms(target.id, self._terms(target.genre, target.tags))
+
+    def _on_update(self, mapper, connection, target):
+        # Публикация после модерации, снятие с публикации или смена жанра/тегов
+        if self._related_state is None:
+            return
+        state = db.inspect(target)
+        if any(state.attrs[field].history.has_changes()
+               for field in ('is_moderated', 'is_active', 'genre', 'tags')):
+            with self._lock:
+                self._index_terms(target.id, self._published_terms(target))
+
+    def _ensure_related(self):
+        with self._lock:
+            if self._related_state is not None:
+                return
+            self._related_state = 'loading'
+        threading.Thread(target=self._warm_related, name='ranking-warmup', daemon=True).start()
+
+    def _warm_related(self):
+        """Заполняет индекс последними опубликованными объявлениями"""
+        try:
+            with self.app.app_context():
+                rows = db.session.execute(
+                    db.select(Listing.id, Listing.genre, Listing.tags)
+                    .where(*_published())
+                    .order_by(Listing.id.desc())
+                    .limit(self.warmup_listings)
+                ).all()
+                db.session.remove()
+        except Exception:
+            logger.exception("Related listings warmup failed")
+            with self._lock:
+                self._related_state = None
+            return
+
+        with self._lock:
+            # Объявления, опубликованные во время прогрева, уже в индексе и новее
+            live = self._listing_terms
+            self._postings, self._term_counts, self._listing_terms = {}, {}, {}
+            for row in reversed(rows):
+                if row.id not in live:
+                    self._index_terms(row.id, self._terms(row.genre, row.tags))
+            for listing_id, terms in live.items():
+                self._index_terms(listing_id, terms)
+            self._related_state = 'ready'
+
+    def similar(self, listing, limit=6):
+        """Опубликованные объявления с тем же жанром и тегами (пусто, пока индекс прогревается)"""
+        self._ensure_related()
+        terms = self._terms(listing.genre, listing.tags)
+        if not terms or self._related_state != 'ready':
+            return []
+
+        candidates = {}
+        with self._lock:
+            total = max(len(self._listing_terms), 1)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                weight = math.log(1 + total / self._term_counts[term])
+                for candidate in postings[-CANDIDATES_PER_TERM:]:
+                    candidates[candidate] = candidates.get(candidate, 0.0) + weight
+            candidates.pop(listing.id, None)
+
+            # При равном совпадении выше - популярные
+            def key(item):
+                slot = self._slots.get(item[0])
+                return item[1], self._scores[slot] if slot is not None else 0.0
+
+            best = heapq.nlargest(limit * 2, candidates.items(), key=key)
+
+        return load_cards([candidate for candidate, _ in best], *_published())[:limit]
+
+    def shutdown(self):
+        """Останавливает поток и делает последний снимок"""
+        if self._flusher is not None:
+            self._flusher.stop()
+        try:
+            self.snapshot()
+        except Exception:
+            logger.exception("Final ranking snapshot failed")
+
+
+# Глобальный индекс ранжирования
+ranking_index = RankingIndex()
@@ -0,0 +1,321 @@
+"""Ограничение частоты запросов (token bucket) по пользователю Telegram и IP.
+
+Каждый ключ - ведро на burst жетонов, которое пополняется с постоянной
+скоростью; запрос забирает жетон или получает 429 с Retry-After.
+Проверка - O(1): одно чтение и одна запись состояния ведра.
+
+Ключ - проверенный telegram_id из X-Telegram-User (initData), без него -
+IP клиента. Квоты задаются на маршрут (RATE_LIMITS), а флаги
+users.is_banned / users.is_premium выбирают уровень: забаненным
+отказывается сразу, премиум получает квоту в RATE_LIMIT_PREMIUM_FACTOR
+раз больше. Флаги кешируются в памяти на RATE_LIMIT_TIER_TTL секунд.
+
+Бэкенд - ведра в памяти процесса (RATE_LIMIT_BACKEND=local) или общее
+хранилище (shared: Redis по REDIS_URL с атомарным Lua-скриптом или
+LocalStore).
+"""
+import math
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+
+from flask import jsonify, render_template, request
+
+from app.init_data import USER_HEADER, init_data_validator
+from app.metrics import instrumentation
+from app.models.listing import db
+from app.page_cache import LRUBackend
+from app.shared_store import get_shared_store, is_local
+
+# Квоты по умолчанию: '<жетонов>/<период>' (second, minute, hour, day)
+DEFAULT_LIMITS = {
+    'create_listing': '5/minute',
+    'track_contact': '30/minute',
+    'webhook': '20/minute',
+}
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+_QUOTA_RE = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$')
+
+# rate - жетонов в секунду, burst - емкость ведра
+Quota = namedtuple('Quota', ['rate', 'burst'])
+Decision = namedtuple('Decision', ['allowed', 'retry_after', 'tier'])
+
+TIER_BANNED = 'banned'
+TIER_PREMIUM = 'premium'
+TIER_USER = 'user'
+TIER_ANONYMOUS = 'anonymous'
+
+# Флаги уровня пользователя; ASGI-режим выполняет тот же запрос async-движком
+TIER_QUERY = db.text("SELECT is_banned, is_premium FROM users WHERE telegram_id = :id")
+
+rate_limited = instrumentation.registry.counter(
+    'rate_limited', 'Отклоненные ограничителем запросы', ('scope', 'tier'))
+
+
+def parse_quota(value):
+    """'5/minute' или '100/10minutes' -> Quota(rate, burst)"""
+    if isinstance(value, Quota):
+        return value
+    match = _QUOTA_RE.match(str(value))
+    if match is None:
+        raise ValueError(f'Invalid rate limit: {value!r}')
+    amount, multiplier, unit = match.groups()
+    period = _PERIODS[unit] * int(multiplier or 1)
+    return Quota(int(amount) / period, int(amount))
+
+
+def _refill(tokens, stamp, now, quota):
+    """Жетоны в ведре на момент now"""
+    if tokens is None:
+        return float(quota.burst)
+    return min(float(quota.burst), float(tokens) + max(0.0, now - float(stamp)) * quota.rate)
+
+
+def _retry_after(tokens, quota, cost):
+    return (cost - tokens) / quota.rate
+
+
+class MemoryBuckets:
+    """Ведра в памяти процесса, самые давние вытесняются при переполнении"""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, quota, cost=1):
+        """(разрешено, через сколько секунд повторить)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, stamp = self._buckets.get(key, (None, now))
+            tokens = _refill(tokens, stamp, now, quota)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else _retry_after(tokens, quota, cost)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+# Та же арифметика, что в _refill, но атомарно на стороне Redis
+_TAKE_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local rate, burst, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local tokens = burst
+if state[1] then
+    tokens = math.min(burst, tonumber(state[1]) + math.max(0, now - tonumber(state[2])) * rate)
+end
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[5]))
+return {allowed, tostring(tokens)}
+"""
+
+
+class SharedBuckets:
+    """Ведра в общем хранилище - квота общая для всех воркеров"""
+
+    KEY_PREFIX = 'ratelimit'
+
+    def __init__(self, store):
+        self.store = store
+        self._script = None if is_local(store) else store.register_script(_TAKE_SCRIPT)
+        self._lock = threading.Lock()
+
+    def take(self, key, quota, cost=1):
+        key = f'{self.KEY_PREFIX}:{key}'
+        now = time.time()
+        # Полное ведро без запросов ничем не отличается от отсутствующего ключа
+        ttl = int(quota.burst / quota.rate) + 1
+
+        if self._script is not None:
+            allowed, tokens = self._script(keys=[key], args=[quota.rate, quota.burst, cost, now, ttl])
+            tokens = float(tokens)
+            allowed = bool(int(allowed))
+        else:
+            # LocalStore живет в этом процессе - атомарность дает блокировка
+            with self._lock:
+                tokens, stamp = self.store.hmget(key, ['tokens', 'ts'])
+                tokens = _refill(tokens, stamp, now, quota)
+                allowed = tokens >= cost
+                if allowed:
+                    tokens -= cost
+                self.store.hset(key, mapping={'tokens': tokens, 'ts': now})
+                self.store.expire(key, ttl)
+        return allowed, 0.0 if allowed else _retry_after(tokens, quota, cost)
+
+    def clear(self):
+        keys = self.store.keys(f'{self.KEY_PREFIX}:*')
+        if keys:
+            self.store.delete(*keys)
+
+
+class RateLimiter:
+    """Квоты маршрутов с уровнями по флагам пользователя"""
+
+    def __init__(self):
+        self.enabled = True
+        self.limits = {scope: parse_quota(value) for scope, value in DEFAULT_LIMITS.items()}
+        self.premium_factor = 3.0
+        self.trust_proxy = False
+        self.backend = MemoryBuckets()
+        self._tiers = LRUBackend(10000)
+        self.tier_ttl = 60
+
+    def init_app(self, app):
+        """Квоты (RATE_LIMITS), уровни и бэкенд (RATE_LIMIT_BACKEND)"""
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', True)
+        limits = dict(DEFAULT_LIMITS, **app.config.get('RATE_LIMITS', {}))
+        self.limits = {scope: parse_quota(value) for scope, value in limits.items()}
+        self.premium_factor = app.config.get('RATE_LIMIT_PREMIUM_FACTOR', self.premium_factor)
+        self.trust_proxy = app.config.get('RATE_LIMIT_TRUST_PROXY', self.trust_proxy)
+        self.tier_ttl = app.config.get('RATE_LIMIT_TIER_TTL', self.tier_ttl)
+
+        if app.config.get('RATE_LIMIT_BACKEND', 'local') == 'shared':
+            self.backend = SharedBuckets(get_shared_store(app.config.get('RATE_LIMIT_REDIS_URL')))
+        else:
+            self.backend = MemoryBuckets()
+        self._tiers.clear()
+
+        app.extensions['rate_limiter'] = self
+
+    # ------------------------------------------------------------------
+    # Уровни
+    # ------------------------------------------------------------------
+
+    def tier_for(self, telegram_id):
+        """Уровень пользователя по users.is_banned / users.is_premium"""
+        if telegram_id is None:
+            return TIER_ANONYMOUS
+        tier = self.cached_tier(telegram_id)
+        if tier is None:
+            row = db.session.execute(TIER_QUERY, {'id': telegram_id}).first()
+            tier = self.remember_tier(telegram_id, row)
+        return tier
+
+    def cached_tier(self, telegram_id):
+        """Уровень из кеша или None, если нужен запрос TIER_QUERY"""
+        if telegram_id is None:
+            return TIER_ANONYMOUS
+        return self._tiers.get(telegram_id)
+
+    def remember_tier(self, telegram_id, row):
+        """Кеширует уровень по строке TIER_QUERY (None - пользователя нет)"""
+        if row is not None and row.is_banned:
+            tier = TIER_BANNED
+        elif row is not None and row.is_premium:
+            tier = TIER_PREMIUM
+        else:
+            tier = TIER_USER
+        self._tiers.set(telegram_id, tier, self.tier_ttl)
+        return tier
+
+    def forget(self, telegram_id):
+        """Сбрасывает закешированный уровень (после бана или смены премиума)"""
+        self._tiers.set(telegram_id, None, 0)
+
+    # ------------------------------------------------------------------
+    # Проверки
+    # ------------------------------------------------------------------
+
+    def check(self, scope, key, telegram_id=None, cost=1, tier=None):
+        """Забирает жетон из ведра scope для ключа; возвращает Decision
+
+        tier - уже известный уровень (ASGI-режим получает его без db.session).
+        """
+        if not self.enabled:
+            return Decision(True, 0.0, None)
+        tier = tier or self.tier_for(telegram_id)
+        if tier == TIER_BANNED:
+            rate_limited.inc(scope=scope, tier=tier)
+            return Decision(False, None, tier)
+
+        quota = self.limits[scope]
+        if tier == TIER_PREMIUM:
+            quota = Quota(quota.rate * self.premium_factor, quota.burst * self.premium_factor)
+
+        allowed, retry_after = self.backend.take(f'{scope}:{key}', quota, cost)
+        if not allowed:
+            rate_limited.inc(scope=scope, tier=tier)
+        return Decision(allowed, retry_after, tier)
+
+    def check_user(self, scope, telegram_id, tier=None):
+        """Проверка по известному telegram_id (например, из апдейта бота)"""
+        return self.check(scope, f'user:{telegram_id}', telegram_id, tier=tier)
+
+    def check_request(self, scope):
+        """Проверка текущего запроса: проверенный пользователь или IP"""
+        telegram_id = self._request_user_id()
+        if telegram_id is not None:
+            return self.check_user(scope, telegram_id)
+        return self.check(scope, f'ip:{self._client_ip()}')
+
+    def _request_user_id(self):
+        return self.user_id_from_header(request.headers.get(USER_HEADER))
+
+    def user_id_from_header(self, header):
+        """Проверенный telegram_id из заголовка X-Telegram-User или None"""
+        if not header:
+            return None
+        # Повторная проверка того же заголовка в представлении - из кеша
+        is_valid, user_data = init_data_validator.validate(header)
+        if is_valid and isinstance(user_data, dict):
+            return user_data.get('id')
+        return None
+
+    def _client_ip(self):
+        if self.trust_proxy and request.access_route:
+            return request.access_route[0]
+        return request.remote_addr or 'unknown'
+
+    def limit(self, scope, methods=None, json=False):
+        """Декоратор маршрута: квота scope для методов methods (по умолчанию - все)"""
+        if scope not in self.limits:
+            raise ValueError(f'No rate limit configured for scope: {scope}')
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if methods is None or request.method in methods:
+                    decision = self.check_request(scope)
+                    if not decision.allowed:
+                        return self._limited_response(decision, json)
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def rejection(self, decision):
+        """(сообщение, статус, заголовки) ответа на отклоненный запрос"""
+        if decision.tier == TIER_BANNED:
+            message, status = 'Аккаунт заблокирован', 403
+        else:
+            message, status = 'Слишком много запросов, попробуйте позже', 429
+        headers = {}
+        if decision.retry_after:
+            headers['Retry-After'] = str(math.ceil(decision.retry_after))
+        return message, status, headers
+
+    def _limited_response(self, decision, json):
+        message, status, headers = self.rejection(decision)
+        if json:
+            response = jsonify({'success': False, 'error': message})
+        else:
+            response = render_template('error.html', title='Доступ ограничен', message=message)
+        return response, status, headers
+
+
+# Глобальный ограничитель
+rate_limiter = RateLimiter()
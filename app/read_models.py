@@ -0,0 +1,61 @@
+"""Легкие модели чтения для списков объявлений.
+
+Ленты и поиск показывают карточки, которым не нужны полные тексты
+description и tags, а ORM-объекты с отслеживанием состояния для них
+избыточны. Запросы списков выбирают только колонки карточки (длинные
+тексты - обрезанными до PREVIEW_LENGTH символов) и упаковывают строки в
+ListingCard со __slots__. Страница объявления по-прежнему загружает
+полный объект Listing.
+"""
+from app.models.listing import db, Listing
+
+# Колонки карточки в ленте, поиске и JSON-списках
+CARD_FIELDS = (
+    'id', 'listing_type', 'author', 'contact', 'item_type', 'genre',
+    'preview_url', 'price', 'price_usd', 'license', 'includes',
+    'delivery_time', 'views', 'contacts_clicked', 'created_at', 'updated_at',
+)
+# Длинные тексты - только начало для превью в карточке
+PREVIEW_FIELDS = ('description', 'tags')
+PREVIEW_LENGTH = 300
+
+
+class ListingCard:
+    """Карточка объявления: только поля для списков, без ORM-состояния"""
+
+    __slots__ = CARD_FIELDS + PREVIEW_FIELDS
+
+    def __init__(self, row):
+        for name, value in zip(self.__slots__, row):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return f'<ListingCard {self.id}>'
+
+
+def card_columns():
+    """Выражения колонок в порядке ListingCard.__slots__"""
+    columns = [getattr(Listing, field) for field in CARD_FIELDS]
+    columns += [
+        db.func.substr(getattr(Listing, field), 1, PREVIEW_LENGTH).label(field)
+        for field in PREVIEW_FIELDS
+    ]
+    return columns
+
+
+def to_cards(rows):
+    return [ListingCard(row) for row in rows]
+
+
+def load_cards(ids, *criteria):
+    """Карточки по списку id в том же порядке (пропавшие id пропускаются)
+
+    criteria - дополнительные условия, например только опубликованные.
+    """
+    if not ids:
+        return []
+    rows = db.session.execute(
+        db.select(*card_columns()).where(Listing.id.in_(ids), *criteria)
+    ).all()
+    by_id = {row.id: row for row in rows}
+    return [ListingCard(by_id[listing_id]) for listing_id in ids if listing_id in by_id]
@@ -0,0 +1,372 @@
+"""Полнотекстовый поиск по объявлениям.
+
+На SQLite используется виртуальная таблица FTS5 (ранжирование bm25),
+на остальных бэкендах (DATABASE_URL) - простой инвертированный индекс
+в таблице search_postings. Оба варианта хранят уже нормализованные
+основы слов, поэтому запросы "биты" и "бит" находят одно и то же.
+"""
+import re
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from app.models.listing import db, Listing
+from app.pagination import Page, InvalidCursor, encode_cursor, decode_cursor
+from app.read_models import load_cards
+
+# Поля объявления, которые попадают в индекс, и их вес при ранжировании
+SEARCH_FIELDS = (
+    ('description', 1.0),
+    ('author', 4.0),
+    ('item_type', 2.0),
+    ('genre', 2.0),
+    ('tags', 3.0),
+)
+
+MAX_QUERY_TERMS = 8
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_CYRILLIC_RE = re.compile(r'[а-я]')
+
+# Окончания отсортированы от длинных к коротким - срезаем самое длинное
+_RU_SUFFIXES = sorted((
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ого', 'его', 'ому',
+    'ему', 'ыми', 'ими', 'ешь', 'ете', 'ишь', 'ите', 'ует', 'уют', 'ала',
+    'ила', 'ыла', 'ать', 'ять', 'ить', 'еть', 'ов', 'ев', 'ей', 'ий', 'ый',
+    'ой', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ую', 'юю', 'ам', 'ям', 'ах',
+    'ях', 'ом', 'ем', 'ым', 'им', 'ых', 'их', 'ию', 'ия', 'ет', 'ут',
+    'ют', 'ат', 'ят', 'ла', 'ли', 'ло', 'а', 'я', 'о', 'е', 'ы', 'и', 'у',
+    'ю', 'ь', 'й',
+), key=len, reverse=True)
+
+_EN_SUFFIXES = sorted((
+    'ations', 'ation', 'ings', 'ing', 'ness', 'ment', 'ers', 'ies', 'ied',
+    'est', 'er', 'ed', 'es', 'ly', 's',
+), key=len, reverse=True)
+
+
+def stem(word):
+    """Грубый стеммер для русского и английского (срезает окончания)"""
+    word = word.lower().replace('ё', 'е')
+    if word.isdigit():
+        return word
+
+    if _CYRILLIC_RE.search(word):
+        if word.endswith(('ся', 'сь')) and len(word) > 5:
+            word = word[:-2]
+        suffixes, min_stem = _RU_SUFFIXES, 3
+    else:
+        suffixes, min_stem = _EN_SUFFIXES, 3
+
+    for suffix in suffixes:
+        if word.endswith(suffix) and len(word) - len(suffix) >= min_stem:
+            return word[:-len(suffix)]
+    return word
+
+
+def analyze(text):
+    """Разбивает текст на токены и приводит их к основам"""
+    if not text:
+        return []
+    return [stem(token) for token in _WORD_RE.findall(text)]
+
+
+def _listing_field_terms(listing):
+    """Возвращает нормализованный текст каждого индексируемого поля"""
+    return {
+        field: ' '.join(analyze(getattr(listing, field, None) or ''))
+        for field, _ in SEARCH_FIELDS
+    }
+
+
+class SearchEngine:
+    """Поисковый движок с бэкендами FTS5 и инвертированного индекса"""
+
+    FTS_TABLE = 'listings_fts'
+    POSTINGS_TABLE = 'search_postings'
+
+    def __init__(self):
+        self.backend = None
+        self._listeners_registered = False
+
+    def init_app(self, app):
+        """Подписывается на изменения объявлений (таблицы - create_schema())"""
+        if not self._listeners_registered:
+            event.listen(Listing, 'after_insert', self._after_insert)
+            event.listen(Listing, 'after_update', self._after_update)
+            event.listen(Listing, 'after_delete', self._after_delete)
+            self._listeners_registered = True
+
+        app.extensions['search_engine'] = self
+
+    # ------------------------------------------------------------------
+    # Схема
+    # ------------------------------------------------------------------
+
+    def create_schema(self):
+        """Создает таблицы индекса и заполняет пустой индекс (шаг деплоя)"""
+        if self._ensure_schema():
+            self.reindex()
+
+    def _backend_for(self, conn):
+        """Бэкенд по уже созданным таблицам - без DDL в пути запроса"""
+        if self.backend is None:
+            backend = 'postings'
+            if conn.dialect.name == 'sqlite':
+                exists = conn.execute(db.text(
+                    "SELECT 1 FROM sqlite_master WHERE name = :name"
+                ), {'name': self.FTS_TABLE}).first()
+                if exists is not None:
+                    backend = 'fts5'
+            self.backend = backend
+        return self.backend
+
+    def _ensure_schema(self):
+        """Выбирает бэкенд и создает таблицы; True если индекс был пустым"""
+        engine = db.engine
+        if engine.dialect.name == 'sqlite':
+            columns = ', '.join(field for field, _ in SEARCH_FIELDS)
+            try:
+                with engine.begin() as conn:
+                    exists = conn.execute(db.text(
+                        "SELECT 1 FROM sqlite_master WHERE name = :name"
+                    ), {'name': self.FTS_TABLE}).first()
+                    conn.execute(db.text(
+                        f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.FTS_TABLE} "
+                        f"USING fts5({columns}, tokenize='unicode61', prefix='2 3')"
+                    ))
+                self.backend = 'fts5'
+                return exists is None
+            except OperationalError:
+                # SQLite собран без FTS5 - падаем на инвертированный индекс
+                pass
+
+        with engine.begin() as conn:
+            conn.execute(db.text(
+                f"CREATE TABLE IF NOT EXISTS {self.POSTINGS_TABLE} ("
+                "term VARCHAR(64) NOT NULL, "
+                "listing_id INTEGER NOT NULL, "
+                "weight FLOAT NOT NULL, "
+                "PRIMARY KEY (term, listing_id))"
+            ))
+            conn.execute(db.text(
+                f"CREATE INDEX IF NOT EXISTS ix_{self.POSTINGS_TABLE}_listing "
+                f"ON {self.POSTINGS_TABLE} (listing_id)"
+            ))
+            empty = conn.execute(db.text(
+                f"SELECT 1 FROM {self.POSTINGS_TABLE} LIMIT 1"
+            )).first() is None
+        self.backend = 'postings'
+        return empty
+
+    # ------------------------------------------------------------------
+    # Индексация
+    # ------------------------------------------------------------------
+
+    def index_listing(self, conn, listing):
+        """Добавляет или обновляет объявление в индексе"""
+        self.remove_listing(conn, listing.id)
+        if not listing.is_active:
+            return
+
+        terms = _listing_field_terms(listing)
+        if self._backend_for(conn) == 'fts5':
+            params = dict(terms, rowid=listing.id)
+            columns = ', '.join(field for field, _ in SEARCH_FIELDS)
+            values = ', '.join(f':{field}' for field, _ in SEARCH_FIELDS)
+            conn.execute(db.text(
+                f"INSERT INTO {self.FTS_TABLE} (rowid, {columns}) "
+                f"VALUES (:rowid, {values})"
+            ), params)
+            return
+
+        weights = {}
+        for field, weight in SEARCH_FIELDS:
+            for term in terms[field].split():
+                term = term[:64]
+                weights[term] = weights.get(term, 0.0) + weight
+        if weights:
+            conn.execute(db.text(
+                f"INSERT INTO {self.POSTINGS_TABLE} (term, listing_id, weight) "
+                "VALUES (:term, :listing_id, :weight)"
+            ), [
+                {'term': term, 'listing_id': listing.id, 'weight': weight}
+                for term, weight in weights.items()
+            ])
+
+    def remove_listing(self, conn, listing_id):
+        """Удаляет объявление из индекса"""
+        if self._backend_for(conn) == 'fts5':
+            conn.execute(db.text(
+                f"DELETE FROM {self.FTS_TABLE} WHERE rowid = :id"
+            ), {'id': listing_id})
+        else:
+            conn.execute(db.text(
+                f"DELETE FROM {self.POSTINGS_TABLE} WHERE listing_id = :id"
+            ), {'id': listing_id})
+
+    def reindex(self, batch_size=500):
+        """Полностью перестраивает индекс по таблице listings"""
+        columns = ', '.join(field for field, _ in SEARCH_FIELDS)
+        indexed = 0
+        with db.engine.begin() as conn:
+            table = self.FTS_TABLE if self._backend_for(conn) == 'fts5' else self.POSTINGS_TABLE
+            conn.execute(db.text(f"DELETE FROM {table}"))
+
+            last_id = 0
+            while True:
+                batch = conn.execute(db.text(
+                    f"SELECT id, is_active, {columns} FROM listings "
+                    "WHERE id > :last_id AND is_active = :active "
+                    "ORDER BY id LIMIT :limit"
+                ), {'last_id': last_id, 'active': True, 'limit': batch_size}).all()
+                if not batch:
+                    break
+                for row in batch:
+                    self.index_listing(conn, row)
+                indexed += len(batch)
+                last_id = batch[-1].id
+        return indexed
+
+    def _after_insert(self, mapper, connection, target):
+        self.index_listing(connection, target)
+
+    def _after_update(self, mapper, connection, target):
+        # Счетчики просмотров/кликов не должны переиндексировать объявление
+        state = db.inspect(target)
+        watched = [field for field, _ in SEARCH_FIELDS] + ['is_active']
+        if any(state.attrs[field].history.has_changes() for field in watched):
+            self.index_listing(connection, target)
+
+    def _after_delete(self, mapper, connection, target):
+        self.remove_listing(connection, target.id)
+
+    # ------------------------------------------------------------------
+    # Поиск
+    # ------------------------------------------------------------------
+
+    def search(self, query_text, listing_type=None, genre=None,
+               item_type=None, limit=50, cursor=None,
+               min_price=None, max_price=None, sort='relevance'):
+        """Ищет объявления и возвращает страницу карточек в порядке релевантности
+
+        Страницы листаются курсором по ключу (релевантность, id): следующая
+        страница начинается строго после последней показанной строки.
+        sort='price_asc'/'price_desc' упорядочивает найденное по цене,
+        тогда ключом курсора служит (price_usd, id).
+        """
+        terms = list(dict.fromkeys(analyze(query_text)))[:MAX_QUERY_TERMS]
+        if not terms:
+            return Page([], None)
+
+        filters = ['l.is_active = :active', 'l.is_moderated = :moderated']
+        params = {'active': True, 'moderated': True, 'limit': limit + 1}
+        for column, value in (('listing_type', listing_type),
+                              ('genre', genre),
+                              ('item_type', item_type)):
+            if value:
+                filters.append(f'l.{column} = :{column}')
+                params[column] = value
+        if min_price is not None:
+            filters.append('l.price_usd >= :min_price')
+            params['min_price'] = min_price
+        if max_price is not None:
+            filters.append('l.price_usd <= :max_price')
+            params['max_price'] = max_price
+
+        by_price = sort in ('price_asc', 'price_desc')
+        kind = f'search:{sort}' if by_price else 'search'
+        after = None
+        if cursor:
+            values = decode_cursor(cursor, kind)
+            try:
+                after = (float(values[0]), int(values[1]))
+            except (IndexError, TypeError, ValueError):
+                raise InvalidCursor('Некорректный курсор')
+            params['after_score'], params['after_id'] = after
+
+        order_by = None
+        if by_price:
+            filters.append('l.price_usd IS NOT NULL')
+            direction, op = ('DESC', '<') if sort == 'price_desc' else ('ASC', '>')
+            if after is not None:
+                filters.append(
+                    f"(l.price_usd {op} :after_score OR "
+                    f"(l.price_usd = :after_score AND l.id {op} :after_id))"
+                )
+            order_by = f'l.price_usd {direction}, l.id {direction}'
+
+        paged = after is not None and not by_price
+        if self._backend_for(db.session.connection()) == 'fts5':
+            sql, match_params = self._fts_query(terms, filters, paged, order_by)
+        else:
+            sql, match_params = self._postings_query(terms, filters, paged, order_by)
+        params.update(match_params)
+
+        rows = db.session.execute(db.text(sql), params).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(kind, last.price_usd if by_price else last.score, last.id)
+
+        ids = [row.id for row in rows]
+        if not ids:
+            return Page([], None)
+
+        return Page(load_cards(ids), next_cursor)
+
+    def _fts_query(self, terms, filters, paged, order_by=None):
+        # Каждый терм ищется как префикс, все термы обязательны (AND)
+        match = ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+        weights = ', '.join(str(weight) for _, weight in SEARCH_FIELDS)
+        # bm25 тем меньше, чем документ релевантнее
+        score = f"bm25({self.FTS_TABLE}, {weights})"
+        if paged:
+            filters = filters + [
+                f"({score} > :after_score OR "
+                f"({score} = :after_score AND l.id < :after_id))"
+            ]
+        sql = (
+            f"SELECT l.id, l.price_usd, {score} AS score FROM {self.FTS_TABLE} f "
+            f"JOIN listings l ON l.id = f.rowid "
+            f"WHERE {self.FTS_TABLE} MATCH :match AND {' AND '.join(filters)} "
+            f"ORDER BY {order_by or 'score, l.id DESC'} "
+            "LIMIT :limit"
+        )
+        return sql, {'match': match}
+
+    def _postings_query(self, terms, filters, paged, order_by=None):
+        # Префиксный поиск по диапазону term >= t AND term < t + U+FFFF
+        # работает по первичному ключу на любом бэкенде
+        parts = []
+        params = {'n_terms': len(terms)}
+        for i, term in enumerate(terms):
+            parts.append(
+                f"SELECT listing_id, {i} AS term_no, SUM(weight) AS score "
+                f"FROM {self.POSTINGS_TABLE} "
+                f"WHERE term >= :t{i} AND term < :h{i} GROUP BY listing_id"
+            )
+            params[f't{i}'] = term
+            params[f'h{i}'] = term + '\uffff'
+
+        having = ["COUNT(DISTINCT m.term_no) = :n_terms"]
+        if paged:
+            having.append(
+                "(SUM(m.score) < :after_score OR "
+                "(SUM(m.score) = :after_score AND l.id < :after_id))"
+            )
+        sql = (
+            "SELECT l.id, l.price_usd, SUM(m.score) AS score FROM listings l "
+            f"JOIN ({' UNION ALL '.join(parts)}) m ON m.listing_id = l.id "
+            f"WHERE {' AND '.join(filters)} "
+            "GROUP BY l.id "
+            f"HAVING {' AND '.join(having)} "
+            f"ORDER BY {order_by or 'score DESC, l.id DESC'} "
+            "LIMIT :limit"
+        )
+        return sql, params
+
+
+# Глобальный экземпляр поискового движка
+search_engine = SearchEngine()
@@ -0,0 +1,148 @@
+"""Общее хранилище для нескольких воркеров (Redis) с локальной заменой.
+
+Если задан REDIS_URL и установлен пакет redis, подсистемы (счетчики,
+кэши, лимиты) работают через общий Redis. Иначе используется LocalStore -
+потокобезопасная реализация нужного подмножества команд Redis в памяти
+процесса. Интерфейс одинаковый, поэтому код подсистем не знает, какой
+бэкенд под ним.
+"""
+import fnmatch
+import os
+import threading
+import time
+
+
+class LocalStore:
+    """Подмножество команд Redis в памяти процесса"""
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._lock = threading.RLock()
+
+    def _alive(self, key):
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._data
+
+    # Строки
+
+    def get(self, key):
+        with self._lock:
+            return self._data.get(key) if self._alive(key) else None
+
+    def set(self, key, value, ex=None, nx=False):
+        with self._lock:
+            if nx and self._alive(key) and key in self._data:
+                return None
+            self._data[key] = value
+            if ex:
+                self._expires[key] = time.monotonic() + ex
+            else:
+                self._expires.pop(key, None)
+            return True
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            value = int(self.get(key) or 0) + amount
+            self._data[key] = value
+            return value
+
+    # Хэши
+
+    def hincrby(self, key, field, amount=1):
+        with self._lock:
+            if not self._alive(key):
+                self._data[key] = {}
+            bucket = self._data[key]
+            bucket[field] = int(bucket.get(field, 0)) + amount
+            return bucket[field]
+
+    def hget(self, key, field):
+        with self._lock:
+            if not self._alive(key):
+                return None
+            return self._data[key].get(field)
+
+    def hmget(self, key, fields):
+        with self._lock:
+            bucket = self._data[key] if self._alive(key) else {}
+            return [bucket.get(field) for field in fields]
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        with self._lock:
+            if not self._alive(key):
+                self._data[key] = {}
+            bucket = self._data[key]
+            items = dict(mapping or {})
+            if field is not None:
+                items[field] = value
+            bucket.update(items)
+            return len(items)
+
+    def hgetall(self, key):
+        with self._lock:
+            return dict(self._data[key]) if self._alive(key) else {}
+
+    # Ключи
+
+    def exists(self, key):
+        with self._lock:
+            return int(self._alive(key))
+
+    def delete(self, *keys):
+        with self._lock:
+            removed = 0
+            for key in keys:
+                if self._alive(key):
+                    removed += 1
+                self._data.pop(key, None)
+                self._expires.pop(key, None)
+            return removed
+
+    def rename(self, src, dst):
+        with self._lock:
+            if not self._alive(src):
+                raise KeyError(src)
+            self._data[dst] = self._data.pop(src)
+            if src in self._expires:
+                self._expires[dst] = self._expires.pop(src)
+            else:
+                self._expires.pop(dst, None)
+            return True
+
+    def expire(self, key, seconds):
+        with self._lock:
+            if not self._alive(key):
+                return False
+            self._expires[key] = time.monotonic() + seconds
+            return True
+
+    def keys(self, pattern='*'):
+        with self._lock:
+            return [key for key in list(self._data)
+                    if self._alive(key) and fnmatch.fnmatchcase(key, pattern)]
+
+
+# Общий экземпляр для процесса - подсистемы делят его так же, как делили бы Redis
+local_store = LocalStore()
+
+
+def get_shared_store(url=None):
+    """Возвращает клиент Redis по REDIS_URL или локальную замену"""
+    url = url or os.environ.get('REDIS_URL')
+    if url:
+        try:
+            import redis
+        except ImportError:
+            redis = None
+        if redis is not None:
+            return redis.Redis.from_url(url, decode_responses=True)
+    return local_store
+
+
+def is_local(store):
+    """True, если хранилище живет в памяти текущего процесса"""
+    return isinstance(store, LocalStore)
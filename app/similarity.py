@@ -0,0 +1,385 @@
+"""Поиск почти-дубликатов объявлений (MinHash + LSH).
+
+Спамеры перевыкладывают тот же бит с мелкими правками, поэтому точное
+сравнение (find_duplicate в moderation_pipeline) их не ловит. Для каждого
+активного объявления из описания, тегов и ссылки на превью строится
+множество шинглов и его MinHash-подпись; подпись режется на полосы (LSH),
+ключи полос лежат в индексированной таблице similarity_buckets.
+
+Кандидаты для нового объявления - только объявления с общей полосой
+(несколько точечных запросов по индексу вместо сравнения со всем
+каталогом), а похожесть оценивается по совпадению подписей.
+"""
+import hashlib
+import random
+import struct
+from collections import namedtuple
+from collections.abc import Mapping
+from datetime import datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import sqlalchemy as sa
+from sqlalchemy import event
+
+from app.models.listing import db, Listing
+from app.page_cache import page_cache
+from app.search import analyze, search_engine
+from app.stats import platform_stats
+
+# 16 полос по 4 строки: пара с похожестью 0.7 становится кандидатом
+# с вероятностью ~0.98, с похожестью 0.3 - ~0.12
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+SHINGLE_SIZE = 3
+MAX_CANDIDATES = 200
+DEFAULT_THRESHOLD = 0.7
+
+# Поля, изменение которых меняет подпись
+WATCHED_FIELDS = ('description', 'tags', 'preview_url', 'is_active')
+
+# Метки в ссылках, которые не меняют сам трек
+_TRACKING_PARAMS = {'si', 'feature', 'ref', 'fbclid'}
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+_SIGNATURE = struct.Struct(f'>{NUM_PERM}Q')
+
+similarity_metadata = sa.MetaData()
+
+signatures_table = sa.Table(
+    'similarity_signatures', similarity_metadata,
+    sa.Column('listing_id', sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column('signature', sa.LargeBinary, nullable=False),
+)
+
+buckets_table = sa.Table(
+    'similarity_buckets', similarity_metadata,
+    sa.Column('band', sa.SmallInteger, primary_key=True, autoincrement=False),
+    sa.Column('bucket', sa.BigInteger, primary_key=True, autoincrement=False),
+    sa.Column('listing_id', sa.Integer, primary_key=True, autoincrement=False),
+    sa.Index('ix_similarity_buckets_listing', 'listing_id'),
+)
+
+DedupeReport = namedtuple('DedupeReport', ['checked', 'duplicates', 'pairs'])
+
+
+def _field(listing, name):
+    if isinstance(listing, Mapping):
+        return listing.get(name)
+    return getattr(listing, name, None)
+
+
+def normalize_url(url):
+    """Ссылка без схемы, www, завершающего слеша и меток трекинга"""
+    if not url:
+        return None
+    parts = urlsplit(url.strip().lower())
+    host = parts.netloc[4:] if parts.netloc.startswith('www.') else parts.netloc
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query)
+        if not key.startswith('utm_') and key not in _TRACKING_PARAMS
+    ]
+    normalized = host + parts.path.rstrip('/')
+    if query:
+        normalized += '?' + urlencode(sorted(query))
+    return normalized or None
+
+
+def shingles(listing):
+    """Множество шинглов объявления: n-граммы основ слов, теги и ссылка"""
+    words = analyze(_field(listing, 'description'))
+    if len(words) >= SHINGLE_SIZE:
+        result = {
+            ' '.join(words[i:i + SHINGLE_SIZE])
+            for i in range(len(words) - SHINGLE_SIZE + 1)
+        }
+    else:
+        result = {' '.join(words)} if words else set()
+
+    result.update(f'#{tag}' for tag in analyze(_field(listing, 'tags')))
+
+    url = normalize_url(_field(listing, 'preview_url'))
+    if url:
+        result.add(f'url:{url}')
+    return result
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def minhash(shingle_set):
+    """MinHash-подпись множества шинглов (None для пустого множества)"""
+    if not shingle_set:
+        return None
+    hashes = [_hash64(shingle) for shingle in shingle_set]
+    return tuple(
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def band_keys(signature):
+    """Ключ каждой LSH-полосы подписи (знаковое 64-битное число)"""
+    packed = _SIGNATURE.pack(*signature)
+    width = ROWS * 8
+    keys = []
+    for band in range(BANDS):
+        chunk = packed[band * width:(band + 1) * width]
+        keys.append(int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), 'big', signed=True))
+    return keys
+
+
+def similarity(left, right):
+    """Оценка коэффициента Жаккара по двум подписям"""
+    return sum(1 for a, b in zip(left, right) if a == b) / NUM_PERM
+
+
+class PendingIndex:
+    """LSH-индекс в памяти для объявлений, которых еще нет в базе
+
+    Порция импорта пишется одной транзакцией, и ее строки не видят друг
+    друга в similarity_buckets - их сверяет этот индекс.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self._signatures = []
+        self._buckets = {}
+
+    def add(self, listing):
+        """Добавляет объявление; возвращает похожие из добавленных раньше: [(номер, похожесть)]"""
+        signature = minhash(shingles(listing))
+        number = len(self._signatures)
+        self._signatures.append(signature)
+        if signature is None:
+            return []
+
+        candidates = set()
+        for key in enumerate(band_keys(signature)):
+            bucket = self._buckets.setdefault(key, [])
+            candidates.update(bucket)
+            bucket.append(number)
+
+        matches = []
+        for candidate in candidates:
+            score = similarity(signature, self._signatures[candidate])
+            if score >= self.threshold:
+                matches.append((candidate, score))
+        matches.sort(key=lambda match: (-match[1], match[0]))
+        return matches
+
+
+class SimilarityIndex:
+    """LSH-индекс MinHash-подписей активных объявлений"""
+
+    def __init__(self):
+        self.threshold = DEFAULT_THRESHOLD
+        self._listeners_registered = False
+
+    def init_app(self, app):
+        """Порог похожести и подписка на изменения объявлений"""
+        self.threshold = app.config.get('SIMILARITY_THRESHOLD', DEFAULT_THRESHOLD)
+
+        if not self._listeners_registered:
+            event.listen(Listing, 'after_insert', self._after_insert)
+            event.listen(Listing, 'after_update', self._after_update)
+            event.listen(Listing, 'after_delete', self._after_delete)
+            self._listeners_registered = True
+
+        app.extensions['similarity_index'] = self
+
+    def create_schema(self):
+        """Заполняет пустой индекс (таблицы создает миграция; шаг деплоя)"""
+        with db.engine.connect() as conn:
+            empty = conn.execute(sa.select(signatures_table.c.listing_id).limit(1)).first() is None
+        if empty:
+            self.reindex()
+
+    # ------------------------------------------------------------------
+    # Индексация
+    # ------------------------------------------------------------------
+
+    def index_listing(self, conn, listing):
+        """Добавляет или обновляет подпись объявления"""
+        self.remove_listing(conn, listing.id)
+        if listing.is_active:
+            self._insert(conn, [listing])
+
+    def remove_listing(self, conn, listing_id):
+        conn.execute(buckets_table.delete().where(buckets_table.c.listing_id == listing_id))
+        conn.execute(signatures_table.delete().where(signatures_table.c.listing_id == listing_id))
+
+    def _insert(self, conn, listings):
+        signatures, buckets = [], []
+        for listing in listings:
+            signature = minhash(shingles(listing))
+            if signature is None:
+                continue
+            signatures.append({'listing_id': listing.id, 'signature': _SIGNATURE.pack(*signature)})
+            buckets.extend(
+                {'band': band, 'bucket': key, 'listing_id': listing.id}
+                for band, key in enumerate(band_keys(signature))
+            )
+        if signatures:
+            conn.execute(signatures_table.insert(), signatures)
+            conn.execute(buckets_table.insert(), buckets)
+
+    def reindex(self, batch_size=500):
+        """Полностью перестраивает индекс по активным объявлениям"""
+        indexed = 0
+        with db.engine.begin() as conn:
+            conn.execute(buckets_table.delete())
+            conn.execute(signatures_table.delete())
+
+            last_id = 0
+            while True:
+                batch = conn.execute(db.text(
+                    "SELECT id, description, tags, preview_url FROM listings "
+                    "WHERE id > :last_id AND is_active = :active "
+                    "ORDER BY id LIMIT :limit"
+                ), {'last_id': last_id, 'active': True, 'limit': batch_size}).all()
+                if not batch:
+                    break
+                self._insert(conn, batch)
+                indexed += len(batch)
+                last_id = batch[-1].id
+        return indexed
+
+    def _after_insert(self, mapper, connection, target):
+        self.index_listing(connection, target)
+
+    def _after_update(self, mapper, connection, target):
+        # Счетчики и модерация не меняют подпись
+        state = db.inspect(target)
+        if any(state.attrs[field].history.has_changes() for field in WATCHED_FIELDS):
+            self.index_listing(connection, target)
+
+    def _after_delete(self, mapper, connection, target):
+        self.remove_listing(connection, target.id)
+
+    # ------------------------------------------------------------------
+    # Поиск
+    # ------------------------------------------------------------------
+
+    def find_similar(self, listing, threshold=None, exclude_id=None, before_id=None, conn=None):
+        """Похожие активные объявления: [(listing_id, похожесть)], самые похожие первыми
+
+        listing - объект или словарь с полями description, tags, preview_url.
+        before_id - только объявления старше указанного (для поиска оригинала).
+        """
+        signature = minhash(shingles(listing))
+        if signature is None:
+            return []
+        threshold = threshold or self.threshold
+        if conn is not None:
+            return self._matches(conn, signature, threshold, exclude_id, before_id)
+        with db.engine.connect() as conn:
+            return self._matches(conn, signature, threshold, exclude_id, before_id)
+
+    def _matches(self, conn, signature, threshold, exclude_id=None, before_id=None):
+        candidates = sa.select(buckets_table.c.listing_id).where(sa.or_(*(
+            sa.and_(buckets_table.c.band == band, buckets_table.c.bucket == key)
+            for band, key in enumerate(band_keys(signature))
+        ))).distinct().limit(MAX_CANDIDATES)
+        if exclude_id is not None:
+            candidates = candidates.where(buckets_table.c.listing_id != exclude_id)
+        if before_id is not None:
+            candidates = candidates.where(buckets_table.c.listing_id < before_id)
+
+        ids = conn.execute(candidates).scalars().all()
+        if not ids:
+            return []
+
+        rows = conn.execute(sa.select(signatures_table).where(
+            signatures_table.c.listing_id.in_(ids)
+        )).all()
+        matches = []
+        for row in rows:
+            score = similarity(signature, _SIGNATURE.unpack(row.signature))
+            if score >= threshold:
+                matches.append((row.listing_id, score))
+        matches.sort(key=lambda match: (-match[1], match[0]))
+        return matches
+
+    # ------------------------------------------------------------------
+    # Чистка каталога
+    # ------------------------------------------------------------------
+
+    def dedupe(self, threshold=None, action='review', dry_run=False, batch_size=500):
+        """Находит почти-дубликаты в каталоге; оригинал - самое старое объявление
+
+        action='review' снимает дубликат с публикации до проверки модератором,
+        action='deactivate' выключает его. Каждое решение пишется в
+        moderation_logs. dry_run - только отчет.
+        """
+        threshold = threshold or self.threshold
+        checked = 0
+        pairs = []
+        last_id = 0
+        while True:
+            # Каждая пачка - короткая отдельная транзакция
+            with db.engine.begin() as conn:
+                batch = conn.execute(db.text(
+                    "SELECT s.listing_id AS id, s.signature, l.is_moderated "
+                    "FROM similarity_signatures s JOIN listings l ON l.id = s.listing_id "
+                    "WHERE s.listing_id > :last_id ORDER BY s.listing_id LIMIT :limit"
+                ), {'last_id': last_id, 'limit': batch_size}).all()
+                if not batch:
+                    break
+
+                found = []
+                for row in batch:
+                    # Уже ждущие модератора повторно не помечаем
+                    if action == 'review' and not row.is_moderated:
+                        continue
+                    matches = self._matches(conn, _SIGNATURE.unpack(row.signature),
+                                            threshold, before_id=row.id)
+                    if matches:
+                        original_id, score = min(matches, key=lambda match: match[0])
+                        found.append((row.id, original_id, score))
+
+                if found and not dry_run:
+                    self._apply(conn, found, action)
+                pairs.extend(found)
+                checked += len(batch)
+                last_id = batch[-1].id
+
+        if pairs and not dry_run:
+            page_cache.invalidate()
+            platform_stats.invalidate()
+        return DedupeReport(checked, len(pairs), pairs)
+
+    def _apply(self, conn, found, action):
+        ids = [duplicate_id for duplicate_id, _, _ in found]
+        if action == 'deactivate':
+            conn.execute(db.text(
+                "UPDATE listings SET is_active = :flag WHERE id = :id"
+            ), [{'flag': False, 'id': listing_id} for listing_id in ids])
+            for listing_id in ids:
+                search_engine.remove_listing(conn, listing_id)
+                self.remove_listing(conn, listing_id)
+            log_action = 'deactivated_duplicate'
+        else:
+            conn.execute(db.text(
+                "UPDATE listings SET is_moderated = :flag WHERE id = :id"
+            ), [{'flag': False, 'id': listing_id} for listing_id in ids])
+            log_action = 'needs_review'
+
+        now = datetime.utcnow()
+        conn.execute(db.insert(db.metadata.tables['moderation_logs']), [
+            {'listing_id': duplicate_id, 'action': log_action,
+             'reason': f'Near-duplicate of #{original_id} ({score:.0%})',
+             'moderator': 'dedupe', 'created_at': now}
+            for duplicate_id, original_id, score in found
+        ])
+
+
+# Глобальный экземпляр индекса
+similarity_index = SimilarityIndex()
@@ -0,0 +1,155 @@
+"""Кэшированный снимок статистики платформы для /stats.
+
+Все счетчики объявлений считаются одним запросом с условной агрегацией,
+результат живет в кэше STATS_CACHE_TTL секунд и сбрасывается при
+создании, модерации и деактивации объявлений. Номер поколения кэша
+хранится в общем хранилище, поэтому сброс в одном воркере виден всем.
+"""
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.models.listing import db, Listing
+from app.shared_store import get_shared_store
+
+# Изменения этих полей влияют на статистику
+TRACKED_FIELDS = ('is_active', 'is_moderated', 'listing_type', 'genre')
+
+
+def counts_statement():
+    """SELECT всех счетчиков объявлений: всего, промодерировано, по типам"""
+    published = Listing.is_moderated == True
+
+    def published_of(listing_type):
+        return db.func.coalesce(db.func.sum(db.case(
+            (db.and_(published, Listing.listing_type == listing_type), 1),
+            else_=0
+        )), 0)
+
+    # Одна проходка по индексу вместо пяти COUNT
+    return db.select(
+        db.func.count(Listing.id),
+        db.func.coalesce(db.func.sum(db.case((published, 1), else_=0)), 0),
+        published_of('sell'),
+        published_of('buy'),
+        published_of('service')
+    ).where(Listing.is_active == True)
+
+
+def genres_statement(limit=10):
+    """SELECT популярных жанров среди опубликованных объявлений"""
+    return db.select(
+        Listing.genre,
+        db.func.count(Listing.id).label('count')
+    ).where(
+        Listing.is_active == True,
+        Listing.is_moderated == True
+    ).group_by(Listing.genre).order_by(db.text('count DESC')).limit(limit)
+
+
+class PlatformStats:
+    """Снимок статистики с TTL и явной инвалидацией"""
+
+    GENERATION_KEY = 'stats:generation'
+    DIRTY_FLAG = 'platform_stats_dirty'
+
+    def __init__(self):
+        self.ttl = 60
+        self.store = None
+        self._snapshot = None
+        self._computed_at = 0.0
+        self._generation = None
+        self._lock = threading.Lock()
+        self._listeners_registered = False
+
+    def init_app(self, app):
+        """Настраивает TTL и подписывается на изменения объявлений"""
+        self.ttl = app.config.get('STATS_CACHE_TTL', 60)
+        self.store = get_shared_store(app.config.get('STATS_REDIS_URL'))
+
+        if not self._listeners_registered:
+            event.listen(Listing, 'after_insert', self._on_change)
+            event.listen(Listing, 'after_update', self._on_update)
+            event.listen(Listing, 'after_delete', self._on_change)
+            event.listen(Session, 'after_commit', self._on_commit)
+            event.listen(Session, 'after_rollback', self._on_rollback)
+            self._listeners_registered = True
+
+        app.extensions['platform_stats'] = self
+
+    def invalidate(self):
+        """Сбрасывает снимок во всех воркерах"""
+        self._snapshot = None
+        if self.store is not None:
+            self.store.incr(self.GENERATION_KEY)
+
+    def snapshot(self, moderation_stats=None):
+        """Текущий снимок; пересчитывается только если устарел"""
+        generation = self.store.get(self.GENERATION_KEY) if self.store is not None else None
+        if self._is_fresh(generation):
+            return self._snapshot
+
+        with self._lock:
+            # Пока ждали блокировку, снимок мог пересчитать другой поток
+            if self._is_fresh(generation):
+                return self._snapshot
+
+            snapshot = self._compute()
+            if moderation_stats is not None:
+                snapshot['moderation'] = moderation_stats()
+
+            self._snapshot = snapshot
+            self._computed_at = time.monotonic()
+            self._generation = generation
+            return snapshot
+
+    def _is_fresh(self, generation):
+        return (
+            self._snapshot is not None
+            and self._generation == generation
+            and time.monotonic() - self._computed_at < self.ttl
+        )
+
+    def _compute(self):
+        row = db.session.execute(counts_statement()).one()
+        genre_stats = db.session.execute(genres_statement()).all()
+
+        total, active, sell, buy, service = (int(value) for value in row)
+        return {
+            'listings': {
+                'total': total,
+                'active': active,
+                'sell': sell,
+                'buy': buy,
+                'service': service
+            },
+            'genres': [(genre, count) for genre, count in genre_stats],
+            'moderation': {}
+        }
+
+    def _on_change(self, mapper, connection, target):
+        # Сбрасываем после коммита, иначе параллельный /stats закэширует
+        # незакоммиченные (или откаченные) данные под новым поколением
+        session = object_session(target)
+        if session is not None:
+            session.info[self.DIRTY_FLAG] = True
+        else:
+            self.invalidate()
+
+    def _on_update(self, mapper, connection, target):
+        state = db.inspect(target)
+        if any(state.attrs[field].history.has_changes() for field in TRACKED_FIELDS):
+            self._on_change(mapper, connection, target)
+
+    def _on_commit(self, session):
+        if session.info.pop(self.DIRTY_FLAG, False):
+            self.invalidate()
+
+    def _on_rollback(self, session):
+        session.info.pop(self.DIRTY_FLAG, None)
+
+
+# Глобальный снимок статистики
+platform_stats = PlatformStats()
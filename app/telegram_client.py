@@ -0,0 +1,410 @@
+"""Клиент Telegram Bot API с пулом соединений и очередью исходящих.
+
+Одна requests.Session на процесс держит keep-alive соединения к API,
+у каждого вызова есть таймауты и повторы с экспоненциальной задержкой
+(неидемпотентные методы вроде sendMessage - только при ошибке соединения),
+а ответ 429 останавливает отправку на parameters.retry_after секунд.
+Обработчик вебхука только ставит сообщения в очередь - отправляют их
+фоновые потоки, поэтому Telegram получает ответ сразу. Каждый вызов
+замеряется спаном telegram.<метод> (см. app.metrics).
+
+В ASGI-режиме (app.asgi) очередь разбирают задачи цикла событий через
+AsyncTelegramClient (httpx) вместо потоков.
+"""
+import asyncio
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from app.metrics import instrumentation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = 'https://api.telegram.org'
+
+# Методы, которые можно безопасно повторить после таймаута чтения: запрос
+# мог дойти до Telegram, и повтор sendMessage отправил бы сообщение дважды
+IDEMPOTENT_METHODS = frozenset({
+    'getMe', 'getUpdates', 'getWebhookInfo', 'setWebhook', 'deleteWebhook',
+    'getChat', 'getChatMember', 'getFile', 'setMyCommands',
+})
+
+
+def _connect_failed(error):
+    """True, если запрос requests не ушел: соединение не установлено"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if isinstance(error, requests.ConnectionError) and not isinstance(error, requests.exceptions.SSLError):
+        reason = error.args[0] if error.args else None
+        # requests заворачивает отказ соединения/DNS в MaxRetryError(reason=NewConnectionError);
+        # 'Connection aborted' (ProtocolError) приходит уже после отправки запроса
+        return isinstance(getattr(reason, 'reason', reason), NewConnectionError)
+    return False
+
+
+class TelegramError(Exception):
+    """Ошибка вызова Bot API"""
+
+    def __init__(self, message, error_code=None, retry_after=None, connect_failed=True):
+        super().__init__(message)
+        self.error_code = error_code
+        self.retry_after = retry_after
+        # False - запрос мог дойти до Telegram (таймаут чтения, обрыв ответа)
+        self.connect_failed = connect_failed
+
+
+class TelegramClient:
+    """Синхронный клиент Bot API поверх общей сессии"""
+
+    def __init__(self, token=None, api_url=None, connect_timeout=3.05,
+                 read_timeout=10, max_retries=3, backoff=0.5, pool_size=10):
+        self.token = token or os.environ.get('TELEGRAM_BOT_TOKEN')
+        self.api_url = (api_url or os.environ.get('TELEGRAM_API_URL', DEFAULT_API_URL)).rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+        # Время, до которого Telegram попросил не слать запросы (429)
+        self._paused_until = 0.0
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def init_app(self, app):
+        """Применяет TELEGRAM_BOT_TOKEN / TELEGRAM_API_URL из конфигурации"""
+        self.token = app.config.get('TELEGRAM_BOT_TOKEN') or self.token
+        self.api_url = (app.config.get('TELEGRAM_API_URL') or self.api_url).rstrip('/')
+        self.require_token()
+        app.extensions['telegram_client'] = self
+
+    def require_token(self):
+        """Токен бота; без TELEGRAM_BOT_TOKEN - RuntimeError, а не тихие 403/401"""
+        if not self.token:
+            raise RuntimeError('TELEGRAM_BOT_TOKEN не задан: укажите его в конфигурации или окружении')
+        return self.token
+
+    @staticmethod
+    def retryable(method, error):
+        """Можно ли повторить вызов после сетевой ошибки error
+
+        Ошибка соединения значит, что запрос не ушел, - повторяем любой
+        метод. После таймаута чтения запрос мог быть выполнен, поэтому
+        повторяются только идемпотентные методы.
+        """
+        return error.connect_failed or method in IDEMPOTENT_METHODS
+
+    def call(self, method, request_timeout=None, **params):
+        """Вызывает метод Bot API; возвращает поле result ответа.
+
+        request_timeout переопределяет таймаут чтения - нужен для long-poll
+        getUpdates, где сервер держит запрос до timeout секунд.
+        """
+        timeout = (self.timeout[0], request_timeout) if request_timeout else self.timeout
+        with instrumentation.span(f'telegram.{method}'):
+            return self._call(method, timeout, params)
+
+    def _call(self, method, timeout, params):
+        url = f"{self.api_url}/bot{self.require_token()}/{method}"
+        attempt = 0
+        while True:
+            self._wait_if_paused()
+            try:
+                response = self.session.post(url, json=params, timeout=timeout)
+                data = self._decode(response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = TelegramError(f'{method}: {e}', connect_failed=_connect_failed(e))
+            else:
+                if data.get('ok'):
+                    return data.get('result')
+                error = self._api_error(method, response, data)
+
+            attempt += 1
+            if attempt > self.max_retries or not self.retryable(method, error):
+                raise error
+            if error.retry_after is None:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+
+    def send_message(self, chat_id, text, reply_markup=None, parse_mode='MarkdownV2'):
+        """Отправляет сообщение сразу (в текущем потоке)"""
+        params = {'chat_id': chat_id, 'text': text}
+        if parse_mode:
+            params['parse_mode'] = parse_mode
+        if reply_markup:
+            params['reply_markup'] = reply_markup
+        return self.call('sendMessage', **params)
+
+    def _api_error(self, method, response, data):
+        """Ошибка из ответа API: 429 ставит паузу, прочие 4xx поднимаются сразу"""
+        retry_after = (data.get('parameters') or {}).get('retry_after')
+        error = TelegramError(
+            f"{method}: {data.get('description', response.status_code)}",
+            error_code=data.get('error_code', response.status_code),
+            retry_after=retry_after
+        )
+        if error.error_code == 429 and retry_after:
+            self.pause(retry_after)
+        elif error.error_code and error.error_code < 500:
+            # 4xx кроме 429 повторять бессмысленно
+            raise error
+        return error
+
+    def pause(self, seconds):
+        """Приостанавливает все вызовы клиента на seconds секунд"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _wait_if_paused(self):
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    @staticmethod
+    def _decode(response):
+        try:
+            return response.json()
+        except ValueError:
+            return {'ok': False, 'error_code': response.status_code,
+                    'description': response.text[:200]}
+
+
+class AsyncTelegramClient:
+    """Асинхронный вызов Bot API поверх httpx.AsyncClient (ASGI-режим)
+
+    Токен, адрес, таймауты, повторы и пауза после 429 - общие с
+    синхронным клиентом client.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._http = None
+
+    @property
+    def http(self):
+        if self._http is None:
+            import httpx
+
+            connect_timeout, read_timeout = self.client.timeout
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=self.client.pool_size,
+                                    max_keepalive_connections=self.client.pool_size)
+            )
+        return self._http
+
+    async def call(self, method, **params):
+        """Вызывает метод Bot API; возвращает поле result ответа"""
+        with instrumentation.span(f'telegram.{method}'):
+            return await self._call(method, params)
+
+    async def _call(self, method, params):
+        import httpx
+
+        client = self.client
+        url = f"{client.api_url}/bot{client.require_token()}/{method}"
+        attempt = 0
+        while True:
+            delay = client._paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                response = await self.http.post(url, json=params)
+                data = client._decode(response)
+            except httpx.TransportError as e:
+                error = TelegramError(f'{method}: {e}',
+                                      connect_failed=isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)))
+            else:
+                if data.get('ok'):
+                    return data.get('result')
+                error = client._api_error(method, response, data)
+
+            attempt += 1
+            if attempt > client.max_retries or not client.retryable(method, error):
+                raise error
+            if error.retry_after is None:
+                await asyncio.sleep(client.backoff * 2 ** (attempt - 1))
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+class TelegramOutbox:
+    """Очередь исходящих вызовов с фоновыми потоками-отправителями"""
+
+    def __init__(self, client, workers=2, max_queue=10000, rate_limit=25):
+        self.client = client
+        self.workers = workers
+        # Общий темп отправки (сообщений в секунду) - лимит Telegram около 30
+        self.min_interval = 1.0 / rate_limit if rate_limit else 0.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._pace_lock = threading.Lock()
+        self._next_slot = 0.0
+        self._started = False
+        # ASGI-режим: очередь и отправители в цикле событий
+        self._loop = None
+        self._async_queue = None
+        self._async_senders = []
+        self._max_queue = max_queue
+
+    def init_app(self, app):
+        """Применяет TELEGRAM_OUTBOX_WORKERS / TELEGRAM_RATE_LIMIT из конфигурации"""
+        self.workers = app.config.get('TELEGRAM_OUTBOX_WORKERS', self.workers)
+        rate_limit = app.config.get('TELEGRAM_RATE_LIMIT')
+        if rate_limit is not None:
+            self.min_interval = 1.0 / rate_limit if rate_limit else 0.0
+        app.extensions['telegram_outbox'] = self
+
+    def start(self):
+        if self._started:
+            return self
+        self._started = True
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'telegram-outbox-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        atexit.register(self.drain)
+        return self
+
+    def submit(self, method, **params):
+        """Ставит вызов в очередь; False если очередь переполнена
+
+        Без потоков-отправителей (TELEGRAM_OUTBOX_WORKERS=0, serverless)
+        вызов выполняется сразу: замороженная после ответа функция
+        не дослала бы очередь.
+        """
+        if self._loop is not None:
+            # Обработчики команд работают в потоках диспетчера - передаем вызов в цикл
+            self._loop.call_soon_threadsafe(self._put_async, method, params)
+            return True
+        if not self.workers:
+            return self._send(method, params)
+        self.start()
+        try:
+            self._queue.put_nowait((method, params))
+            return True
+        except queue.Full:
+            logger.error(f"Telegram outbox is full, dropping {method}")
+            return False
+
+    def send_message(self, chat_id, text, reply_markup=None, parse_mode='MarkdownV2'):
+        """Ставит sendMessage в очередь"""
+        params = {'chat_id': chat_id, 'text': text}
+        if parse_mode:
+            params['parse_mode'] = parse_mode
+        if reply_markup:
+            params['reply_markup'] = reply_markup
+        return self.submit('sendMessage', **params)
+
+    def run_in_loop(self, client):
+        """Переводит отправку в текущий цикл событий (старт ASGI-приложения)
+
+        client - AsyncTelegramClient; отправителей столько же, сколько
+        было бы потоков.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._async_queue = asyncio.Queue(maxsize=self._max_queue)
+        self._async_senders = [
+            self._loop.create_task(self._run_async(client)) for _ in range(max(self.workers, 1))
+        ]
+
+    async def stop_loop(self, timeout=10):
+        """Досылает очередь и останавливает отправителей (остановка ASGI-приложения)"""
+        if self._loop is None:
+            return
+        try:
+            await asyncio.wait_for(self._async_queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Telegram outbox: {self._async_queue.qsize()} calls not sent on shutdown")
+        for task in self._async_senders:
+            task.cancel()
+        await asyncio.gather(*self._async_senders, return_exceptions=True)
+        self._loop = None
+        self._async_queue = None
+        self._async_senders = []
+
+    def _put_async(self, method, params):
+        try:
+            self._async_queue.put_nowait((method, params))
+        except asyncio.QueueFull:
+            logger.error(f"Telegram outbox is full, dropping {method}")
+
+    async def _run_async(self, client):
+        pending = self._async_queue
+        while True:
+            method, params = await pending.get()
+            try:
+                await self._pace_async()
+                await client.call(method, **params)
+            except TelegramError as e:
+                logger.error(f"Telegram {method} failed: {e}")
+            except Exception:
+                logger.exception(f"Telegram {method} crashed")
+            finally:
+                pending.task_done()
+
+    async def _pace_async(self):
+        if not self.min_interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.min_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def drain(self, timeout=10):
+        """Ждет отправки очереди (при завершении процесса)"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _pace(self):
+        if not self.min_interval:
+            return
+        with self._pace_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _send(self, method, params):
+        try:
+            self._pace()
+            self.client.call(method, **params)
+            return True
+        except TelegramError as e:
+            logger.error(f"Telegram {method} failed: {e}")
+        except Exception:
+            logger.exception(f"Telegram {method} crashed")
+        return False
+
+    def _run(self):
+        while True:
+            method, params = self._queue.get()
+            try:
+                self._send(method, params)
+            finally:
+                self._queue.task_done()
+
+
+telegram_client = TelegramClient()
+telegram_outbox = TelegramOutbox(telegram_client)
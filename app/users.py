@@ -0,0 +1,112 @@
+"""Отложенная запись активности пользователей Telegram в таблицу users.
+
+Каждый авторизованный запрос обновляет last_activity, а создание
+объявления - listings_created. Вместо UPDATE на каждый запрос изменения
+схлопываются в памяти по telegram_id и раз в несколько секунд пишутся
+одним пакетным INSERT ... ON CONFLICT DO UPDATE.
+"""
+import atexit
+import threading
+from datetime import datetime
+
+from app.counters import schedule_flush
+from app.models.listing import db
+
+# is_premium - уровень на площадке (квоты RATE_LIMIT_PREMIUM_FACTOR), а не
+# Telegram Premium из initData: при обновлении строки не меняется
+UPSERT_USERS_SQL = (
+    "INSERT INTO users (telegram_id, username, first_name, last_name, "
+    "listings_created, last_activity, created_at, is_banned, is_premium) "
+    "VALUES (:telegram_id, :username, :first_name, :last_name, "
+    ":listings_created, :last_activity, :last_activity, :is_banned, :is_premium) "
+    "ON CONFLICT (telegram_id) DO UPDATE SET "
+    "username = COALESCE(excluded.username, users.username), "
+    "first_name = COALESCE(excluded.first_name, users.first_name), "
+    "last_name = COALESCE(excluded.last_name, users.last_name), "
+    "listings_created = COALESCE(users.listings_created, 0) + excluded.listings_created, "
+    "last_activity = excluded.last_activity"
+)
+
+
+class UserActivityBuffer:
+    """Схлопывает активность пользователей и пишет ее пачками"""
+
+    def __init__(self):
+        self.app = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self._scheduled = False
+
+    def init_app(self, app):
+        """Запускает поток сброса (USER_ACTIVITY_FLUSH_INTERVAL секунд) или сброс после запроса"""
+        self.app = app
+        interval = app.config.get('USER_ACTIVITY_FLUSH_INTERVAL', 10.0)
+        if not self._scheduled:
+            self._flusher = schedule_flush(app, self.flush, interval, 'user-activity-flusher')
+            self._scheduled = True
+            atexit.register(self.shutdown)
+        app.extensions['user_activity'] = self
+
+    def touch(self, user, listings_created=0):
+        """Отмечает активность пользователя из initData (dict с полем id)"""
+        telegram_id = user.get('id')
+        if telegram_id is None:
+            return
+        with self._lock:
+            entry = self._pending.get(telegram_id)
+            if entry is None:
+                entry = self._pending[telegram_id] = {
+                    'telegram_id': telegram_id,
+                    'listings_created': 0,
+                    'is_banned': False,
+                    'is_premium': False,
+                }
+            entry.update(
+                username=user.get('username'),
+                first_name=user.get('first_name'),
+                last_name=user.get('last_name'),
+                last_activity=datetime.utcnow()
+            )
+            entry['listings_created'] += listings_created
+
+    def flush(self):
+        """Пишет накопленную активность одной транзакцией"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            params = list(batch.values())
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as conn:
+                        conn.execute(db.text(UPSERT_USERS_SQL), params)
+            except Exception as e:
+                self.app.logger.error(f"User activity flush failed: {e}")
+                self._restore(batch)
+                return 0
+            return len(params)
+
+    def shutdown(self):
+        """Останавливает поток и сбрасывает остаток перед выходом процесса"""
+        if self._flusher is not None:
+            self._flusher.stop()
+        if self.app is not None:
+            self.flush()
+
+    def _restore(self, batch):
+        # Более свежие данные, пришедшие во время сброса, важнее старых
+        with self._lock:
+            for telegram_id, entry in batch.items():
+                current = self._pending.get(telegram_id)
+                if current is None:
+                    self._pending[telegram_id] = entry
+                else:
+                    current['listings_created'] += entry['listings_created']
+
+
+# Глобальный буфер активности пользователей
+user_activity = UserActivityBuffer()
@@ -0,0 +1,122 @@
+"""Вебхук Telegram-бота и обработчики команд.
+
+Модуль загружается при первом апдейте (LazyView) или командой
+`flask bot-poll`, поэтому клиент Bot API не импортируется на холодном
+старте страниц.
+"""
+import hmac
+
+from flask import current_app, request
+
+from app.bot import bot_commands
+from app.lazy import extension
+from app.rate_limit import rate_limiter
+
+# Части апдейта, в которых Telegram передает отправителя
+UPDATE_SENDER_FIELDS = ('message', 'edited_message', 'callback_query', 'inline_query')
+
+
+def update_sender_id(update):
+    """telegram_id отправителя апдейта или None"""
+    for field in UPDATE_SENDER_FIELDS:
+        sender = (update.get(field) or {}).get('from')
+        if isinstance(sender, dict):
+            return sender.get('id')
+    return None
+
+
+def webhook(token):
+    """Обработчик вебхука от Telegram: принимает апдейт и сразу отвечает"""
+    expected = extension('telegram_client').token
+    # Сравнение за постоянное время: токен бота не подбирается по задержке ответа
+    if not hmac.compare_digest(token.encode('utf-8'), expected.encode('utf-8')):
+        return "Unauthorized", 403
+
+    update = request.get_json(silent=True)
+    if not isinstance(update, dict):
+        # На 4xx/5xx Telegram повторяет доставку - кривой апдейт просто пропускаем
+        current_app.logger.warning("Webhook: malformed update")
+        return "OK", 200
+
+    # Флуд одного пользователя и апдейты забаненных не доходят до диспетчера;
+    # отвечаем 200, иначе Telegram будет повторять доставку
+    sender_id = update_sender_id(update)
+    if sender_id is not None and not rate_limiter.check_user('webhook', sender_id).allowed:
+        return "OK", 200
+
+    extension('bot_dispatcher').submit(update)
+    return "OK", 200
+
+
+@bot_commands.command('/start')
+def send_start_message(chat_id):
+    """Отправляет приветственное сообщение"""
+    message = """🎵 *Добро пожаловать в LTL18:33BG \- BEATSSUDA Platform*
+
+Приветствуем\\! Мы \- комьюнити битмейкеров и продюсеров\\.
+Помогаем друг другу, делаем звук,
+продаём / покупаем / делимся китами и пресетами\\.
+
+🔥 *Здесь вы можете:*
+• Покупать и продавать биты
+• Заказывать мастеринг и сведение  
+• Делиться опытом с комьюнити
+• Находить нужные киты и пресеты
+
+*Техподдержка:* @BeatHavenX
+
+Нажмите кнопку ниже чтобы открыть платформу:"""
+    
+    keyboard = {
+        "inline_keyboard": [[
+            {
+                "text": "🚀 Открыть BEATSSUDA Platform",
+                "web_app": {"url": "https://ltl-18-33bg.vercel.app"}
+            }
+        ]]
+    }
+    
+    send_telegram_message(chat_id, message, keyboard)
+
+
+@bot_commands.command('/app')
+def send_app_message(chat_id):
+    """Отправляет сообщение с кнопкой приложения"""
+    message = "🚀 *Откройте BEATSSUDA Platform*"
+    
+    keyboard = {
+        "inline_keyboard": [[
+            {
+                "text": "📱 Открыть платформу", 
+                "web_app": {"url": "https://ltl-18-33bg.vercel.app"}
+            }
+        ]]
+    }
+    
+    send_telegram_message(chat_id, message, keyboard)
+
+
+@bot_commands.command('/help')
+def send_help_message(chat_id):
+    """Отправляет справочное сообщение"""
+    message = """❓ *Помощь по BEATSSUDA Platform*
+
+*Команды:*
+/start \- Главное меню
+/app \- Открыть платформу  
+/help \- Эта справка
+
+*Как пользоваться:*
+1\\. Нажмите кнопку меню или используйте /app
+2\\. Откроется платформа в Telegram
+3\\. Покупайте, продавайте, общайтесь\\!
+
+*Техподдержка и модерация:* @BeatHavenX
+*Все проблемы писать ему\\!*"""
+    
+    send_telegram_message(chat_id, message)
+
+
+def send_telegram_message(chat_id, text, reply_markup=None):
+    """Ставит сообщение в очередь отправки через Telegram Bot API"""
+    return extension('telegram_outbox').send_message(chat_id, text, reply_markup)
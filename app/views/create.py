@@ -0,0 +1,116 @@
+"""Создание объявления из Telegram Web App"""
+from flask import current_app, flash, redirect, render_template, request, url_for
+
+from app.forms import ListingForm
+from app.init_data import init_data_validator
+from app.jobs import job_queue
+from app.metrics import instrumentation
+from app.models.listing import db, Listing
+from app.moderation import content_moderator
+from app.moderation_rules import filter_matcher
+from app.rate_limit import rate_limiter
+from app.users import user_activity
+
+
+@rate_limiter.limit('create_listing', methods=('POST',))
+def create_listing():
+    """Создание нового объявления"""
+    form = ListingForm()
+
+    # Проверяем авторизацию для POST запросов
+    user_data = None
+    if request.method == 'POST':
+        user_header = request.headers.get('X-Telegram-User')
+        if not user_header:
+            flash('❌ Для создания объявлений необходимо войти через Telegram', 'error')
+            return redirect(url_for('index'))
+
+        # Валидируем Telegram данные (повторные заголовки - из кеша)
+        is_valid, user_data = init_data_validator.validate(user_header)
+        if not is_valid:
+            flash(f'❌ Ошибка авторизации: {user_data}', 'error')
+            return redirect(url_for('index'))
+
+    if form.validate_on_submit():
+        try:
+            # Собираем данные из формы
+            listing_data = {
+                'listing_type': form.listing_type.data,
+                'author': form.author.data,
+                'contact': form.contact.data,
+                'item_type': form.item_type.data,
+                'genre': form.genre.data,
+                'preview_url': form.preview_url.data,
+                'price': form.price.data,
+                'license': form.license.data,
+                'includes': form.includes.data,
+                'delivery_time': form.delivery_time.data,
+                'description': form.description.data,
+                'tags': form.tags.data
+            }
+
+            # Фильтры контента - один проход скомпилированного матчера
+            with instrumentation.span('moderation.filters'):
+                filter_errors = filter_matcher.errors(listing_data)
+            if filter_errors:
+                for error in filter_errors:
+                    flash(f'❌ {error}', 'error')
+                return render_template('create_listing.html', form=form)
+
+            # Модерируем контент
+            with instrumentation.span('moderation.moderate_listing'):
+                moderation_result = content_moderator.moderate_listing(listing_data)
+
+            if not moderation_result['approved']:
+                for error in moderation_result['errors']:
+                    flash(f'❌ {error}', 'error')
+                return render_template('create_listing.html', form=form)
+
+            # Создаем объявление
+            listing = Listing(
+                listing_type=form.listing_type.data,
+                author=form.author.data,
+                contact=form.contact.data,
+                item_type=form.item_type.data,
+                genre=form.genre.data,
+                preview_url=form.preview_url.data,
+                price=form.price.data,
+                license=form.license.data if form.license.data else None,
+                includes=form.includes.data if form.includes.data else None,
+                delivery_time=form.delivery_time.data if form.delivery_time.data else None,
+                description=form.description.data if form.description.data else None,
+                tags=form.tags.data if form.tags.data else None,
+                # Публикует фоновая модерация после тяжелых проверок
+                is_moderated=False
+            )
+
+            # Цену в USD (price_usd) вычисляет price_service при сохранении
+            # Объявление и задача модерации - одной транзакцией
+            db.session.add(listing)
+            db.session.flush()
+            job_queue.enqueue('moderate_listing', {
+                'listing_id': listing.id,
+                'needs_review': moderation_result['needs_review'],
+                'warnings': moderation_result['warnings']
+            })
+            db.session.commit()
+            job_queue.notify()
+
+            if isinstance(user_data, dict):
+                user_activity.touch(user_data, listings_created=1)
+
+            # Показываем результат
+            if moderation_result['needs_review']:
+                flash('⚠️ Объявление создано, но требует проверки модератором', 'warning')
+                for warning in moderation_result['warnings']:
+                    flash(warning, 'info')
+            else:
+                flash('✅ Объявление создано и будет опубликовано после автоматической проверки', 'success')
+
+            return redirect(url_for('view_listing', listing_id=listing.id))
+
+        except Exception as e:
+            current_app.logger.error(f"Error creating listing: {str(e)}")
+            flash('❌ Произошла ошибка при создании объявления', 'error')
+
+    return render_template('create_listing.html', form=form)
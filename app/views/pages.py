@@ -0,0 +1,202 @@
+"""Страницы ленты, объявления, поиска и статистики"""
+from datetime import datetime
+
+from flask import current_app, jsonify, redirect, render_template, request, url_for
+
+from app.counters import listing_counters
+from app.assets import assets
+from app.db_engine import read_replica
+from app.metrics import instrumentation
+from app.models.listing import Listing
+from app.page_cache import page_cache
+from app.pagination import feed_query, paginate_feed, parse_price_filter, parse_sort, InvalidCursor
+from app.ranking import ranking_index
+from app.rate_limit import rate_limiter
+from app.search import search_engine
+from app.stats import platform_stats
+
+
+@page_cache.cached()
+@read_replica
+def index():
+    """Главная страница"""
+    # Получаем параметры фильтрации
+    listing_type = request.args.get('type')
+    genre = request.args.get('genre')
+    item_type = request.args.get('item_type')
+
+    # Объявления, отсортированные по дате (новые первыми), постранично
+    page = _feed_page(feed_query(listing_type, genre, item_type))
+
+    return render_template('index.html', listings=page.items, next_cursor=page.next_cursor)
+
+
+@page_cache.cached()
+@read_replica
+def listings(listing_type):
+    """Страница объявлений по типу"""
+    if listing_type not in ['sell', 'buy', 'service']:
+        return redirect(url_for('index'))
+
+    page = _feed_page(feed_query(listing_type=listing_type))
+
+    return render_template('index.html', listings=page.items, next_cursor=page.next_cursor)
+
+
+def _feed_page(query, sort='newest'):
+    """Страница ленты по курсору из ?cursor= (битый курсор - первая страница)"""
+    try:
+        page = paginate_feed(query, request.args.get('cursor'), sort=sort)
+    except InvalidCursor:
+        page = paginate_feed(query, sort=sort)
+    listing_counters.apply_pending(page.items)
+    return page
+
+
+def view_listing(listing_id):
+    """Просмотр конкретного объявления (без кэша страниц - счетчик просмотров живой)"""
+    listing = Listing.query.filter_by(id=listing_id, is_active=True).first_or_404()
+
+    # Увеличиваем счетчик просмотров (запись в базу - пачкой в фоне); HEAD - не просмотр
+    if request.method == 'GET':
+        listing_counters.incr(listing.id, 'views')
+    listing_counters.apply_pending([listing])
+
+    # Похожие по жанру и тегам - из индекса в памяти, без прохода по таблице
+    similar_listings = ranking_index.similar(listing)
+    listing_counters.apply_pending(similar_listings)
+
+    return render_template('view_listing.html', listing=listing, similar_listings=similar_listings)
+
+
+@page_cache.cached()
+@read_replica
+def trending():
+    """Популярные сейчас объявления: ?type=&genre="""
+    listings = ranking_index.trending(
+        limit=50,
+        listing_type=request.args.get('type'),
+        genre=request.args.get('genre')
+    )
+    listing_counters.apply_pending(listings)
+
+    return render_template('index.html', listings=listings, next_cursor=None)
+
+
+@read_replica
+def search():
+    """Поиск объявлений"""
+    # WTForms нужен только этой странице и созданию объявления
+    from app.forms import SearchForm
+
+    form = SearchForm()
+    listings = []
+    next_cursor = None
+
+    if request.args.get('query'):
+        query_text = request.args.get('query', '').strip()
+        listing_type = request.args.get('listing_type', '')
+        genre = request.args.get('genre', '')
+        item_type = request.args.get('item_type', '')
+        min_price = parse_price_filter(request.args.get('min_price'))
+        max_price = parse_price_filter(request.args.get('max_price'))
+        sort = request.args.get('sort', '')
+
+        if query_text:
+            # Полнотекстовый поиск с ранжированием по релевантности (или по цене)
+            try:
+                page = search_engine.search(
+                    query_text,
+                    listing_type=listing_type,
+                    genre=genre,
+                    item_type=item_type,
+                    limit=50,
+                    cursor=request.args.get('cursor'),
+                    min_price=min_price,
+                    max_price=max_price,
+                    sort=sort or 'relevance'
+                )
+            except InvalidCursor:
+                page = search_engine.search(
+                    query_text,
+                    listing_type=listing_type,
+                    genre=genre,
+                    item_type=item_type,
+                    limit=50,
+                    min_price=min_price,
+                    max_price=max_price,
+                    sort=sort or 'relevance'
+                )
+        else:
+            page = _feed_page(
+                feed_query(listing_type, genre, item_type, min_price, max_price),
+                sort=parse_sort(sort)
+            )
+
+        listings, next_cursor = page.items, page.next_cursor
+        listing_counters.apply_pending(listings)
+
+    return render_template('search.html', form=form, listings=listings, next_cursor=next_cursor)
+
+
+@read_replica
+def stats():
+    """Статистика платформы"""
+    from app.moderation import content_moderator
+
+    stats_data = platform_stats.snapshot(
+        instrumentation.timed('moderation.stats')(content_moderator.get_moderation_stats)
+    )
+
+    return render_template('stats.html', stats=stats_data)
+
+
+@rate_limiter.limit('track_contact', json=True)
+def track_contact(listing_id):
+    """Отслеживание клика по контакту"""
+    listing = Listing.query.filter_by(id=listing_id, is_active=True).first_or_404()
+
+    # Увеличиваем счетчик кликов по контакту (запись в базу - пачкой в фоне)
+    listing_counters.incr(listing.id, 'contacts_clicked')
+    listing_counters.apply_pending([listing])
+
+    return jsonify({
+        'success': True,
+        'contact': listing.contact,
+        'clicks': listing.contacts_clicked
+    })
+
+
+def health():
+    """Проверка живости для хостинга (без обращения к базе)"""
+    return {
+        "status": "ok",
+        "message": "BEATSSUDA Platform is running!",
+        "version": "1.0.0"
+    }
+
+
+# Обработчики ошибок
+def not_found(error):
+    return render_template('error.html',
+                         title='Страница не найдена',
+                         message='Извините, запрашиваемая страница не существует.'), 404
+
+
+def server_error(error):
+    current_app.logger.error(f"Server Error: {str(error)}")
+    return render_template('error.html',
+                         title='Ошибка сервера',
+                         message='Произошла внутренняя ошибка сервера.'), 500
+
+
+# Контекстные процессоры
+def inject_globals():
+    """Глобальные переменные для шаблонов"""
+    return {
+        'current_year': datetime.now().year,
+        'site_name': 'LTL18:33bg - BEATSSUDA',
+        # Адреса статики с отпечатками и встроенный критический CSS
+        'url_for': assets.url_for,
+        'critical_css': assets.critical_css,
+    }
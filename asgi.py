@@ -0,0 +1,9 @@
+"""Точка входа ASGI-режима: uvicorn asgi:app
+
+То же приложение, что и app.py; вебхук, клик по контакту и /api/feed
+обслуживаются асинхронно (см. app.asgi).
+"""
+from app.asgi import create_asgi_app
+from app.factory import create_app
+
+app = create_asgi_app(create_app())
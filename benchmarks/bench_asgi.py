@@ -0,0 +1,281 @@
+"""Бенчмарк WSGI и ASGI-режимов под множеством одновременных соединений.
+
+На каталоге из bench_routes (SQLite, seed 42) поднимает два сервера
+одного приложения:
+
+- wsgi - werkzeug с фиксированным пулом --wsgi-threads потоков (как
+  gunicorn --threads), вебхук отправляет ответ в Bot API в потоке
+  запроса;
+- asgi - uvicorn с app.asgi: вебхук, track_contact и /api/feed -
+  корутины, Bot API - задачи цикла событий.
+
+Фейковый Bot API отвечает с задержкой --telegram-latency, как медленная
+мобильная сеть до api.telegram.org. Для каждого уровня --concurrency
+клиент на asyncio-сокетах держит столько keep-alive соединений (httpx
+на сотнях соединений сам становится узким местом) и отправляет
+--requests запросов сценария; печатаются p50/p95/p99 и req/s, таблица
+сохраняется в bench_asgi_output.txt.
+
+    python -m benchmarks.bench_asgi [--size 10k] [--concurrency 16,64,256]
+        [--requests 2000] [--wsgi-threads 8] [--telegram-latency 0.05]
+
+Нужны зависимости requirements-asgi.txt. Клиент и серверы работают в
+одном процессе и делят GIL - сравнивать стоит режимы между собой, а не
+с продакшеном.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+
+import uvicorn
+from werkzeug.serving import BaseWSGIServer
+
+from app.asgi import create_asgi_app
+from app.counters import listing_counters
+from benchmarks.bench_routes import (
+    QuietRequestHandler, RequestFactory, catalog_size, format_row, make_app, parse_size,
+    seed_catalog, summarize, _ok
+)
+from benchmarks.fake_telegram import FakeBotAPI
+
+SCENARIOS = ('api_feed', 'track_contact', 'webhook')
+MODES = ('wsgi', 'asgi')
+
+HEADER = (f"{'conns':>8} {'mode':<7} {'scenario':<15} {'requests':>8} {'errors':>6} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>9}")
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """WSGI-сервер с фиксированным пулом потоков"""
+
+    def __init__(self, host, port, app, threads):
+        super().__init__(host, port, app, handler=QuietRequestHandler)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_wsgi(app, threads):
+    server = PooledWSGIServer('127.0.0.1', 0, app, threads)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop():
+        server.shutdown()
+        server.pool.shutdown(wait=False)
+    return f'http://127.0.0.1:{server.server_port}', stop
+
+
+def start_asgi(app):
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(
+        create_asgi_app(app), host='127.0.0.1', port=port,
+        log_level='warning', access_log=False, lifespan='on'
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+    return f'http://127.0.0.1:{port}', stop
+
+
+class HttpConnection:
+    """Одно keep-alive соединение HTTP/1.1; переподключается после Connection: close"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, **kwargs):
+        """Отправляет запрос и дочитывает ответ; возвращает HTTP-статус
+
+        kwargs - как у requests: params, json, data, headers.
+        """
+        params = kwargs.get('params')
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = b''
+        request_headers = {'Host': f'{self.host}:{self.port}'}
+        if params:
+            path = f'{path}?{urlencode(params)}'
+        if kwargs.get('json') is not None:
+            body = json.dumps(kwargs['json']).encode('utf-8')
+            request_headers['Content-Type'] = 'application/json'
+        elif kwargs.get('data') is not None:
+            body = urlencode(kwargs['data']).encode('utf-8')
+            request_headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        request_headers['Content-Length'] = str(len(body))
+        request_headers.update(kwargs.get('headers') or {})
+        head = f'{method} {path} HTTP/1.1\r\n' + ''.join(
+            f'{name}: {value}\r\n' for name, value in request_headers.items()) + '\r\n'
+        self.writer.write(head.encode('latin-1') + body)
+        await self.writer.drain()
+
+        status_line, *lines = (await self.reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        version, status = status_line.split(' ', 2)[:2]
+        response_headers = {}
+        for line in lines:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                response_headers[name.strip().lower()] = value.strip().lower()
+        if 'content-length' in response_headers:
+            await self.reader.readexactly(int(response_headers['content-length']))
+        else:
+            await self.reader.read()
+            response_headers['connection'] = 'close'
+        if response_headers.get('connection') == 'close' or (
+                version == 'HTTP/1.0' and response_headers.get('connection') != 'keep-alive'):
+            self.close()
+        return int(status)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def make_request(factory, scenario):
+    if scenario == 'api_feed':
+        return 'GET', '/api/feed', {'params': {'genre': factory._choice(('trap', 'drill', 'lofi'))}}
+    return factory.make(scenario)
+
+
+async def run_load(base_url, factory, scenario, count, concurrency):
+    """concurrency соединений отправляют count запросов; (задержки, ошибки, секунды)"""
+    latencies = []
+    errors = 0
+    remaining = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        connection = HttpConnection(base_url)
+        try:
+            while next(remaining) < count:
+                method, path, kwargs = make_request(factory, scenario)
+                begin = time.perf_counter()
+                try:
+                    ok = _ok(await connection.request(method, path, **kwargs))
+                except (OSError, ValueError, asyncio.IncompleteReadError):
+                    connection.close()
+                    ok = False
+                latencies.append(time.perf_counter() - begin)
+                errors += not ok
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', default='10k')
+    parser.add_argument('--concurrency', default='16,64,256')
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=2000, help='Запросов на сценарий')
+    parser.add_argument('--wsgi-threads', type=int, default=8)
+    parser.add_argument('--telegram-latency', type=float, default=0.05,
+                        help='Задержка ответа фейкового Bot API (секунды)')
+    parser.add_argument('--db-dir', help='Каталог для базы (переиспользуется между запусками)')
+    parser.add_argument('--output', default='bench_asgi_output.txt')
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(',') if level]
+    modes = [mode for mode in args.modes.split(',') if mode]
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+    size = parse_size(args.size)
+
+    api = FakeBotAPI(latency=args.telegram_latency)
+    api_url = api.start()
+    tmp = None
+    db_dir = args.db_dir
+    if db_dir is None:
+        tmp = tempfile.TemporaryDirectory()
+        db_dir = tmp.name
+    os.makedirs(db_dir, exist_ok=True)
+    path = os.path.join(db_dir, f'catalog-{size}.db')
+    if catalog_size(path) < size and os.path.exists(path):
+        os.remove(path)
+
+    app = make_app(path, api_url, page_cache_ttl=30)
+    with app.app_context():
+        if not catalog_size(path):
+            print(f"Seeding {size} listings -> {path}", file=sys.stderr)
+            seed_catalog(size)
+
+    factory = RequestFactory(size)
+    starters = {'wsgi': lambda: start_wsgi(app, args.wsgi_threads), 'asgi': lambda: start_asgi(app)}
+    try:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            output.write(
+                f"# bench_asgi {datetime.now().isoformat(timespec='seconds')} "
+                f"python {platform.python_version()} sqlite {sqlite3.sqlite_version} "
+                f"size={size} requests={args.requests} wsgi_threads={args.wsgi_threads} "
+                f"telegram_latency={args.telegram_latency}\n"
+            )
+            output.write(HEADER + '\n')
+            print(HEADER)
+            # Режимы по очереди: ASGI-сервер переводит очередь Bot API в свой цикл событий
+            for mode in modes:
+                base_url, stop = starters[mode]()
+                try:
+                    for concurrency in levels:
+                        for scenario in scenarios:
+                            # Прогрев: импорт представлений и соединения с базой
+                            asyncio.run(run_load(base_url, factory, scenario, 20, 4))
+                            result = asyncio.run(run_load(base_url, factory, scenario,
+                                                          args.requests, concurrency))
+                            row = summarize(concurrency, mode, scenario, *result)
+                            print(format_row(row))
+                            output.write(format_row(row) + '\n')
+                            output.flush()
+                finally:
+                    stop()
+    finally:
+        listing_counters.flush()
+        api.stop()
+        if tmp is not None:
+            tmp.cleanup()
+
+    print(f"\nРезультаты сохранены в {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Бенчмарк: задержка проверки объявления фильтрами в зависимости от их числа.
+
+Сравнивает скомпилированный матчер (Ахо-Корасик + одна регулярка) с
+наивным циклом "re.search по каждому фильтру".
+
+    python -m benchmarks.bench_moderation [--counts 10,100,1000,5000]
+"""
+import argparse
+import random
+import re
+import string
+import time
+
+from app.moderation_rules import CompiledMatcher, FilterRule, CHECKED_FIELDS
+
+LISTING = {
+    'author': 'LTL Producer',
+    'contact': '@ltl_producer',
+    'preview_url': 'https://soundcloud.com/ltl/dark-trap-beat',
+    'price': '50$',
+    'includes': 'WAV, stems, MIDI',
+    'description': (
+        'Мрачный трэп бит в стиле Atlanta, 140 BPM, сведен и отмастерен. '
+        'Эксклюзивная лицензия, стемы по запросу. Dark trap beat with heavy 808, '
+        'hard hitting drums and haunting melody. ' * 4
+    ),
+    'tags': 'trap, dark, 808, atlanta, эксклюзив',
+}
+
+
+def make_rules(count, regex_share=0.2, seed=42):
+    """Синтетические фильтры: литералы и простые регулярки"""
+    rng = random.Random(seed)
+    rules = []
+    for rule_id in range(1, count + 1):
+        word = ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 10)))
+        if rng.random() < regex_share:
+            rules.append(FilterRule(rule_id, 'banned_word', rf'\b{word}\d*\b', True))
+        else:
+            rules.append(FilterRule(rule_id, 'banned_domain', word, False))
+    return rules
+
+
+def naive_scan(rules, listing_data):
+    """Проверка фильтрами по одному, как без компиляции"""
+    hits = []
+    for field in CHECKED_FIELDS:
+        text = listing_data.get(field) or ''
+        for rule in rules:
+            if rule.is_regex:
+                if re.search(rule.pattern, text, re.IGNORECASE):
+                    hits.append(rule)
+            elif rule.pattern.lower() in text.lower():
+                hits.append(rule)
+    return hits
+
+
+def measure(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--counts', default='10,100,1000,5000')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'patterns':>9} {'build ms':>10} {'compiled us':>12} {'naive us':>10}")
+    for count in (int(value) for value in args.counts.split(',')):
+        rules = make_rules(count)
+
+        started = time.perf_counter()
+        matcher = CompiledMatcher(rules)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        compiled_us = measure(lambda: matcher.scan(LISTING), args.repeat)
+        naive_us = measure(lambda: naive_scan(rules, LISTING), max(1, args.repeat // 10))
+        print(f"{count:>9} {build_ms:>10.1f} {compiled_us:>12.1f} {naive_us:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Бенчмарк: ORM-объекты Listing против карточек ListingCard в списках.
+
+Заполняет временную SQLite-базу объявлениями с длинными description и
+tags и сравнивает выборку N строк целыми ORM-объектами с проекцией
+колонок карточки: время (лучшее из нескольких прогонов) и пик памяти
+(tracemalloc).
+
+    python -m benchmarks.bench_read_models [--sizes 50,500,5000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from app.models.listing import db, init_db, Listing
+from app.models.migrations import run_migrations
+from app.read_models import card_columns, to_cards
+
+DESCRIPTION = (
+    'Мрачный трэп бит в стиле Atlanta, 140 BPM, сведен и отмастерен. '
+    'Эксклюзивная лицензия, стемы по запросу. Dark trap beat with heavy 808. '
+) * 20
+TAGS = ', '.join(['trap', 'dark', '808', 'atlanta', 'эксклюзив', 'drill', 'memphis'] * 10)
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    init_db(app)
+    # Индексы лент - как в рабочей базе
+    run_migrations(app)
+    return app
+
+
+def fill(count, seed=42):
+    rng = random.Random(seed)
+    started = datetime(2024, 1, 1)
+    rows = [{
+        'listing_type': rng.choice(['sell', 'buy', 'service']),
+        'author': f'producer{number}',
+        'contact': f'@producer{number}',
+        'item_type': rng.choice(['beat', 'kit', 'preset']),
+        'genre': rng.choice(['trap', 'drill', 'rnb']),
+        'preview_url': f'https://soundcloud.com/p/{number}',
+        'description': DESCRIPTION,
+        'price': f'{rng.randint(10, 300)}$',
+        'price_usd': float(rng.randint(10, 300)),
+        'tags': TAGS,
+        'created_at': started + timedelta(minutes=number),
+        'updated_at': started + timedelta(minutes=number),
+        'is_active': True,
+        'is_moderated': True,
+        'views': 0,
+        'contacts_clicked': 0,
+    } for number in range(count)]
+    with db.engine.begin() as conn:
+        conn.execute(db.insert(Listing.__table__), rows)
+
+
+def feed(limit):
+    return Listing.query.filter_by(is_active=True, is_moderated=True).order_by(
+        Listing.created_at.desc(), Listing.id.desc()
+    ).limit(limit)
+
+
+def load_orm(limit):
+    return feed(limit).all()
+
+
+def load_cards(limit):
+    return to_cards(feed(limit).with_entities(*card_columns()))
+
+
+def measure(loader, limit, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        loader(limit)
+        best = min(best, time.perf_counter() - started)
+
+    db.session.expunge_all()
+    tracemalloc.start()
+    items = loader(limit)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(items) == limit
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='50,500,5000')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            fill(max(sizes))
+            print(f"{'rows':>6} | {'ORM ms':>8} {'ORM KiB':>9} | {'cards ms':>8} {'cards KiB':>9} | speedup")
+            for size in sizes:
+                orm_time, orm_peak = measure(load_orm, size, args.repeats)
+                card_time, card_peak = measure(load_cards, size, args.repeats)
+                print(f"{size:>6} | {orm_time * 1000:8.2f} {orm_peak / 1024:9.0f} | "
+                      f"{card_time * 1000:8.2f} {card_peak / 1024:9.0f} | "
+                      f"{orm_time / card_time:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
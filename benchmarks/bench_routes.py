@@ -0,0 +1,451 @@
+"""Нагрузочный бенчмарк страниц, API и вебхука на синтетическом каталоге.
+
+Для каждого размера каталога (1k, 100k, 1M объявлений) заполняет
+SQLite-базу объявлениями и moderation_logs (детерминированно, seed 42),
+строит поисковый индекс и прогоняет сценарии index, search, stats,
+view_listing, track_contact, create_listing и /webhook/<token>:
+
+- client - последовательно через Flask test client (без сети);
+- server - через WSGI-сервер werkzeug в потоке и --concurrency
+  параллельных клиентов requests (или через --url уже запущенного
+  сервера, например gunicorn).
+
+Вебхук отправляет ответы в фейковый Bot API (benchmarks.fake_telegram).
+Для каждого сценария печатаются p50/p95/p99 задержки и пропускная
+способность; таблица сохраняется в bench_output.txt. С --baseline
+предыдущий файл сравнивается с текущим прогоном, и регрессия p95 или
+req/s больше --tolerance завершает бенчмарк с кодом 1.
+
+    python -m benchmarks.bench_routes [--sizes 1k,100k,1M] [--modes client,server]
+        [--requests 300] [--concurrency 8] [--db-dir DIR] [--baseline OLD.txt]
+"""
+import argparse
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+import requests
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from app.counters import listing_counters
+from app.factory import create_app
+from app.init_data import derive_secret_key
+from app.models.listing import db, Listing
+from app.search import search_engine
+from benchmarks.fake_telegram import FakeBotAPI
+
+TOKEN = '123456:bench-token'
+SEED_CHUNK = 20000
+
+GENRES = ('trap', 'drill', 'rnb', 'boom bap', 'lofi', 'phonk', 'house', 'pop')
+ITEM_TYPES = ('beat', 'kit', 'preset', 'mixing', 'mastering')
+LISTING_TYPES = ('sell', 'buy', 'service')
+WORDS = (
+    'мрачный', 'бит', 'атмосферный', 'сведение', 'мастеринг', 'эксклюзив',
+    'лицензия', 'стемы', 'dark', 'heavy', '808', 'melodic', 'guitar', 'piano',
+    'vocal', 'chops', 'bounce', 'memphis', 'atlanta', 'detroit', 'hard', 'chill',
+)
+SEARCH_QUERIES = ('мрачный бит', 'trap', 'drill 808', 'сведение', 'memphis phonk',
+                  'melodic guitar', 'эксклюзив', 'piano chill')
+
+# Порядок важен: сначала чтение, затем сценарии с записью
+SCENARIOS = ('index', 'search', 'stats', 'view_listing', 'track_contact',
+             'create_listing', 'webhook')
+
+HEADER = (f"{'size':>8} {'mode':<7} {'scenario':<15} {'requests':>8} {'errors':>6} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>9}")
+
+
+def parse_size(text):
+    """'1k' -> 1000, '1M' -> 1000000"""
+    text = text.strip()
+    multiplier = {'k': 1000, 'K': 1000, 'm': 1000000, 'M': 1000000}.get(text[-1:])
+    return int(float(text[:-1]) * multiplier) if multiplier else int(text)
+
+
+# ----------------------------------------------------------------------
+# Каталог
+# ----------------------------------------------------------------------
+
+def _listing_rows(rng, start, count, started):
+    rows = []
+    for number in range(start, start + count):
+        genre = rng.choice(GENRES)
+        rows.append({
+            'listing_type': rng.choice(LISTING_TYPES),
+            'author': f'producer{number % 5000}',
+            'contact': f'@producer{number % 5000}',
+            'item_type': rng.choice(ITEM_TYPES),
+            'genre': genre,
+            'preview_url': f'https://soundcloud.com/p/{number}',
+            'description': ' '.join(rng.choices(WORDS, k=rng.randint(8, 40))) + f' {genre}',
+            'price': f'{rng.randint(10, 300)}$',
+            'price_usd': float(rng.randint(10, 300)),
+            'tags': ', '.join(rng.sample(WORDS, 4)),
+            'created_at': started + timedelta(seconds=number * 30),
+            'updated_at': started + timedelta(seconds=number * 30),
+            'is_active': rng.random() > 0.05,
+            'is_moderated': rng.random() > 0.1,
+            'views': rng.randint(0, 500),
+            'contacts_clicked': rng.randint(0, 50),
+        })
+    return rows
+
+
+def seed_catalog(size, seed=42):
+    """Заполняет пустую базу size объявлениями и логами модерации к ним"""
+    rng = random.Random(seed)
+    started = datetime(2024, 1, 1)
+    listings = Listing.__table__
+    logs = db.metadata.tables['moderation_logs']
+    for start in range(0, size, SEED_CHUNK):
+        count = min(SEED_CHUNK, size - start)
+        rows = _listing_rows(rng, start, count, started)
+        with db.engine.begin() as conn:
+            first_id = conn.execute(db.select(db.func.coalesce(db.func.max(listings.c.id), 0))).scalar() + 1
+            conn.execute(db.insert(listings), rows)
+            conn.execute(db.insert(logs), [{
+                'listing_id': first_id + offset,
+                'action': 'auto_approved' if row['is_moderated'] else 'needs_review',
+                'reason': 'Clean',
+                'moderator': 'system',
+                'created_at': row['created_at'],
+            } for offset, row in enumerate(rows)])
+        print(f"\r  seeded {start + count}/{size}", end='', file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+    search_engine.reindex()
+
+
+def catalog_size(path):
+    if not os.path.exists(path):
+        return 0
+    try:
+        with sqlite3.connect(path) as conn:
+            return conn.execute('SELECT COUNT(*) FROM listings').fetchone()[0]
+    except sqlite3.DatabaseError:
+        return 0
+
+
+def make_app(db_path, api_url, page_cache_ttl):
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'AUTO_MIGRATE': True,
+        'TESTING': False,
+        'WTF_CSRF_ENABLED': False,
+        # Без фоновых потоков: время вебхука и отправки - внутри запроса
+        'JOB_WORKERS': 0,
+        'BOT_WORKERS': 0,
+        'TELEGRAM_OUTBOX_WORKERS': 0,
+        'TELEGRAM_RATE_LIMIT': 0,
+        # Клиенты бенчмарка - один IP; квоты мерили бы 429, а не маршруты
+        'RATE_LIMIT_ENABLED': False,
+        'TELEGRAM_BOT_TOKEN': TOKEN,
+        'TELEGRAM_API_URL': api_url,
+        'PAGE_CACHE_TTL': page_cache_ttl,
+        'METRICS_QUERY_WARN': 10 ** 6,
+    })
+
+
+# ----------------------------------------------------------------------
+# Запросы сценариев
+# ----------------------------------------------------------------------
+
+def init_data_header(user_id):
+    """Подписанный initData, как его отправляет Telegram Web App"""
+    fields = {
+        'auth_date': str(int(time.time())),
+        'query_id': f'bench{user_id}',
+        'user': json.dumps({'id': user_id, 'first_name': 'Bench', 'username': f'bench{user_id}'}),
+    }
+    data_check_string = '\n'.join(f'{key}={fields[key]}' for key in sorted(fields))
+    fields['hash'] = hmac.new(derive_secret_key(TOKEN), data_check_string.encode('utf-8'),
+                              hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+class RequestFactory:
+    """Запросы сценария: (метод, путь, параметры для клиента)"""
+
+    def __init__(self, size, seed=7):
+        self.size = size
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self._headers = {user_id: init_data_header(user_id) for user_id in range(1, 51)}
+
+    def _random_id(self):
+        with self._lock:
+            return self._rng.randint(1, self.size)
+
+    def _choice(self, values):
+        with self._lock:
+            return self._rng.choice(values)
+
+    def make(self, scenario):
+        number = next(self._counter)
+        if scenario == 'index':
+            path = self._choice(('/', '/?genre=trap', '/listings/sell', '/?item_type=kit'))
+            return 'GET', path, {}
+        if scenario == 'search':
+            return 'GET', '/search', {'params': {'query': self._choice(SEARCH_QUERIES)}}
+        if scenario == 'stats':
+            return 'GET', '/stats', {}
+        if scenario == 'view_listing':
+            return 'GET', f'/listing/{self._random_id()}', {}
+        if scenario == 'track_contact':
+            return 'GET', f'/track-contact/{self._random_id()}', {}
+        if scenario == 'create_listing':
+            return 'POST', '/create', {
+                'data': {
+                    'listing_type': 'sell',
+                    'author': f'bench{number}',
+                    'contact': f'@bench{number}',
+                    'item_type': 'beat',
+                    'genre': 'trap',
+                    'preview_url': f'https://soundcloud.com/bench/{number}',
+                    'price': '50$',
+                    'description': f'Мрачный бит номер {number} для нагрузочного теста',
+                    'tags': 'trap, dark',
+                },
+                'headers': {'X-Telegram-User': self._headers[number % 50 + 1]},
+            }
+        if scenario == 'webhook':
+            return 'POST', f'/webhook/{TOKEN}', {'json': {
+                'update_id': number,
+                'message': {
+                    'message_id': number,
+                    'date': int(time.time()),
+                    'chat': {'id': number % 1000 + 1, 'type': 'private'},
+                    'text': '/help',
+                },
+            }}
+        raise ValueError(f'Неизвестный сценарий: {scenario}')
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def _ok(status):
+    # 404 - удаленное (is_active=False) объявление; редирект - успешное создание
+    return status < 400 or status == 404
+
+
+def run_client(app, factory, scenario, count):
+    """Последовательные запросы через test client; (задержки, ошибки, секунды)"""
+    client = app.test_client()
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(count):
+        method, path, kwargs = factory.make(scenario)
+        if 'params' in kwargs:
+            kwargs = dict(kwargs, query_string=kwargs.pop('params'))
+        begin = time.perf_counter()
+        response = client.open(path, method=method, **kwargs)
+        latencies.append(time.perf_counter() - begin)
+        if not _ok(response.status_code):
+            errors += 1
+    return latencies, errors, time.perf_counter() - started
+
+
+def run_http(base_url, factory, scenario, count, concurrency):
+    """Параллельные HTTP-клиенты; (задержки, ошибки, секунды)"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    remaining = itertools.count()
+
+    def worker():
+        session = requests.Session()
+        local = []
+        local_errors = 0
+        while next(remaining) < count:
+            method, path, kwargs = factory.make(scenario)
+            begin = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, timeout=60,
+                                           allow_redirects=False, **kwargs)
+                ok = _ok(response.status_code)
+            except requests.RequestException:
+                ok = False
+            local.append(time.perf_counter() - begin)
+            local_errors += not ok
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return latencies, errors[0], time.perf_counter() - started
+
+
+def summarize(size, mode, scenario, latencies, errors, elapsed):
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'size': size, 'mode': mode, 'scenario': scenario,
+        'requests': len(latencies), 'errors': errors,
+        'p50': cuts[49] * 1000, 'p95': cuts[94] * 1000, 'p99': cuts[98] * 1000,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+    }
+
+
+def format_row(row):
+    return (f"{row['size']:>8} {row['mode']:<7} {row['scenario']:<15} {row['requests']:>8} "
+            f"{row['errors']:>6} {row['p50']:8.2f} {row['p95']:8.2f} {row['p99']:8.2f} "
+            f"{row['rps']:9.1f}")
+
+
+def read_results(path):
+    """Строки таблицы из bench_output.txt: {(size, mode, scenario): row}"""
+    results = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) != 9 or not parts[0].isdigit():
+                continue
+            size, mode, scenario, requests_count, errors, p50, p95, p99, rps = parts
+            results[(int(size), mode, scenario)] = {
+                'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'rps': float(rps),
+            }
+    return results
+
+
+def compare(rows, baseline, tolerance):
+    """Печатает изменения относительно базового прогона; True если есть регрессии"""
+    regressed = False
+    print(f"\nСравнение с базовым прогоном (допуск {tolerance:.0%}):")
+    for row in rows:
+        base = baseline.get((row['size'], row['mode'], row['scenario']))
+        if base is None:
+            continue
+        p95_delta = row['p95'] / base['p95'] - 1 if base['p95'] else 0.0
+        rps_delta = row['rps'] / base['rps'] - 1 if base['rps'] else 0.0
+        worse = p95_delta > tolerance or rps_delta < -tolerance
+        regressed |= worse
+        print(f"{'❌' if worse else '  '} {row['size']:>8} {row['mode']:<7} {row['scenario']:<15} "
+              f"p95 {p95_delta:+7.1%}  req/s {rps_delta:+7.1%}")
+    return regressed
+
+
+def run_size(size, args, api_url, db_dir, output):
+    path = os.path.join(db_dir, f'catalog-{size}.db')
+    existing = catalog_size(path)
+    if existing and existing < size:
+        os.remove(path)
+        existing = 0
+
+    app = make_app(path, api_url, args.page_cache_ttl)
+    with app.app_context():
+        if not existing:
+            print(f"Seeding {size} listings -> {path}", file=sys.stderr)
+            started = time.perf_counter()
+            seed_catalog(size)
+            print(f"  done in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    factory = RequestFactory(size)
+    server = None
+    base_url = args.url
+    if 'server' in args.modes and base_url is None:
+        server = make_server('127.0.0.1', 0, app, threaded=True,
+                             request_handler=QuietRequestHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+
+    rows = []
+    try:
+        for mode in args.modes:
+            for scenario in args.scenarios:
+                # Прогрев: первый запрос импортирует модули представлений
+                run_client(app, factory, scenario, args.warmup)
+                if mode == 'client':
+                    result = run_client(app, factory, scenario, args.requests)
+                else:
+                    result = run_http(base_url, factory, scenario, args.requests, args.concurrency)
+                row = summarize(size, mode, scenario, *result)
+                rows.append(row)
+                print(format_row(row))
+                output.write(format_row(row) + '\n')
+                output.flush()
+    finally:
+        if server is not None:
+            server.shutdown()
+        # Несброшенные счетчики просмотров - в базу этого каталога
+        listing_counters.flush()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1k,100k,1M')
+    parser.add_argument('--modes', default='client,server')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=300, help='Запросов на сценарий')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--url', help='Готовый сервер вместо встроенного (режим server)')
+    parser.add_argument('--db-dir', help='Каталог для баз (переиспользуются между запусками)')
+    parser.add_argument('--no-page-cache', dest='page_cache_ttl', action='store_const',
+                        const=0, default=30, help='Отключить кэш страниц')
+    parser.add_argument('--output', default='bench_output.txt')
+    parser.add_argument('--baseline', help='Предыдущий bench_output.txt для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    args = parser.parse_args()
+    args.modes = [mode for mode in args.modes.split(',') if mode]
+    args.scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+
+    baseline = read_results(args.baseline) if args.baseline else None
+    api = FakeBotAPI()
+    api_url = api.start()
+    tmp = None
+    db_dir = args.db_dir
+    if db_dir is None:
+        tmp = tempfile.TemporaryDirectory()
+        db_dir = tmp.name
+    os.makedirs(db_dir, exist_ok=True)
+
+    rows = []
+    try:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            output.write(
+                f"# bench_routes {datetime.now().isoformat(timespec='seconds')} "
+                f"python {platform.python_version()} sqlite {sqlite3.sqlite_version} "
+                f"requests={args.requests} concurrency={args.concurrency} "
+                f"page_cache_ttl={args.page_cache_ttl}\n"
+            )
+            output.write(HEADER + '\n')
+            print(HEADER)
+            for size in sizes:
+                rows += run_size(size, args, api_url, db_dir, output)
+    finally:
+        api.stop()
+        if tmp is not None:
+            tmp.cleanup()
+
+    print(f"\nРезультаты сохранены в {args.output}")
+    if baseline is not None and compare(rows, baseline, args.tolerance):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Бенчмарк холодного старта serverless-функции (api/index.py).
+
+Запускает `python -X importtime -c "import api.index"` в чистом
+процессе, суммирует время импорта верхнего уровня и показывает самые
+тяжелые модули. Завершается с кодом 1, если импорт дольше бюджета или на
+холодном старте загрузились модули, которые должны грузиться лениво.
+
+    python -m benchmarks.bench_startup [--budget-ms 800] [--repeats 3]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Загружаются при первом обращении, а не при импорте функции
+LAZY_MODULES = (
+    'app.moderation',
+    'app.moderation_pipeline',
+    'app.forms',
+    'app.telegram_client',
+    'app.bot',
+    'app.views.pages',
+    'app.views.create',
+    'app.views.bot',
+    'requests',
+    'wtforms',
+)
+
+CHECK_MODULES = (
+    'import sys, api.index; '
+    'print(",".join(m for m in {modules!r} if m in sys.modules))'
+)
+
+
+def run_importtime(db_path):
+    """(строки -X importtime, загруженные ленивые модули)"""
+    env = dict(os.environ, PYTHONPATH=BASE_DIR, DATABASE_URL=f'sqlite:///{db_path}')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHECK_MODULES.format(modules=LAZY_MODULES)],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f'import api.index завершился с кодом {result.returncode}')
+    loaded = [name for name in result.stdout.strip().split(',') if name]
+    return result.stderr.splitlines(), loaded
+
+
+def parse_importtime(lines):
+    """[(модуль, self мкс, cumulative мкс, уровень вложенности)]"""
+    entries = []
+    for line in lines:
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        # После '|' один пробел, затем по два на уровень вложенности
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=800.0,
+                        help='Допустимое суммарное время импорта')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='Прогонов (берется лучший - меньше шума от диска)')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    best = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(args.repeats):
+            lines, loaded = run_importtime(os.path.join(tmp, 'startup.db'))
+            entries = parse_importtime(lines)
+            total_us = sum(cumulative for _, _, cumulative, depth in entries if depth == 0)
+            if best is None or total_us < best[0]:
+                best = (total_us, entries, loaded)
+
+    total_us, entries, loaded = best
+    print(f"{'self ms':>8} {'cumul ms':>9}  модуль")
+    for name, self_us, cumulative_us, _ in sorted(entries, key=lambda e: e[1], reverse=True)[:args.top]:
+        print(f"{self_us / 1000:8.1f} {cumulative_us / 1000:9.1f}  {name}")
+    print(f"\nМодулей: {len(entries)}, импорт api.index: {total_us / 1000:.1f} ms "
+          f"(бюджет {args.budget_ms:.0f} ms)")
+
+    failed = False
+    if loaded:
+        print(f"❌ На холодном старте загружены ленивые модули: {', '.join(loaded)}")
+        failed = True
+    if total_us / 1000 > args.budget_ms:
+        print("❌ Импорт превысил бюджет")
+        failed = True
+    if failed:
+        raise SystemExit(1)
+    print("✅ Холодный старт в пределах бюджета")
+
+
+if __name__ == '__main__':
+    main()
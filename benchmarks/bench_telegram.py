@@ -0,0 +1,74 @@
+"""Бенчмарк клиента Telegram на фейковом Bot API (без сети).
+
+Сравнивает старую схему "requests.post без сессии на каждое сообщение"
+с пулом соединений и очередью исходящих, в том числе под лимитом 429.
+
+    python -m benchmarks.bench_telegram [--messages 300] [--rate-limit 100]
+"""
+import argparse
+import time
+
+import requests
+
+from app.telegram_client import TelegramClient, TelegramOutbox
+from benchmarks.fake_telegram import FakeBotAPI
+
+TOKEN = '123:bench'
+
+
+def bench_naive(url, messages):
+    started = time.perf_counter()
+    for number in range(messages):
+        requests.post(f'{url}/bot{TOKEN}/sendMessage', json={'chat_id': 1, 'text': f'm{number}'})
+    return time.perf_counter() - started
+
+
+def bench_pooled(url, messages):
+    client = TelegramClient(token=TOKEN, api_url=url)
+    started = time.perf_counter()
+    for number in range(messages):
+        client.send_message(1, f'm{number}', parse_mode=None)
+    return time.perf_counter() - started
+
+
+def bench_outbox(url, messages, workers, rate_limit):
+    client = TelegramClient(token=TOKEN, api_url=url, max_retries=10)
+    outbox = TelegramOutbox(client, workers=workers, rate_limit=rate_limit)
+
+    started = time.perf_counter()
+    for number in range(messages):
+        outbox.send_message(1, f'm{number}', parse_mode=None)
+    enqueued = time.perf_counter() - started
+    outbox.drain(timeout=600)
+    return enqueued, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=300)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rate-limit', type=int, default=100,
+                        help='limit of the fake server, requests per second')
+    args = parser.parse_args()
+
+    api = FakeBotAPI()
+    url = api.start()
+    naive = bench_naive(url, args.messages)
+    pooled = bench_pooled(url, args.messages)
+    api.stop()
+    print(f"naive requests.post : {args.messages / naive:8.0f} msg/s")
+    print(f"pooled session      : {args.messages / pooled:8.0f} msg/s")
+
+    # Клиенту не сообщаем лимит сервера - он должен подстроиться по 429
+    limited = FakeBotAPI(rate_limit=args.rate_limit, retry_after=1)
+    url = limited.start()
+    enqueued, total = bench_outbox(url, args.messages, args.workers, rate_limit=0)
+    limited.stop()
+    print(f"outbox enqueue      : {args.messages / enqueued:8.0f} msg/s (webhook side)")
+    print(f"outbox delivery     : {len(limited.messages) / total:8.0f} msg/s "
+          f"under {args.rate_limit}/s limit, {limited.rejected} x 429 handled, "
+          f"{len(limited.messages)}/{args.messages} delivered")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Локальный фейковый сервер Telegram Bot API для офлайн-тестов.
+
+Понимает POST /bot<token>/<method> для sendMessage, getUpdates и
+(set|delete)Webhook,
+записывает все вызовы и умеет имитировать лимит Telegram: при
+превышении rate_limit запросов в секунду отвечает 429 с retry_after.
+
+    python -m benchmarks.fake_telegram --port 8081 --rate-limit 30
+    TELEGRAM_API_URL=http://127.0.0.1:8081 python app.py
+"""
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeBotAPI:
+    """Состояние фейкового API: принятые сообщения и очередь апдейтов"""
+
+    def __init__(self, rate_limit=None, retry_after=1, latency=0.0):
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.latency = latency
+        self.messages = []
+        self.rejected = 0
+        self.updates = deque()
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._window = deque()
+        self._lock = threading.Lock()
+        self.server = None
+
+    def add_update(self, text, chat_id=1, user_id=1):
+        """Кладет апдейт с текстом сообщения для getUpdates"""
+        with self._lock:
+            update_id = self._next_update_id
+            self._next_update_id += 1
+            self.updates.append({
+                'update_id': update_id,
+                'message': {
+                    'message_id': update_id,
+                    'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'},
+                    'from': {'id': user_id, 'is_bot': False, 'first_name': 'Test'},
+                    'text': text,
+                }
+            })
+            return update_id
+
+    def handle(self, method, params):
+        """Возвращает (HTTP-статус, JSON-ответ) для вызова метода"""
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            if self.rate_limit:
+                now = time.monotonic()
+                while self._window and now - self._window[0] > 1.0:
+                    self._window.popleft()
+                if len(self._window) >= self.rate_limit:
+                    self.rejected += 1
+                    return 429, {
+                        'ok': False,
+                        'error_code': 429,
+                        'description': f'Too Many Requests: retry after {self.retry_after}',
+                        'parameters': {'retry_after': self.retry_after}
+                    }
+                self._window.append(now)
+
+            if method == 'sendMessage':
+                message = dict(params, message_id=self._next_message_id)
+                self._next_message_id += 1
+                self.messages.append(message)
+                return 200, {'ok': True, 'result': message}
+
+            if method in ('deleteWebhook', 'setWebhook'):
+                return 200, {'ok': True, 'result': True}
+
+            if method == 'getUpdates':
+                offset = int(params.get('offset') or 0)
+                while self.updates and self.updates[0]['update_id'] < offset:
+                    self.updates.popleft()
+                limit = int(params.get('limit') or 100)
+                return 200, {'ok': True, 'result': list(self.updates)[:limit]}
+
+        return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found'}
+
+    def start(self, host='127.0.0.1', port=0):
+        """Запускает сервер в фоновом потоке; возвращает базовый URL"""
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Без этого keep-alive упирается в Nagle + delayed ACK (~40 мс на ответ)
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b'{}'
+                try:
+                    params = json.loads(body or b'{}')
+                except ValueError:
+                    params = {}
+                method = self.path.rsplit('/', 1)[-1]
+                status, payload = api.handle(method, params)
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f'http://{host}:{self.server.server_address[1]}'
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Telegram Bot API server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--rate-limit', type=int, default=None)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.rate_limit, args.retry_after, args.latency)
+    url = api.start(args.host, args.port)
+    print(f"Fake Bot API listening on {url}")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"messages={len(api.messages)} rejected_429={api.rejected}")
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == '__main__':
+    main()
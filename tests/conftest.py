@@ -0,0 +1,62 @@
+"""Общие фикстуры: приложение на временной SQLite без фоновых потоков"""
+import pytest
+
+# Рабочие таблицы, которые тесты очищают после себя (дочерние - первыми)
+TABLES = ('moderation_logs', 'listings', 'users', 'background_jobs',
+          'moderation_logs_archive', 'listings_archive')
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    # Фабрика импортируется здесь: разбор цен тестируется и без моделей
+    from app.factory import create_app
+
+    path = tmp_path_factory.mktemp('db') / 'test.db'
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'BACKGROUND_FLUSH': False,
+        'JOB_WORKERS': 0,
+        'JOB_INLINE': False,
+        'ARCHIVE_INTERVAL_HOURS': 0,
+        'RATE_LIMIT_BACKEND': 'local',
+        'TELEGRAM_BOT_TOKEN': '123:test',
+    })
+    return app
+
+
+@pytest.fixture
+def db(app):
+    """db в контексте приложения; после теста таблицы и буфер счетчиков очищаются"""
+    from app.counters import listing_counters
+    from app.models.listing import db
+
+    with app.app_context():
+        yield db
+        db.session.rollback()
+        tables = set(db.inspect(db.engine).get_table_names())
+        with db.engine.begin() as conn:
+            for name in TABLES:
+                if name in tables:
+                    conn.execute(db.text(f'DELETE FROM {name}'))
+        store = listing_counters.store
+        for key in store.keys(f'{listing_counters.KEY_PREFIX}:*'):
+            store.delete(key)
+
+
+@pytest.fixture
+def make_listing(db):
+    """Создает объявление; возвращает его id"""
+    from app.models.listing import Listing
+
+    def make(**fields):
+        values = dict(listing_type='sell', author='author', contact='@contact',
+                      item_type='beat', genre='trap', preview_url='https://example.com/p',
+                      price='50$', description='Бит', is_moderated=True)
+        values.update(fields)
+        listing = Listing(**values)
+        db.session.add(listing)
+        db.session.commit()
+        return listing.id
+
+    return make
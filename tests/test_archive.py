@@ -0,0 +1,121 @@
+"""Архив: перенос неактивных объявлений и старого журнала модерации"""
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy as sa
+
+from app.archive import archive_stale_job, archive_store
+from app.jobs import PENDING, jobs_table
+from app.models.listing import ModerationLog
+
+
+@pytest.fixture
+def make_stale(db, make_listing):
+    """Неактивное объявление, не менявшееся дольше срока архивации"""
+    def make(**fields):
+        listing_id = make_listing(is_active=False, **fields)
+        db.session.execute(
+            db.text('UPDATE listings SET updated_at = :at WHERE id = :id'),
+            {'at': datetime.utcnow() - archive_store.listings_after - timedelta(days=1), 'id': listing_id}
+        )
+        db.session.commit()
+        return listing_id
+    return make
+
+
+def _log(db, listing_id, action, created_at=None):
+    db.session.add(ModerationLog(listing_id=listing_id, action=action,
+                                 created_at=created_at or datetime.utcnow()))
+    db.session.commit()
+
+
+def _count(db, table):
+    return db.session.execute(db.text(f'SELECT COUNT(*) FROM {table}')).scalar()
+
+
+def test_stale_listing_moves_with_its_logs(db, make_listing, make_stale):
+    active_id = make_listing()
+    stale_id = make_stale()
+    _log(db, stale_id, 'approved')
+    _log(db, active_id, 'approved')
+    assert archive_store.pending() == (1, 0)
+
+    report = archive_store.run()
+    assert (report.listings, report.logs, report.remaining) == (1, 1, False)
+    assert _count(db, 'listings') == 1
+    assert _count(db, 'moderation_logs') == 1
+
+    row, archived = archive_store.find_listing(stale_id)
+    assert archived and row.source_id == stale_id
+    assert [log.action for log in archive_store.listing_logs(stale_id)] == ['approved']
+    assert archive_store.find_listing(active_id)[1] is False
+
+
+def test_old_logs_of_active_listing(db, make_listing):
+    created_at = datetime.utcnow() - archive_store.logs_after - timedelta(days=1)
+    listing_id = make_listing(created_at=created_at)
+    _log(db, listing_id, 'submitted', created_at)
+    _log(db, listing_id, 'approved')
+
+    report = archive_store.run()
+    assert (report.listings, report.logs) == (0, 1)
+    assert _count(db, 'moderation_logs') == 1
+    assert [log.action for log in archive_store.listing_logs(listing_id)] == ['submitted', 'approved']
+
+
+def test_reused_listing_id(db, make_stale):
+    # SQLite без AUTOINCREMENT выдает id удаленной последней строки снова
+    first_id = make_stale(author='first')
+    _log(db, first_id, 'first-log', datetime.utcnow() - timedelta(days=60))
+    archive_store.run()
+
+    second_id = make_stale(author='second', created_at=datetime.utcnow() - timedelta(days=40))
+    assert second_id == first_id
+    _log(db, second_id, 'second-log', datetime.utcnow() - timedelta(days=35))
+    archive_store.run()
+
+    assert _count(db, 'listings_archive') == 2
+    row, archived = archive_store.find_listing(second_id)
+    assert archived and row.author == 'second'
+    assert [log.action for log in archive_store.listing_logs(second_id)] == ['second-log']
+
+
+def test_batches_per_run(db, make_stale, monkeypatch):
+    monkeypatch.setattr(archive_store, 'batch_size', 2)
+    for _ in range(5):
+        make_stale()
+
+    report = archive_store.run(max_batches=2)
+    assert (report.listings, report.remaining) == (4, True)
+    report = archive_store.run(max_batches=2)
+    assert (report.listings, report.remaining) == (1, False)
+
+
+def _queued_runs(db):
+    return db.session.execute(
+        sa.select(jobs_table.c.run_after)
+        .where(jobs_table.c.kind == 'archive_stale', jobs_table.c.status == PENDING)
+    ).scalars().all()
+
+
+def test_job_requeues_itself(db, make_stale, monkeypatch):
+    monkeypatch.setattr(archive_store, 'interval', timedelta(hours=24))
+    monkeypatch.setattr(archive_store, 'batch_size', 1)
+    monkeypatch.setattr(archive_store, 'batches_per_job', 1)
+    make_stale()
+    make_stale()
+
+    # Осталось что переносить - следующая порция сразу
+    archive_stale_job({})
+    run_after, = _queued_runs(db)
+    assert run_after <= datetime.utcnow()
+
+    db.session.execute(jobs_table.delete())
+    db.session.commit()
+    monkeypatch.setattr(archive_store, 'batches_per_job', 5)
+    archive_stale_job({})
+    archive_stale_job({})
+    # Архив пуст - одна задача через ARCHIVE_INTERVAL_HOURS
+    run_after, = _queued_runs(db)
+    assert run_after > datetime.utcnow() + timedelta(hours=23)
+    assert archive_store.schedule() is False
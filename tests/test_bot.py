@@ -0,0 +1,79 @@
+"""Прием апдейтов бота: дедупликация update_id и разбор команд"""
+import pytest
+
+from app import bot
+from app.bot import CommandRegistry, UpdateDeduplicator, UpdateDispatcher
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(bot, 'time', clock)
+    return clock
+
+
+def test_duplicate_update(clock):
+    deduplicator = UpdateDeduplicator()
+    assert not deduplicator.is_duplicate(1)
+    assert not deduplicator.is_duplicate(2)
+    assert deduplicator.is_duplicate(1)
+
+
+def test_window_expires(clock):
+    deduplicator = UpdateDeduplicator(window=60)
+    deduplicator.is_duplicate(1)
+    clock.now += 30
+    assert deduplicator.is_duplicate(1) is True
+    clock.now += 61
+    assert deduplicator.is_duplicate(1) is False
+
+
+def test_window_size_is_bounded(clock):
+    deduplicator = UpdateDeduplicator(maxsize=3)
+    for update_id in range(5):
+        deduplicator.is_duplicate(update_id)
+    assert len(deduplicator._seen) == 3
+    # Самые старые вытеснены, последние помнятся
+    assert not deduplicator.is_duplicate(0)
+    assert deduplicator.is_duplicate(4)
+
+
+def _message(text, chat_id=42):
+    return {'message': {'chat': {'id': chat_id}, 'text': text}}
+
+
+def test_command_dispatch():
+    registry = CommandRegistry()
+    chats = []
+
+    @registry.command('/start', 'Начать')
+    def start(chat_id):
+        chats.append(chat_id)
+
+    assert registry.dispatch(_message('/start@BeatssudaBot payload'))
+    assert not registry.dispatch(_message('/help'))
+    assert not registry.dispatch(_message('привет'))
+    assert not registry.dispatch({'callback_query': {}})
+    assert chats == [42]
+    assert registry.descriptions['/start'] == 'Начать'
+
+
+def test_dispatcher_drops_redelivered_update(app):
+    registry = CommandRegistry()
+    chats = []
+    registry.command('/start')(chats.append)
+
+    dispatcher = UpdateDispatcher(registry, workers=0)
+    dispatcher.app = app
+    update = dict(_message('/start'), update_id=7)
+    assert dispatcher.submit(update)
+    assert not dispatcher.submit(update)
+    assert chats == [42]
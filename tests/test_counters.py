@@ -0,0 +1,93 @@
+"""Буфер счетчиков: сброс в базу, повтор после ошибки, брошенные порции"""
+import pytest
+
+from app import counters
+from app.counters import listing_counters
+from app.models.listing import Listing
+
+
+def _views(db, listing_id):
+    return db.session.execute(
+        db.text('SELECT views FROM listings WHERE id = :id'), {'id': listing_id}
+    ).scalar()
+
+
+def test_flush_writes_deltas(db, make_listing):
+    listing_id = make_listing()
+    listing_counters.incr(listing_id, 'views')
+    listing_counters.incr(listing_id, 'views', 2)
+    listing_counters.incr(listing_id, 'contacts_clicked')
+    assert listing_counters.pending(listing_id, 'views') == 3
+
+    assert listing_counters.flush() == 1
+    assert listing_counters.pending(listing_id, 'views') == 0
+    assert _views(db, listing_id) == 3
+    assert listing_counters.flush() == 0
+
+
+def test_unknown_counter(db, make_listing):
+    with pytest.raises(ValueError):
+        listing_counters.incr(make_listing(), 'likes')
+
+
+def test_apply_pending_does_not_double_count(db, make_listing):
+    listing_id = make_listing()
+    listing_counters.incr(listing_id, 'views', 5)
+
+    listing = db.session.get(Listing, listing_id)
+    listing_counters.apply_pending([listing])
+    assert listing.views == 5
+    # apply_pending не делает объект грязным - коммит не запишет приращение
+    assert listing not in db.session.dirty
+    db.session.commit()
+
+    listing_counters.flush()
+    db.session.expire_all()
+    listing = db.session.get(Listing, listing_id)
+    listing_counters.apply_pending([listing])
+    assert listing.views == 5
+
+
+def test_failed_flush_restores_deltas(db, make_listing, monkeypatch):
+    listing_id = make_listing()
+    listing_counters.incr(listing_id, 'views', 4)
+
+    class BrokenDatabase:
+        text = db.text
+
+        @property
+        def engine(self):
+            raise RuntimeError('database is down')
+
+    monkeypatch.setattr(counters, 'db', BrokenDatabase())
+    assert listing_counters.flush() == 0
+    assert listing_counters.pending(listing_id, 'views') == 4
+
+    monkeypatch.undo()
+    assert listing_counters.flush() == 1
+    assert _views(db, listing_id) == 4
+
+
+def test_orphaned_batch_is_recovered(db, make_listing):
+    listing_id = make_listing()
+    store = listing_counters.store
+    orphan = f'{listing_counters.KEY_PREFIX}:flushing:dead-worker'
+    store.hincrby(f'{orphan}:views', str(listing_id), 7)
+
+    listing_counters._recover_orphans()
+    assert not store.exists(f'{orphan}:views')
+    assert listing_counters.pending(listing_id, 'views') == 7
+    listing_counters.flush()
+    assert _views(db, listing_id) == 7
+
+
+def test_leased_batch_is_left_to_owner(db, make_listing):
+    listing_id = make_listing()
+    store = listing_counters.store
+    owner = f'{listing_counters.KEY_PREFIX}:flushing:live-worker'
+    store.hincrby(f'{owner}:views', str(listing_id), 2)
+    store.set(f'{owner}:lease', 1, ex=counters.LEASE_SECONDS)
+
+    listing_counters._recover_orphans()
+    assert store.hget(f'{owner}:views', str(listing_id)) is not None
+    assert listing_counters.pending(listing_id, 'views') == 0
@@ -0,0 +1,114 @@
+"""Очередь задач: захват, повторы с задержкой, возврат аренды, очистка"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy as sa
+
+from app.jobs import DONE, FAILED, PENDING, RUNNING, job_queue, jobs_table
+
+calls = []
+
+
+@job_queue.handler('test.ok')
+def ok_job(payload):
+    calls.append(payload)
+
+
+@job_queue.handler('test.fail')
+def failing_job(payload):
+    raise RuntimeError('boom')
+
+
+@pytest.fixture(autouse=True)
+def reset_calls():
+    calls.clear()
+
+
+def _jobs(db):
+    return db.session.execute(sa.select(jobs_table).order_by(jobs_table.c.id)).all()
+
+
+def _enqueue(db, kind, payload=None, delay=0):
+    job_queue.enqueue(kind, payload, delay=delay)
+    db.session.commit()
+
+
+def test_job_runs_once(db):
+    _enqueue(db, 'test.ok', {'listing_id': 1})
+    assert job_queue.run_pending() == 1
+    assert job_queue.run_pending() == 0
+    assert calls == [{'listing_id': 1}]
+
+    job, = _jobs(db)
+    assert (job.status, job.attempts, job.locked_until) == (DONE, 1, None)
+
+
+def test_unknown_kind(db):
+    with pytest.raises(ValueError):
+        job_queue.enqueue('test.missing')
+
+
+def test_delayed_job_waits(db):
+    _enqueue(db, 'test.ok', delay=60)
+    assert job_queue.run_pending() == 0
+    assert calls == []
+
+
+def test_failed_job_is_retried_then_given_up(db, monkeypatch):
+    monkeypatch.setattr(job_queue, 'max_attempts', 2)
+    _enqueue(db, 'test.fail')
+    assert job_queue.run_pending() == 1
+
+    job, = _jobs(db)
+    assert (job.status, job.attempts, job.last_error) == (PENDING, 1, 'boom')
+    assert job.run_after > datetime.utcnow()
+    # Повтор - только после задержки
+    assert job_queue.run_pending() == 0
+
+    db.session.execute(jobs_table.update().values(run_after=datetime.utcnow()))
+    db.session.commit()
+    assert job_queue.run_pending() == 1
+    job, = _jobs(db)
+    assert (job.status, job.attempts) == (FAILED, 2)
+
+
+def test_expired_lease_is_released(db):
+    now = datetime.utcnow()
+    _enqueue(db, 'test.ok', {'n': 1})
+    _enqueue(db, 'test.ok', {'n': 2})
+    first, second = _jobs(db)
+    db.session.execute(jobs_table.update().where(jobs_table.c.id == first.id)
+                       .values(status=RUNNING, locked_until=now - timedelta(seconds=1)))
+    db.session.execute(jobs_table.update().where(jobs_table.c.id == second.id)
+                       .values(status=RUNNING, locked_until=now + timedelta(minutes=5)))
+    db.session.commit()
+
+    job_queue._release_expired()
+    assert [job.status for job in _jobs(db)] == [PENDING, RUNNING]
+    assert job_queue.run_pending() == 1
+    assert calls == [{'n': 1}]
+
+
+def test_claim_is_exclusive(db):
+    _enqueue(db, 'test.ok')
+    job = job_queue._claim()
+    assert job is not None and json.loads(job.payload) == {}
+    assert job_queue._claim() is None
+
+
+def test_purge_done(db):
+    old = datetime.utcnow() - job_queue.retention - timedelta(minutes=1)
+    for _ in range(3):
+        _enqueue(db, 'test.ok')
+    done_old, failed_old, done_new = _jobs(db)
+    db.session.execute(jobs_table.update().where(jobs_table.c.id == done_old.id)
+                       .values(status=DONE, updated_at=old))
+    db.session.execute(jobs_table.update().where(jobs_table.c.id == failed_old.id)
+                       .values(status=FAILED, updated_at=old))
+    db.session.execute(jobs_table.update().where(jobs_table.c.id == done_new.id)
+                       .values(status=DONE))
+    db.session.commit()
+
+    assert job_queue.purge_done() == 1
+    assert [job.id for job in _jobs(db)] == [failed_old.id, done_new.id]
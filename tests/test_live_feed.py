@@ -0,0 +1,99 @@
+"""Живая лента: публикация после коммита, фильтры, Last-Event-ID, SSE"""
+import pytest
+
+from app.api.live import sse_batch
+from app.live_feed import Subscriber, live_feed
+from app.models.listing import Listing
+
+
+@pytest.fixture
+def subscriber(db):
+    subscribers = []
+
+    def subscribe(**kwargs):
+        subscriber = live_feed.subscribe(**kwargs)
+        subscribers.append(subscriber)
+        return subscriber
+
+    yield subscribe
+    for subscriber in subscribers:
+        live_feed.unsubscribe(subscriber)
+
+
+def _ids(items):
+    return [item['listing']['id'] for item in items]
+
+
+def test_published_after_commit(subscriber, make_listing):
+    trap = subscriber(genre='trap')
+    drill = subscriber(genre='drill')
+
+    listing_id = make_listing(genre='trap')
+    make_listing(genre='trap', is_moderated=False)
+    assert _ids(trap.wait(0)) == [listing_id]
+    assert drill.wait(0) == []
+
+
+def test_rollback_cancels_publication(db, subscriber, make_listing):
+    feed = subscriber()
+    db.session.add(Listing(listing_type='sell', author='a', contact='@c', item_type='beat',
+                           genre='trap', preview_url='https://example.com/p', price='5$',
+                           is_moderated=True))
+    db.session.flush()
+    db.session.rollback()
+    assert feed.wait(0) == []
+
+
+def test_published_when_moderated(db, subscriber, make_listing):
+    listing_id = make_listing(is_moderated=False)
+    feed = subscriber()
+
+    listing = db.session.get(Listing, listing_id)
+    listing.views = 10
+    db.session.commit()
+    assert feed.wait(0) == []
+
+    listing.is_moderated = True
+    db.session.commit()
+    assert _ids(feed.wait(0)) == [listing_id]
+
+
+def test_missed_events_are_replayed(subscriber, make_listing):
+    last_id = live_feed.last_id()
+    ids = [make_listing() for _ in range(3)]
+
+    feed = subscriber(last_id=last_id + 1)
+    assert _ids(feed.wait(0)) == ids[1:]
+    # Номер из будущего - процесс перезапустился, отдается все хранимое
+    feed = subscriber(last_id=live_feed.last_id() + 100)
+    assert _ids(feed.wait(0))[-3:] == ids
+
+
+def test_slow_subscriber_is_marked_lagged():
+    feed = Subscriber(maxsize=2)
+    for number in range(3):
+        feed.push({'id': number, 'listing': {'id': number}})
+    assert feed.lagged
+    assert _ids(feed.wait(0)) == [1, 2]
+
+    text = sse_batch(feed, [])
+    assert text.startswith('event: reset') and ': ping' in text
+    assert not feed.lagged
+
+
+def test_subscriber_limit(subscriber, monkeypatch):
+    monkeypatch.setattr(live_feed, 'max_subscribers', 1)
+    assert subscriber() is not None
+    assert subscriber() is None
+
+
+def test_sse_stream(app, db, make_listing):
+    last_id = live_feed.last_id()
+    listing_id = make_listing()
+
+    response = app.test_client().get('/api/feed/live', headers={'Last-Event-ID': str(last_id)})
+    body = response.get_data(as_text=True)
+    assert response.mimetype == 'text/event-stream'
+    assert body.startswith('retry: ')
+    assert f'id: {last_id + 1}\nevent: listing\n' in body
+    assert f'"id": {listing_id}' in body
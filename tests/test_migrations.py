@@ -0,0 +1,42 @@
+"""Миграции схемы и планы запросов лент"""
+from app.models.migrations import MIGRATIONS, check_query_plans, get_schema_version, run_migrations
+
+
+def _indexes(db, table):
+    return {index['name'] for index in db.inspect(db.engine).get_indexes(table)}
+
+
+def _filters_version(db):
+    return db.session.execute(db.text('SELECT version FROM content_filters_version')).scalar()
+
+
+def test_schema_is_current(app, db):
+    with db.engine.connect() as conn:
+        assert get_schema_version(conn) == max(migration.version for migration in MIGRATIONS)
+    assert run_migrations(app) == []
+
+
+def test_pending_migrations_are_applied(app, db):
+    # База, на которой еще не было миграций 6 и 7
+    with db.engine.begin() as conn:
+        conn.execute(db.text('DELETE FROM schema_migrations WHERE version >= 6'))
+        conn.execute(db.text('DROP INDEX ix_listings_inactive'))
+
+    applied = run_migrations(app)
+    assert [migration.version for migration in applied] == [6, 7]
+    assert 'ix_listings_inactive' in _indexes(db, 'listings')
+
+    # Повторная установка триггеров не сбрасывает и не дублирует версию
+    version = _filters_version(db)
+    db.session.execute(db.text(
+        "INSERT INTO content_filters (filter_type, pattern, is_regex, is_active) "
+        "VALUES ('word', 'spam', 0, 1)"
+    ))
+    db.session.commit()
+    assert _filters_version(db) == version + 1
+    db.session.execute(db.text("DELETE FROM content_filters WHERE pattern = 'spam'"))
+    db.session.commit()
+
+
+def test_feed_queries_use_indexes(app, db):
+    assert check_query_plans(app) == []
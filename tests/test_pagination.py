@@ -0,0 +1,72 @@
+"""Курсорная пагинация: токены курсора и обход ленты без пропусков"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.pagination import (InvalidCursor, decode_cursor, encode_cursor, feed_query,
+                            paginate_feed, parse_per_page, parse_sort)
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 250)
+    token = encode_cursor('feed', created_at, 42)
+    assert '=' not in token
+    assert decode_cursor(token, 'feed') == [created_at.isoformat(), 42]
+
+
+def test_cursor_of_another_feed():
+    token = encode_cursor('price_asc', 10.5, 7)
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token, 'feed')
+
+
+@pytest.mark.parametrize('token', ['', 'not base64!', 'e30', 'W10', '0J/RgNC40LLQtdGC'])
+def test_broken_cursor(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token, 'feed')
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, 50), ('abc', 50), ('0', 1), ('-5', 1), ('20', 20), ('1000', 100),
+])
+def test_parse_per_page(value, expected):
+    assert parse_per_page(value) == expected
+
+
+def test_parse_sort():
+    assert parse_sort('price_desc') == 'price_desc'
+    assert parse_sort('random') == 'newest'
+
+
+def _walk(sort, per_page=2):
+    ids, cursor = [], None
+    while True:
+        page = paginate_feed(feed_query(), cursor, per_page, sort)
+        ids += [card.id for card in page.items]
+        if page.next_cursor is None:
+            return ids
+        cursor = page.next_cursor
+
+
+def test_feed_pages_cover_every_listing(db, make_listing):
+    now = datetime.utcnow()
+    # Два объявления с одинаковым created_at - порядок решает id
+    ids = [make_listing(created_at=now - timedelta(minutes=minutes), price=f'{price}$')
+           for minutes, price in ((3, 30), (2, 10), (2, 50), (1, 20), (0, 40))]
+    make_listing(is_moderated=False)
+
+    assert _walk('newest') == [ids[4], ids[3], ids[2], ids[1], ids[0]]
+    assert _walk('price_asc') == [ids[1], ids[3], ids[0], ids[4], ids[2]]
+    assert _walk('price_desc', per_page=3) == [ids[2], ids[4], ids[0], ids[3], ids[1]]
+
+
+def test_new_listing_does_not_shift_pages(db, make_listing):
+    now = datetime.utcnow()
+    ids = [make_listing(created_at=now - timedelta(minutes=10 - number)) for number in range(4)]
+
+    first = paginate_feed(feed_query(), per_page=2)
+    make_listing(created_at=now)
+    second = paginate_feed(feed_query(), first.next_cursor, per_page=2)
+    assert [card.id for card in first.items] == [ids[3], ids[2]]
+    assert [card.id for card in second.items] == [ids[1], ids[0]]
+    assert second.next_cursor is None
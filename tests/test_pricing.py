@@ -0,0 +1,33 @@
+"""Разбор строки цены: сумма и валюта"""
+import pytest
+
+from app.pricing import parse_price
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('1500руб', (1500.0, 'RUB')),
+    ('1 500 руб', (1500.0, 'RUB')),
+    ('500р', (500.0, 'RUB')),
+    ('500 р.', (500.0, 'RUB')),
+    ('100грн', (100.0, 'UAH')),
+    ('20eur', (20.0, 'EUR')),
+    ('50usd', (50.0, 'USD')),
+    ('$30', (30.0, 'USD')),
+    ('от 20€', (20.0, 'EUR')),
+    ('2к грн', (2000.0, 'UAH')),
+    ('50-100$', (50.0, 'USD')),
+    ('300 бел. руб', (300.0, 'BYN')),
+    ('бесплатно', (0.0, 'USD')),
+])
+def test_parse_price(text, expected):
+    assert parse_price(text) == expected
+
+
+def test_letter_inside_word_is_not_currency():
+    # "р" в "рэп" - не рубли
+    assert parse_price('40 рэп') == (40.0, 'USD')
+
+
+def test_no_price():
+    assert parse_price('договорная') is None
+    assert parse_price('') is None
@@ -0,0 +1,85 @@
+"""Популярность с затуханием и индекс похожих объявлений"""
+import pytest
+
+from app import ranking
+from app.ranking import RankingIndex
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def index(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ranking, 'time', clock)
+    index = RankingIndex()
+    index.clock = clock
+    index.half_life = 3600
+    return index
+
+
+def test_score_decays(index):
+    index.record(1, 'views', 4)
+    index.record(2, 'contacts_clicked')
+    assert index.score(1) == pytest.approx(4.0)
+    assert index.score(2) == pytest.approx(5.0)
+    assert index.score(3) == 0.0
+
+    index.clock.now += 3600
+    assert index.score(1) == pytest.approx(2.0)
+    # Новый просмотр добавляется к затухшему счету без затухания
+    index.record(1, 'views')
+    assert index.score(1) == pytest.approx(3.0)
+
+
+def test_unknown_counter_is_ignored(index):
+    index.record(1, 'likes')
+    assert index.score(1) == 0.0
+
+
+def test_rebase_keeps_scores(index):
+    index.record(1, 'views', 8)
+    index.clock.now += 60 * index.half_life
+    index.record(2, 'views')
+    assert index._epoch == index.clock.now
+    assert index.score(2) == pytest.approx(1.0)
+    assert index.score(1) == pytest.approx(8.0 / 2 ** 60)
+
+
+def _postings(index, term):
+    return list(index._postings.get(term, ()))
+
+
+def test_reindex_does_not_duplicate_postings(index):
+    index._index_terms(1, {'genre:trap', '#dark'})
+    index._index_terms(1, {'genre:trap', '#dark'})
+    assert _postings(index, 'genre:trap') == [1]
+    assert index._term_counts['genre:trap'] == 1
+
+    # Смена тегов: старый терм уходит, новый добавляется
+    index._index_terms(1, {'genre:trap', '#melodic'})
+    assert _postings(index, '#dark') == []
+    assert '#dark' not in index._term_counts
+    assert _postings(index, '#melodic') == [1]
+
+    # Снятие с публикации убирает объявление из индекса
+    index._index_terms(1, ())
+    assert _postings(index, 'genre:trap') == []
+    assert index._term_counts == {} and index._listing_terms == {}
+
+
+def test_index_size_is_bounded(index):
+    index.warmup_listings = 2
+    for listing_id in (1, 2, 3):
+        index._index_terms(listing_id, {'genre:trap'})
+    assert list(index._listing_terms) == [2, 3]
+    assert _postings(index, 'genre:trap') == [2, 3]
+    assert index._term_counts['genre:trap'] == 2
@@ -0,0 +1,115 @@
+"""Token bucket: разбор квот, пополнение ведер, уровни пользователей"""
+import pytest
+
+from app import rate_limit
+from app.rate_limit import (MemoryBuckets, Quota, RateLimiter, SharedBuckets, TIER_BANNED,
+                            TIER_PREMIUM, TIER_USER, parse_quota)
+from app.shared_store import LocalStore
+
+
+class Clock:
+    """Подменяет time в app.rate_limit: время идет только по advance()"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, 'time', clock)
+    return clock
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('5/minute', Quota(5 / 60, 5)),
+    ('20/minutes', Quota(20 / 60, 20)),
+    ('100/10minutes', Quota(100 / 600, 100)),
+    (' 2 / second ', Quota(2.0, 2)),
+    ('1/day', Quota(1 / 86400, 1)),
+])
+def test_parse_quota(value, expected):
+    assert parse_quota(value) == expected
+
+
+@pytest.mark.parametrize('value', ['', '5', 'five/minute', '5/week', '-1/minute'])
+def test_parse_quota_invalid(value):
+    with pytest.raises(ValueError):
+        parse_quota(value)
+
+
+@pytest.mark.parametrize('make_backend', [MemoryBuckets, lambda: SharedBuckets(LocalStore())],
+                         ids=['memory', 'shared'])
+def test_bucket_burst_and_refill(clock, make_backend):
+    backend = make_backend()
+    quota = parse_quota('3/minute')
+
+    assert [backend.take('k', quota)[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = backend.take('k', quota)
+    assert not allowed
+    assert retry_after == pytest.approx(20.0)
+
+    # Другой ключ - свое ведро
+    assert backend.take('other', quota)[0]
+
+    clock.advance(20)
+    assert backend.take('k', quota) == (True, 0.0)
+    assert not backend.take('k', quota)[0]
+
+    # Ведро не наполняется выше burst
+    clock.advance(3600)
+    assert [backend.take('k', quota)[0] for _ in range(4)] == [True, True, True, False]
+
+
+def test_memory_buckets_evict_oldest(clock):
+    backend = MemoryBuckets(maxsize=2)
+    quota = parse_quota('1/hour')
+    backend.take('a', quota)
+    backend.take('b', quota)
+    backend.take('c', quota)
+    # Ведро 'a' вытеснено - ключ снова получает полный burst
+    assert backend.take('a', quota)[0]
+    assert not backend.take('c', quota)[0]
+
+
+def test_tiers(clock):
+    limiter = RateLimiter()
+    limiter.limits = {'create_listing': parse_quota('2/minute')}
+    limiter.premium_factor = 3
+
+    banned = limiter.check('create_listing', 'user:1', tier=TIER_BANNED)
+    assert not banned.allowed and banned.retry_after is None
+
+    user = [limiter.check('create_listing', 'user:2', tier=TIER_USER).allowed for _ in range(3)]
+    assert user == [True, True, False]
+
+    premium = [limiter.check('create_listing', 'user:3', tier=TIER_PREMIUM).allowed for _ in range(7)]
+    assert premium == [True] * 6 + [False]
+
+
+def test_tier_from_user_flags(db):
+    from app.models.listing import User
+    from app.rate_limit import rate_limiter
+
+    db.session.add_all([User(telegram_id=10, is_banned=True), User(telegram_id=11, is_premium=True)])
+    db.session.commit()
+
+    assert rate_limiter.tier_for(10) == TIER_BANNED
+    assert rate_limiter.tier_for(11) == TIER_PREMIUM
+    assert rate_limiter.tier_for(12) == TIER_USER
+
+    # Уровень кешируется до forget()
+    User.query.filter_by(telegram_id=10).update({'is_banned': False})
+    db.session.commit()
+    assert rate_limiter.tier_for(10) == TIER_BANNED
+    rate_limiter.forget(10)
+    assert rate_limiter.tier_for(10) == TIER_USER
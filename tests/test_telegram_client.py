@@ -0,0 +1,88 @@
+"""Клиент Bot API: токен из конфигурации и повторы только безопасных вызовов"""
+import socket
+import time
+
+import pytest
+
+from app.telegram_client import TelegramClient, TelegramError
+from benchmarks.fake_telegram import FakeBotAPI
+
+
+class CountingBotAPI(FakeBotAPI):
+    """Фейковый API, считающий вызовы каждого метода"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = {}
+
+    def handle(self, method, params):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        return super().handle(method, params)
+
+
+@pytest.fixture
+def slow_api():
+    # Отвечает дольше таймаута чтения клиента
+    api = CountingBotAPI(latency=0.3)
+    url = api.start()
+    yield api, url
+    api.stop()
+
+
+def _client(url, **kwargs):
+    return TelegramClient(token='123:test', api_url=url, read_timeout=0.1, backoff=0.01, **kwargs)
+
+
+def test_missing_token(monkeypatch):
+    monkeypatch.delenv('TELEGRAM_BOT_TOKEN', raising=False)
+    client = TelegramClient()
+    with pytest.raises(RuntimeError):
+        client.call('getMe')
+
+
+def test_send_is_not_repeated_after_read_timeout(slow_api):
+    api, url = slow_api
+    with pytest.raises(TelegramError) as error:
+        _client(url).send_message(1, 'hello', parse_mode=None)
+    assert not error.value.connect_failed
+
+    time.sleep(0.5)
+    # Запрос дошел до сервера один раз - повтор отправил бы второе сообщение
+    assert api.calls == {'sendMessage': 1}
+    assert len(api.messages) == 1
+
+
+def test_idempotent_call_is_repeated(slow_api):
+    api, url = slow_api
+    with pytest.raises(TelegramError):
+        _client(url, max_retries=2).call('deleteWebhook')
+    time.sleep(0.5)
+    assert api.calls == {'deleteWebhook': 3}
+
+
+def test_send_is_repeated_when_connection_fails():
+    # Порт, на котором никто не слушает
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    client = _client(f'http://127.0.0.1:{port}', max_retries=2)
+    attempts = []
+    post = client.session.post
+    client.session.post = lambda *args, **kwargs: attempts.append(1) or post(*args, **kwargs)
+
+    with pytest.raises(TelegramError) as error:
+        client.send_message(1, 'hello')
+    assert error.value.connect_failed
+    assert len(attempts) == 3
+
+
+def test_send_message():
+    api = FakeBotAPI()
+    url = api.start()
+    try:
+        result = _client(url).send_message(5, 'hi', parse_mode=None)
+    finally:
+        api.stop()
+    assert result['chat_id'] == 5
+    assert api.messages == [{'chat_id': 5, 'text': 'hi', 'message_id': 1}]